@@ -0,0 +1,187 @@
+"""Benchmark del visor contra el backend sintético de stub_server.py.
+
+Uso:
+    python bench/run_bench.py --vehiculos 100 --intervalo 5 --latencia 30 [--almacen] [--json salida.json]
+
+Arranca el stub en un puerto libre, apunta la aplicación a él y ejecuta
+main.py sin navegador con streamlit.testing.AppTest. Para cada escenario
+mide el tiempo de render, el pico de memoria (tracemalloc) y las
+peticiones que llegan al backend. Los escenarios "frío" empiezan con la
+caché en disco vacía; los "caliente" repiten la consulta.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, time as hora, timedelta
+from pathlib import Path
+from urllib.request import urlopen
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / "bench"))
+
+from stub_server import ConfiguracionStub, arrancar, matriculas  # noqa: E402
+
+FECHA = date(2024, 5, 1)
+
+
+def _boton(at, etiqueta):
+    return next(b for b in at.button if b.label == etiqueta)
+
+
+def _abrir(at, pagina):
+    at.sidebar.selectbox[0].set_value(pagina)
+    at.run()
+
+
+def escenario_soc(at, matricula):
+    _abrir(at, "SOC por fecha y vehículo")
+    at.text_input[0].set_value(matricula[:4]).run()
+    at.date_input[0].set_value(FECHA)
+    _boton(at, "Consultar SOC").click()
+
+
+def escenario_soc_bin(at, matricula):
+    at.number_input[0].set_value(15)
+
+
+def escenario_low_soc(at, matricula):
+    _abrir(at, "Vehículos con SOC bajo")
+    at.date_input[0].set_value(date(2024, 4, 25))
+    at.date_input[1].set_value(FECHA)
+    _boton(at, "Buscar eventos de SOC bajo").click()
+
+
+def escenario_eficiencia(at, matricula):
+    _abrir(at, "Eficiencia del vehículo")
+    at.text_input[0].set_value(matricula[:4]).run()
+    at.date_input[0].set_value(FECHA)
+    _boton(at, "Consultar eficiencia").click()
+
+
+def escenario_eficiencia_ventana(at, matricula):
+    at.slider[0].set_value((hora(8, 0), hora(12, 0)))
+
+
+def _esperar_precarga(segundos=30):
+    from utils import precarga
+
+    limite = time.monotonic() + segundos
+    while precarga.pendientes() and time.monotonic() < limite:
+        time.sleep(0.05)
+
+
+def escenario_eficiencia_dia_siguiente(at, matricula):
+    # Se da tiempo a la precarga lanzada al mostrar el día anterior
+    _esperar_precarga()
+    at.date_input[0].set_value(FECHA + timedelta(days=1))
+    _boton(at, "Consultar eficiencia").click()
+
+
+# (nombre, función de preparación, reutiliza la sesión anterior)
+ESCENARIOS = [
+    ("soc (frío)", escenario_soc, False),
+    ("soc cambio de bin", escenario_soc_bin, True),
+    ("soc (caliente)", escenario_soc, False),
+    ("low_soc 7 días (frío)", escenario_low_soc, False),
+    ("low_soc 7 días (caliente)", escenario_low_soc, False),
+    ("eficiencia (frío)", escenario_eficiencia, False),
+    ("eficiencia (caliente)", escenario_eficiencia, False),
+    ("eficiencia cambio de ventana", escenario_eficiencia_ventana, True),
+    ("eficiencia día siguiente", escenario_eficiencia_dia_siguiente, True),
+]
+
+
+def _peticiones(url_stub, ruta):
+    with urlopen(f"{url_stub}/{ruta}") as respuesta:
+        return json.load(respuesta)
+
+
+def ejecutar(args):
+    from streamlit.testing.v1 import AppTest
+
+    resultados = []
+    at = None
+    matricula = matriculas(ConfiguracionStub(args.vehiculos))[0]
+    for nombre, preparar, misma_sesion in ESCENARIOS:
+        if not misma_sesion:
+            at = AppTest.from_file(str(RAIZ / "main.py"), default_timeout=args.timeout)
+            at.run()
+        preparar(at, matricula)
+
+        _peticiones(args.url_stub, "__reset")
+        tracemalloc.start()
+        inicio = time.perf_counter()
+        at.run()
+        segundos = time.perf_counter() - inicio
+        _, pico = tracemalloc.get_traced_memory()
+        # Parar tracemalloc con hilos de precarga reservando memoria puede tumbar el intérprete
+        _esperar_precarga()
+        tracemalloc.stop()
+        peticiones = _peticiones(args.url_stub, "__stats")
+
+        errores = [str(e.value) for e in at.exception] + [e.value for e in at.error]
+        resultados.append({
+            "escenario": nombre,
+            "ms": round(segundos * 1000, 1),
+            "pico_mb": round(pico / 1024 / 1024, 1),
+            "peticiones": sum(peticiones.values()),
+            "detalle_peticiones": peticiones,
+            "errores": errores,
+        })
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del visor con un backend sintético")
+    parser.add_argument("--vehiculos", type=int, default=50)
+    parser.add_argument("--intervalo", type=int, default=10, help="segundos entre muestras de telemetría")
+    parser.add_argument("--latencia", type=float, default=20.0, help="latencia añadida por petición (ms)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="tiempo máximo por render (s)")
+    parser.add_argument("--almacen", action="store_true", help="ingestar antes los días del benchmark en el almacén local")
+    parser.add_argument("--json", help="guardar los resultados en este fichero")
+    args = parser.parse_args()
+
+    servidor = arrancar(ConfiguracionStub(args.vehiculos, args.intervalo, args.latencia / 1000))
+    args.url_stub = f"http://127.0.0.1:{servidor.server_port}"
+
+    # La aplicación lee la configuración del entorno al importar sus módulos
+    cache = tempfile.mkdtemp(prefix="bench-cache-")
+    os.environ["PLANNERSTATS_URL"] = f"{args.url_stub}/plannerstats"
+    os.environ["TELEMETRIA_CACHE_DIR"] = cache
+    os.environ["RENDIMIENTO_LOG"] = ""
+    os.environ["ALMACEN_DIR"] = os.path.join(cache, "almacen")
+    os.chdir(RAIZ)
+
+    if args.almacen:
+        # Los días del benchmark se sirven desde el almacén local, como tras la ingesta nocturna
+        import ingesta
+
+        dia = date(2024, 4, 25)
+        while dia <= FECHA + timedelta(days=1):
+            ingesta.ingestar_dia(dia, "bench")
+            dia += timedelta(days=1)
+
+    resultados = ejecutar(args)
+    servidor.shutdown()
+
+    print(f"{'escenario':<28}{'ms':>10}{'pico MB':>10}{'peticiones':>12}")
+    for r in resultados:
+        print(f"{r['escenario']:<28}{r['ms']:>10}{r['pico_mb']:>10}{r['peticiones']:>12}")
+        for error in r["errores"]:
+            print(f"    error: {error}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+    if any(r["errores"] for r in resultados):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
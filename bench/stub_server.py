@@ -0,0 +1,243 @@
+"""Servidor local que imita el backend de plannerstats con datos sintéticos.
+
+Uso:
+    python bench/stub_server.py --puerto 3000 --vehiculos 200 --intervalo 5 --latencia 50
+
+Implementa los endpoints que usa el visor y genera datos deterministas
+por (matrícula, fecha). GET /__stats devuelve las peticiones atendidas
+por endpoint y GET /__reset pone los contadores a cero.
+"""
+
+import argparse
+import gzip
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+
+try:
+    import orjson
+
+    def _dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj).encode()
+
+PREFIJO = "/plannerstats"
+
+
+class ConfiguracionStub:
+    def __init__(self, vehiculos=50, intervalo=10, latencia=0.0, umbral_soc=20):
+        self.vehiculos = vehiculos      # tamaño de la flota
+        self.intervalo = intervalo      # segundos entre muestras de telemetría
+        self.latencia = latencia        # latencia añadida a cada respuesta (s)
+        self.umbral_soc = umbral_soc
+
+
+def matriculas(config):
+    letras = "BCDFGHJKLMNPRSTVWXYZ"
+    return [
+        f"{i:04d} {letras[i % 20]}{letras[(i // 20) % 20]}{letras[(i // 400) % 20]}"
+        for i in range(1, config.vehiculos + 1)
+    ]
+
+
+def _rng(matricula, fecha):
+    return np.random.default_rng(zlib.crc32(f"{matricula}|{fecha}".encode()))
+
+
+def _iso(instantes):
+    return [
+        datetime.fromtimestamp(t, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        for t in instantes.tolist()
+    ]
+
+
+def serie_dia(config, matricula, fecha):
+    """Telemetría de un día: el bus circula de 6 a 22 h y carga de noche"""
+    rng = _rng(matricula, fecha)
+    inicio = datetime.combine(fecha, datetime.min.time(), tzinfo=timezone.utc).timestamp()
+    t = np.arange(0, 86400, config.intervalo, dtype=np.int64)
+    hora = t / 3600
+    circulando = (hora >= 6) & (hora < 22)
+
+    velocidad = np.where(circulando, np.clip(rng.normal(25, 12, len(t)), 0, 70), 0.0)
+    km = np.cumsum(velocidad * config.intervalo / 3600)
+    consumo_rt = np.where(circulando, np.clip(rng.normal(110, 25, len(t)), 20, 250), 0.0)
+    soc_inicial = rng.uniform(85, 100)
+    descarga = rng.uniform(55, 90)
+    soc = np.where(
+        hora < 6, soc_inicial,
+        np.where(circulando, soc_inicial - descarga * (hora - 6) / 16, soc_inicial - descarga + (hora - 22) * 20),
+    )
+    soc = np.clip(soc + rng.normal(0, 0.3, len(t)), 0, 100)
+
+    return {
+        "t": inicio + t,
+        "velocidad": velocidad,
+        "mileage": rng.uniform(10000, 400000) + km,
+        "consumo_rt": consumo_rt,
+        "consumo_ave": np.cumsum(consumo_rt) / np.arange(1, len(t) + 1),
+        "soc": soc,
+        "exterior": 15 + 8 * np.sin((hora - 9) / 24 * 2 * np.pi) + rng.normal(0, 0.5, len(t)),
+        "interior": 21 + rng.normal(0, 0.4, len(t)),
+        "circulando": circulando,
+    }
+
+
+def eficiencia(config, matricula, fecha, desde=None):
+    s = serie_dia(config, matricula, fecha)
+    if desde is not None:
+        posteriores = s["t"] > desde.timestamp()
+        s = {k: v[posteriores] for k, v in s.items()}
+    return [
+        {
+            "evTime": ev, "mileage": round(m, 3), "soc": round(soc, 1), "speed": round(v, 1),
+            "energyConsumption": {"ave": round(ave, 2), "rt": round(rt, 2)},
+            "outsideTemp": round(ext, 1), "insideTemp": round(inte, 1),
+        }
+        for ev, m, soc, v, ave, rt, ext, inte in zip(
+            _iso(s["t"]), s["mileage"].tolist(), s["soc"].tolist(), s["velocidad"].tolist(),
+            s["consumo_ave"].tolist(), s["consumo_rt"].tolist(), s["exterior"].tolist(), s["interior"].tolist(),
+        )
+    ]
+
+
+def socbin(config, matricula, fecha, minutos):
+    s = serie_dia(config, matricula, fecha)
+    cubeta = ((s["t"] - s["t"][0]) // (minutos * 60)).astype(np.int64)
+    salida = []
+    for c in np.unique(cubeta):
+        valores = s["soc"][cubeta == c]
+        salida.append({
+            "_id": {"interval": _iso(np.array([s["t"][0] + c * minutos * 60]))[0]},
+            "minSOC": round(float(valores.min()), 1), "avgSOC": round(float(valores.mean()), 1),
+            "maxSOC": round(float(valores.max()), 1), "count": int(len(valores)),
+        })
+    return salida
+
+
+def estado(config, matricula, fecha):
+    s = serie_dia(config, matricula, fecha)
+    cargando = ~s["circulando"] & (s["t"] % 86400 >= 22 * 3600)
+    ev = np.where(s["circulando"], np.where(s["velocidad"] > 0, "Driving", "Parking"), np.where(cargando, "Charging", "Parking"))
+    carga = np.where(cargando, np.where(s["soc"] > 99, "Complete", "Charging"), "Not in Charging")
+    gb = np.where(s["circulando"], "Start", "Stop")
+    return [
+        {"evTime": t, "gbStatus": g, "gbCharge": c, "evStatus": e}
+        for t, g, c, e in zip(_iso(s["t"]), gb.tolist(), carga.tolist(), ev.tolist())
+    ]
+
+
+def maxdia(config, fecha):
+    return {"maxDistance": 450.0, "maxEnergyConsumptionAve": 160.0}
+
+
+def low_soc(config, inicio, fin):
+    salida = []
+    dia = inicio
+    while dia <= fin:
+        for matricula in matriculas(config):
+            # Solo el mínimo diario, como el backend real, calculado sobre la misma serie que vehiculoiot-eficiencia
+            minimo = float(serie_dia(config, matricula, dia)["soc"].min())
+            if minimo < config.umbral_soc:
+                salida.append({"fecha": dia.strftime("%Y-%m-%d"), "matricula": matricula, "minSoc": round(max(minimo, 0), 1)})
+        dia += timedelta(days=1)
+    return salida
+
+
+class ManejadorStub(BaseHTTPRequestHandler):
+    config = ConfiguracionStub()
+    contadores = Counter()
+    lock = threading.Lock()
+
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado_http, cuerpo):
+        datos = _dumps(cuerpo)
+        self.send_response(estado_http)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            datos = gzip.compress(datos, compresslevel=1)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/__stats":
+            with self.lock:
+                return self._responder(200, dict(self.contadores))
+        if url.path == "/__reset":
+            with self.lock:
+                self.contadores.clear()
+            return self._responder(200, {})
+
+        endpoint = url.path[len(PREFIJO) + 1:] if url.path.startswith(PREFIJO + "/") else url.path
+        with self.lock:
+            self.contadores[endpoint] += 1
+        if self.config.latencia:
+            time.sleep(self.config.latencia)
+
+        fecha = date.fromisoformat(params["fecha"]) if "fecha" in params else None
+        matricula = params.get("matricula")
+
+        if endpoint == "vehiculos":
+            cuerpo = [{"matricula": m, "operador": f"Operador {i % 3 + 1}", "modelo": "Irizar ie bus" if i % 2 else "BYD K9"}
+                      for i, m in enumerate(matriculas(self.config))]
+        elif endpoint == "BI/vehiculoiot-eficiencia":
+            desde = datetime.fromisoformat(params["desde"]) if "desde" in params else None
+            cuerpo = eficiencia(self.config, matricula, fecha, desde)
+        elif endpoint == "BI/vehiculoiot-socbin":
+            cuerpo = socbin(self.config, matricula, fecha, int(params.get("bin", 5)))
+        elif endpoint == "BI/vehiculoiot-status":
+            cuerpo = estado(self.config, matricula, fecha)
+        elif endpoint == "BI/vehiculoiot-maxdia":
+            cuerpo = maxdia(self.config, fecha)
+        elif endpoint == "BI/vehiculoiot-low-soc":
+            cuerpo = low_soc(self.config, date.fromisoformat(params["fechaInicio"]), date.fromisoformat(params["fechaFin"]))
+            if not cuerpo:
+                return self._responder(404, {"message": "Sin vehículos con SOC bajo"})
+        else:
+            return self._responder(404, {"message": f"Endpoint desconocido: {endpoint}"})
+        self._responder(200, cuerpo)
+
+
+def arrancar(config, puerto=0):
+    """Arrancar el servidor en un hilo y devolverlo (puerto 0 = libre)"""
+    ManejadorStub.config = config
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), ManejadorStub)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend plannerstats sintético para pruebas de rendimiento")
+    parser.add_argument("--puerto", type=int, default=3000)
+    parser.add_argument("--vehiculos", type=int, default=50, help="tamaño de la flota")
+    parser.add_argument("--intervalo", type=int, default=10, help="segundos entre muestras de telemetría")
+    parser.add_argument("--latencia", type=float, default=0.0, help="latencia añadida por petición (ms)")
+    args = parser.parse_args()
+
+    config = ConfiguracionStub(args.vehiculos, args.intervalo, args.latencia / 1000)
+    servidor = arrancar(config, args.puerto)
+    print(f"Stub de plannerstats en http://127.0.0.1:{servidor.server_port}{PREFIJO}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
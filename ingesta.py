@@ -0,0 +1,116 @@
+"""Ingesta nocturna de la telemetría de la flota en el almacén local.
+
+Uso:
+    python ingesta.py                                   # el día de ayer
+    python ingesta.py --fecha 2024-05-01
+    python ingesta.py --desde 2024-04-01 --hasta 2024-04-30 [--forzar]
+
+Descarga de plannerstats la telemetría de eficiencia y de estado de todos
+los vehículos y los máximos del día, y la guarda en Parquet particionado
+por fecha y vehículo (ALMACEN_DIR). Las vistas consultan ese almacén en
+lugar del backend para los días ya ingestados. La clave de la API se lee
+de PLANNERSTATS_API_KEY o de --api-key.
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+import pandas as pd
+import requests
+from utils import almacen
+from utils.api_client import api_get_json, api_get_registros
+from utils.concurrencia import ejecutar_lote
+from utils.normalizacion import normalizar_eficiencia, normalizar_estado
+
+# Vehículos que se descargan a la vez durante la ingesta
+INGESTA_MAX_HILOS = int(os.environ.get("INGESTA_MAX_HILOS", "4"))
+
+NORMALIZADORES = {
+    "eficiencia": normalizar_eficiencia,
+    "estado": normalizar_estado,
+}
+
+
+def ingestar_vehiculo(matricula, fecha, api_key, forzar=False):
+    """Descargar y guardar las tablas de un vehículo; devuelve las filas guardadas"""
+    filas = 0
+    for tabla, endpoint in almacen.TABLAS.items():
+        ruta = almacen.ruta_particion(tabla, fecha, matricula)
+        if ruta.exists() and not forzar:
+            continue
+        params = {"fecha": fecha.strftime("%Y-%m-%d"), "matricula": matricula}
+        df = NORMALIZADORES[tabla](api_get_registros(endpoint, api_key, params=params))
+        if df.empty:
+            continue
+        df.insert(0, "matricula", matricula)
+        almacen.escribir(tabla, fecha, df, matricula)
+        filas += len(df)
+    return filas
+
+
+def ingestar_dia(fecha, api_key, max_hilos=INGESTA_MAX_HILOS, forzar=False):
+    """Ingestar un día completo y registrar el resultado; devuelve los errores"""
+    inicio = time.perf_counter()
+    matriculas = [veh["matricula"] for veh in api_get_json("vehiculos", api_key)]
+
+    errores = []
+    filas = 0
+    lote = ejecutar_lote(lambda matricula: ingestar_vehiculo(matricula, fecha, api_key, forzar), matriculas, max_hilos)
+    for matricula, resultado, error in lote:
+        if error is not None:
+            errores.append({"matricula": matricula, "error": str(error)})
+        else:
+            filas += resultado
+
+    try:
+        maximos = api_get_json("BI/vehiculoiot-maxdia", api_key, params={"fecha": fecha.strftime("%Y-%m-%d")})
+        almacen.escribir("maximos", fecha, pd.DataFrame([maximos]))
+    except requests.exceptions.RequestException as e:
+        errores.append({"matricula": None, "error": f"maxdia: {e}"})
+
+    almacen.registrar_ingesta(fecha, len(matriculas), errores)
+    print(f"{fecha}: {len(matriculas)} vehículos, {filas} filas, {len(errores)} errores "
+          f"en {time.perf_counter() - inicio:.1f} s")
+    for error in errores:
+        print(f"    {error['matricula'] or '-'}: {error['error']}")
+    return errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingesta de la telemetría de la flota en el almacén local")
+    parser.add_argument("--fecha", type=date.fromisoformat, help="día a ingestar (por defecto, ayer)")
+    parser.add_argument("--desde", type=date.fromisoformat, help="primer día de un rango")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="último día de un rango")
+    parser.add_argument("--api-key", default=os.environ.get("PLANNERSTATS_API_KEY"))
+    parser.add_argument("--max-hilos", type=int, default=INGESTA_MAX_HILOS)
+    parser.add_argument("--forzar", action="store_true", help="volver a descargar lo ya ingestado")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("falta la clave de la API (--api-key o PLANNERSTATS_API_KEY)")
+
+    ayer = date.today() - timedelta(days=1)
+    desde = args.desde or args.fecha or ayer
+    hasta = args.hasta or args.fecha or desde
+    if hasta >= date.today():
+        parser.error("solo se pueden ingestar días ya terminados")
+
+    con_errores = 0
+    dia = desde
+    while dia <= hasta:
+        try:
+            if ingestar_dia(dia, args.api_key, args.max_hilos, args.forzar):
+                con_errores += 1
+        except requests.exceptions.RequestException as e:
+            print(f"{dia}: no se pudo obtener la flota: {e}")
+            con_errores += 1
+        dia += timedelta(days=1)
+
+    if con_errores:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,57 @@
+import importlib
 import streamlit as st
 from datetime import datetime, timedelta
-from utils.soc_utils import show_soc_analysis
-from utils.soc_low import show_low_soc_view
-from utils.eficiencia_utils import show_eficiencia_vehiculo
+from utils.flota import invalidar_flota
+from utils.rendimiento import finalizar_render, iniciar_render, medir, mostrar_panel
+from utils.resiliencia import PRESUPUESTO_RANGOS, PRESUPUESTO_VISTA, mostrar_obsoletos, presupuesto
 
 st.set_page_config("Análisis Vehículos Eléctricos", layout="wide")
 
+# Estudios disponibles: título -> (módulo, función que dibuja la página).
+# El módulo solo se importa cuando se abre la página por primera vez.
+PAGINAS = {
+    "Vehículos con SOC bajo": ("utils.soc_low", "show_low_soc_view"),
+    "SOC por fecha y vehículo": ("utils.soc_utils", "show_soc_analysis"),
+    "Eficiencia del vehículo": ("utils.eficiencia_utils", "show_eficiencia_vehiculo"),
+    "Ranking de eficiencia de la flota": ("utils.ranking_flota", "show_ranking_flota"),
+
+    # "Consumo energético": ("utils.consumo_utils", "show_consumo_energetico"),
+    # "Temperaturas": ("utils.temperaturas_utils", "show_temperaturas"),
+    # "Eventos de carga": ("utils.carga_utils", "show_eventos_carga"),
+    # etc.
+}
+
+# Segundos que cada página espera como mucho al backend; las que recorren rangos o la flota, más
+PRESUPUESTOS = {
+    "utils.soc_low": PRESUPUESTO_RANGOS,
+    "utils.ranking_flota": PRESUPUESTO_RANGOS,
+}
+
+def cargar_pagina(titulo):
+    """Importar el módulo de una página y devolver su función"""
+    modulo, funcion = PAGINAS[titulo]
+    with medir(f"importar {modulo}"):
+        return getattr(importlib.import_module(modulo), funcion)
+
 def main():
     st.sidebar.title("🔧 Panel de control")
-    page = st.sidebar.selectbox(
-        "Selecciona un estudio",
-        [
-            "Inicio",
-            "Vehículos con SOC bajo (<20%)",
-            "SOC por fecha y vehículo",
-            "Eficiencia del vehículo",
-
-            # "Consumo energético",
-            # "Temperaturas",
-            # "Eventos de carga",
-            # etc.
-        ]
-    )
+    page = st.sidebar.selectbox("Selecciona un estudio", ["Inicio", *PAGINAS])
+
+    if st.sidebar.button("🔄 Recargar lista de vehículos"):
+        invalidar_flota()
 
+    mostrar_rendimiento = st.sidebar.toggle("Mostrar rendimiento")
+    render = iniciar_render(page)
+    try:
+        mostrar_pagina(page)
+    finally:
+        render = finalizar_render(render)
+
+    if mostrar_rendimiento:
+        mostrar_panel(render)
+
+def mostrar_pagina(page):
+    """Mostrar el estudio seleccionado en el menú lateral"""
     # Definir la fecha de ayer como valor por defecto
     ayer = datetime.now() - timedelta(days=1)
     fecha_default = ayer.date()
@@ -32,15 +61,17 @@ def main():
         st.title("🚍 Análisis de Vehículos Eléctricos")
         st.write("Selecciona una opción en el menú lateral para comenzar.")
         st.info("Este visor permite analizar la eficiencia de carga y uso de los vehículos eléctricos.")
-
-    elif page == "SOC por fecha y vehículo":
-        show_soc_analysis(fecha_default, api_key)
-
-    elif page == "Vehículos con SOC bajo (<20%)":
-        show_low_soc_view(fecha_default, api_key)
-
-    elif page == "Eficiencia del vehículo":
-        show_eficiencia_vehiculo(fecha_default, api_key)       
+    else:
+        # El aviso de datos caducados va arriba aunque se sepa al terminar la página
+        aviso = st.empty()
+        modulo = PAGINAS[page][0]
+        segundos = PRESUPUESTOS.get(modulo, PRESUPUESTO_VISTA)
+        # El modo tendencia de la eficiencia recorre semanas de días: tiene el margen de las vistas de rangos
+        if modulo == "utils.eficiencia_utils" and st.session_state.get("eficiencia_modo") == "Tendencia":
+            segundos = PRESUPUESTO_RANGOS
+        with presupuesto(segundos):
+            cargar_pagina(page)(fecha_default, api_key)
+            mostrar_obsoletos(aviso)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,51 @@
+from utils.busqueda import buscar, construir_indice, normalizar
+
+VEHICULOS = [
+    {"matricula": "1234-ABC", "modelo": "BYD K9", "bastidor": "V1"},
+    {"matricula": "1234-ABD", "modelo": "Irizar ie bus", "bastidor": "V2"},
+    {"matricula": "9123-ABC", "modelo": "BYD K9", "bastidor": "V3"},
+    {"matricula": "5678 XYZ", "modelo": "Irizar ie bus", "bastidor": "V4"},
+    {"matricula": "ABC", "modelo": "BYD K9", "bastidor": "V5"},
+]
+
+
+def test_normalizar_ignora_separadores_y_acentos():
+    assert normalizar("1234-ábc") == normalizar("1234 ABC") == "1234abc"
+
+
+def test_orden_exacta_prefijo_resto():
+    indice = construir_indice(VEHICULOS)
+    matriculas, total = buscar(indice, "abc")
+    assert total == 3
+    assert matriculas == ["ABC", "1234-ABC", "9123-ABC"]
+
+    matriculas, total = buscar(indice, "1234")
+    assert matriculas == ["1234-ABC", "1234-ABD"]
+
+
+def test_consultas_cortas_y_largas():
+    indice = construir_indice(VEHICULOS)
+    # Un carácter: la lista del n-grama es exacta
+    assert buscar(indice, "9")[0] == ["9123-ABC"]
+    # Más de N_GRAMA caracteres: los n-gramas 234 y 34a coinciden, pero "2349" no aparece
+    assert buscar(indice, "2349") == ([], 0)
+    assert buscar(indice, "234abd") == (["1234-ABD"], 1)
+
+
+def test_filtros_y_limite():
+    indice = construir_indice(VEHICULOS)
+    assert buscar(indice, "", {"modelo": ["Irizar ie bus"]}) == (["1234-ABD", "5678 XYZ"], 2)
+    assert buscar(indice, "abc", {"modelo": ["Irizar ie bus"]}) == ([], 0)
+    assert buscar(indice, "", limite=2) == (["1234-ABC", "1234-ABD"], 5)
+
+
+def test_atributos_unicos_por_vehiculo_no_son_filtro():
+    indice = construir_indice(VEHICULOS)
+    assert list(indice["filtros"]) == ["modelo"]
+
+
+def test_indice_vacio_y_un_vehiculo():
+    assert buscar(construir_indice([]), "abc") == ([], 0)
+    indice = construir_indice(VEHICULOS[:1])
+    assert indice["filtros"] == {}
+    assert buscar(indice, "") == (["1234-ABC"], 1)
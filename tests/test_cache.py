@@ -0,0 +1,32 @@
+import threading
+import time
+import pytest
+from utils.cache import CacheTTL
+
+
+def test_carga_una_vez_por_clave_y_libera_los_locks():
+    cache = CacheTTL(60)
+    cargas = []
+
+    def cargar(clave):
+        cargas.append(clave)
+        time.sleep(0.05)
+        return clave
+
+    hilos = [threading.Thread(target=cache.get_or_load, args=(i % 3, lambda i=i: cargar(i % 3))) for i in range(12)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(cargas) == [0, 1, 2]
+    assert cache._locks_carga == {}
+
+
+def test_locks_de_carga_no_crecen_con_las_claves():
+    cache = CacheTTL(60, max_entradas=5)
+    for i in range(100):
+        cache.get_or_load(i, lambda: "valor")
+    with pytest.raises(ZeroDivisionError):
+        cache.get_or_load("falla", lambda: 1 / 0)
+    assert len(cache._datos) == 5
+    assert cache._locks_carga == {}
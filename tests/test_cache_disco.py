@@ -0,0 +1,57 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+import pandas as pd
+import pytest
+from utils import cache_disco, telemetria
+
+ENDPOINT = "BI/vehiculoiot-eficiencia"
+AYER = date.today() - timedelta(days=1)
+MEDIANOCHE = datetime.combine(date.today(), datetime.min.time())
+
+
+@pytest.fixture(autouse=True)
+def directorio(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_disco, "CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def _guardar(fecha, escrito):
+    """Guardar un día y fechar el fichero como escrito en ese instante"""
+    cache_disco.guardar(ENDPOINT, "0001 CBB", fecha, pd.DataFrame({"soc": [50.0]}))
+    ruta = cache_disco.ruta_cache(ENDPOINT, "0001 CBB", fecha)
+    os.utime(ruta, (escrito.timestamp(), escrito.timestamp()))
+
+
+def test_dia_terminado_escrito_despues_es_definitivo():
+    _guardar(AYER, MEDIANOCHE + timedelta(hours=1))
+    _guardar(AYER - timedelta(days=1), MEDIANOCHE)
+    assert cache_disco.leer(ENDPOINT, "0001 CBB", AYER) is not None
+    assert cache_disco.leer(ENDPOINT, "0001 CBB", AYER - timedelta(days=1)) is not None
+
+
+def test_dia_escrito_mientras_estaba_en_curso_caduca():
+    # Escrito a las 10:00 del propio día: los datos de la tarde no están
+    _guardar(AYER, datetime.combine(AYER, datetime.min.time()) + timedelta(hours=10))
+    assert not cache_disco.es_definitivo(AYER, cache_disco.ruta_cache(ENDPOINT, "0001 CBB", AYER).stat().st_mtime)
+    assert cache_disco.leer(ENDPOINT, "0001 CBB", AYER) is None
+    assert cache_disco.leer_obsoleto(ENDPOINT, "0001 CBB", AYER) is not None
+
+
+def test_dia_en_curso_usa_el_ttl():
+    hoy = date.today()
+    _guardar(hoy, datetime.now())
+    assert cache_disco.leer(ENDPOINT, "0001 CBB", hoy) is not None
+    _guardar(hoy, datetime.now() - timedelta(seconds=cache_disco.TTL_HOY + 1))
+    assert cache_disco.leer(ENDPOINT, "0001 CBB", hoy) is None
+
+
+def test_copia_parcial_de_un_dia_terminado_se_vuelve_a_descargar(monkeypatch):
+    # Escrito justo antes de medianoche: reciente, pero parcial
+    _guardar(AYER, MEDIANOCHE - timedelta(minutes=1))
+    ahora = (MEDIANOCHE + timedelta(minutes=5)).timestamp()
+    monkeypatch.setattr(time, "time", lambda: ahora)
+    monkeypatch.setattr(telemetria.almacen, "ENDPOINTS", {})
+    monkeypatch.setattr(telemetria, "_descargar", lambda *args: pd.DataFrame({"soc": [10.0, 20.0]}))
+    df = telemetria.obtener_telemetria(ENDPOINT, "0001 CBB", AYER, "clave", None)
+    assert len(df) == 2
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.graficos import acumular_series, figura_series, indices_min_max, submuestrear
+
+
+def test_serie_corta_se_devuelve_entera_sin_nulos():
+    assert list(indices_min_max([1, np.nan, 3], 10)) == [0, 2]
+
+
+def test_conserva_los_picos_de_cada_cubeta():
+    y = np.sin(np.arange(10001) / 50)
+    y[777], y[4321] = -9, 9
+    indices = indices_min_max(y, 100)
+    assert len(indices) <= 100
+    assert (np.diff(indices) > 0).all()
+    assert {777, 4321} <= set(indices)
+    assert y[indices].min() == -9 and y[indices].max() == 9
+
+
+def test_cubetas_de_una_serie_creciente():
+    # Cada cubeta conserva su primer punto (mínimo) y su último (máximo)
+    assert list(indices_min_max(np.arange(10.0), 4)) == [0, 4, 5, 9]
+
+
+@pytest.mark.parametrize("y, esperado", [
+    ([], []),
+    ([5.0], [0]),
+    ([np.nan] * 5, []),
+])
+def test_series_vacias_y_de_una_muestra(y, esperado):
+    assert list(indices_min_max(y, 2)) == esperado
+
+
+def test_submuestrear_columna_con_nulos():
+    df = pd.DataFrame({"t": range(5), "v": pd.array([1, None, 3, 4, 5], dtype="Float32")})
+    xs, ys = submuestrear(df, "t", "v", 10)
+    assert list(xs) == [0, 2, 3, 4]
+    assert list(ys) == [1, 3, 4, 5]
+
+
+def test_figura_sin_muestras():
+    df = pd.DataFrame({"t": pd.Series(dtype="datetime64[ns]"), "v": pd.Series(dtype="float32")})
+    fig = figura_series(df, "t", [("v", "SOC")])
+    assert len(fig.data) == 1
+    assert len(fig.data[0].x) == 0
+
+
+def test_acumular_series_por_tramos_conserva_los_extremos():
+    y = np.sin(np.arange(20000) / 50)
+    y[123], y[15000] = -9, 9
+    df = pd.DataFrame({"t": np.arange(20000), "v": y})
+    puntos = None
+    for inicio in range(0, 20000, 700):
+        puntos = acumular_series(puntos, df.iloc[inicio:inicio + 700], "t", [("v", "V")], 100)
+    xs, ys = puntos[0]
+    assert len(ys) <= 200
+    assert xs.is_monotonic_increasing
+    assert ys.min() == -9 and ys.max() == 9
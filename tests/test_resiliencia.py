@@ -0,0 +1,94 @@
+import time
+from concurrent.futures import Future
+import pytest
+from utils import resiliencia
+from utils.resiliencia import Circuito, CircuitoAbierto, PresupuestoAgotado, esperar, presupuesto, restante
+
+
+class _Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def monotonic(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = _Reloj()
+    monkeypatch.setattr(resiliencia, "time", reloj)
+    return reloj
+
+
+def test_se_abre_tras_los_fallos_seguidos(reloj):
+    circuito = Circuito("prueba", fallos=2, espera=30)
+    circuito.permitir()
+    circuito.fallo()
+    assert circuito.estado() == "cerrado"
+    circuito.permitir()
+    circuito.fallo()
+    assert circuito.estado() == "abierto"
+    with pytest.raises(CircuitoAbierto):
+        circuito.permitir()
+
+
+def test_un_exito_reinicia_la_cuenta(reloj):
+    circuito = Circuito("prueba", fallos=2, espera=30)
+    circuito.fallo()
+    circuito.exito()
+    circuito.fallo()
+    assert circuito.estado() == "cerrado"
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba(reloj):
+    circuito = Circuito("prueba", fallos=1, espera=30)
+    circuito.fallo()
+    reloj.ahora += 30
+    assert circuito.estado() == "semiabierto"
+    circuito.permitir()
+    with pytest.raises(CircuitoAbierto):
+        circuito.permitir()
+
+    # La prueba va bien: se cierra
+    circuito.exito()
+    assert circuito.estado() == "cerrado"
+    circuito.permitir()
+
+
+def test_prueba_fallida_vuelve_a_abrir(reloj):
+    circuito = Circuito("prueba", fallos=1, espera=30)
+    circuito.fallo()
+    reloj.ahora += 30
+    circuito.permitir()
+    circuito.fallo()
+    assert circuito.estado() == "abierto"
+    reloj.ahora += 29
+    with pytest.raises(CircuitoAbierto):
+        circuito.permitir()
+
+
+def test_prueba_descartada_no_cierra_ni_abre(reloj):
+    circuito = Circuito("prueba", fallos=1, espera=30)
+    circuito.fallo()
+    reloj.ahora += 30
+    circuito.permitir()
+    circuito.descartar()
+    # Sigue semiabierto y la siguiente petición puede hacer de prueba
+    assert circuito.estado() == "semiabierto"
+    circuito.permitir()
+
+
+def test_presupuesto_anidado_no_amplia_el_exterior():
+    assert restante() is None
+    with presupuesto(1):
+        with presupuesto(60):
+            assert restante() <= 1
+    assert restante() is None
+
+
+def test_esperar_sin_resultado_agota_el_presupuesto():
+    with presupuesto(0.05):
+        inicio = time.monotonic()
+        with pytest.raises(PresupuestoAgotado):
+            esperar(Future())
+    assert time.monotonic() - inicio < 1
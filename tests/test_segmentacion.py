@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+from utils.segmentacion import COLUMNAS_SEGMENTO, resumen_segmentos, segmentar
+
+# Conducción 3 min, parada de 2 min, conducción 2 min y parada de 8 min en la que sube el SOC
+VELOCIDAD = [30, 30, 30, 0, 0, 30, 30, 0, 0, 0, 0, 0, 0, 0, 0]
+KM = [0, 1, 2, 2, 2, 3, 4, 4, 4, 4, 4, 4, 4, 4, 4]
+SOC = [80, 79, 78, 78, 78, 77, 76, 76, 80, 84, 88, 92, 96, 96, 96]
+
+
+def _serie(velocidad, km, soc, matricula="0001 CBB", inicio="2024-05-01 10:00"):
+    return pd.DataFrame({
+        "matricula": matricula,
+        "evTime": pd.date_range(inicio, periods=len(velocidad), freq="1min", tz="UTC"),
+        "mileage": km,
+        "soc": soc,
+        "speed": velocidad,
+        "energyConsumption_rt": 100.0,
+    })
+
+
+def test_parada_corta_forma_parte_del_trayecto():
+    segmentos = segmentar(_serie(VELOCIDAD, KM, SOC))
+    assert list(segmentos["tipo"]) == ["conducción", "carga"]
+    trayecto = segmentos.iloc[0]
+    assert trayecto["muestras"] == 7
+    assert trayecto["distancia_km"] == 4
+    assert trayecto["kwh_100km"] == 100
+    assert trayecto["energia_kwh"] == 4
+    # El trayecto acaba donde empieza la carga
+    assert trayecto["fin"] == segmentos.iloc[1]["inicio"] == pd.Timestamp("2024-05-01 10:07", tz="UTC")
+    assert segmentos.iloc[1]["delta_soc"] == 20
+
+
+def test_parada_larga_corta_el_trayecto():
+    segmentos = segmentar(_serie(VELOCIDAD, KM, SOC), parada_min=60)
+    assert list(segmentos["tipo"]) == ["conducción", "parado", "conducción", "carga"]
+    assert segmentos["distancia_km"].sum() == 4
+
+
+def test_ev_status_marca_las_cargas():
+    estado = pd.DataFrame({
+        "matricula": "0001 CBB",
+        "evTime": pd.to_datetime(["2024-05-01 10:00", "2024-05-01 10:07", "2024-05-01 10:10"], utc=True),
+        "evStatus": ["Driving", "Charging", "Idle"],
+    })
+    segmentos = segmentar(_serie(VELOCIDAD, KM, SOC), estado)
+    assert list(segmentos["tipo"]) == ["conducción", "carga", "parado"]
+    assert list(segmentos["muestras"]) == [7, 3, 5]
+
+
+def test_varios_vehiculos_no_se_mezclan():
+    df = pd.concat([_serie([30, 30], [0, 1], [50, 49]), _serie([0, 0], [7, 7], [50, 60], matricula="0002 DBB")])
+    segmentos = segmentar(df)
+    assert list(segmentos["matricula"]) == ["0001 CBB", "0002 DBB"]
+    assert list(segmentos["tipo"]) == ["conducción", "carga"]
+    # El kilometraje del segundo vehículo no cuenta como distancia del primero
+    assert list(segmentos["distancia_km"]) == [1, 0]
+
+
+def test_una_sola_muestra():
+    segmentos = segmentar(_serie([0], [5], [50]))
+    assert len(segmentos) == 1
+    assert segmentos.iloc[0]["tipo"] == "parado"
+    assert segmentos.iloc[0]["duracion"] == pd.Timedelta(0)
+
+
+@pytest.mark.parametrize("df", [
+    _serie([], [], []),
+    _serie([0, 0], [1, 1], [50, 50]).assign(evTime=pd.NaT),
+])
+def test_sin_muestras_mantiene_columnas_y_tipos(df):
+    segmentos = segmentar(df)
+    assert segmentos.empty
+    assert list(segmentos.columns) == COLUMNAS_SEGMENTO
+    assert resumen_segmentos(segmentos).empty
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.soc_bins import NIVELES_PIRAMIDE, actualizar_piramide, bins_soc, construir_piramide
+
+
+def _serie(n, paso="7s"):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "evTime": pd.date_range("2024-05-01", periods=n, freq=paso, tz="Europe/Madrid"),
+        "soc": (rng.random(n) * 100).astype("float32"),
+    })
+
+
+@pytest.mark.parametrize("cortes", [
+    [0, 1],
+    [5, 6, 7, 2000],          # cortes dentro del mismo minuto
+    [1000, 1003, 5000, 9000],
+])
+def test_actualizar_equivale_a_construir(cortes):
+    df = _serie(10000)
+    piramide = construir_piramide(df.iloc[:cortes[0]])
+    for desde, hasta in zip(cortes, cortes[1:] + [len(df)]):
+        piramide = actualizar_piramide(piramide, df.iloc[desde:hasta])
+    completa = construir_piramide(df)
+    assert list(piramide) == list(NIVELES_PIRAMIDE)
+    for minutos in NIVELES_PIRAMIDE:
+        pd.testing.assert_frame_equal(piramide[minutos], completa[minutos], rtol=1e-6)
+
+
+def test_actualizar_sin_muestras_nuevas():
+    piramide = construir_piramide(_serie(100))
+    assert actualizar_piramide(piramide, _serie(0)) is piramide
+    assert actualizar_piramide(piramide, _serie(3).assign(soc=None)) is piramide
+
+
+def test_una_sola_muestra():
+    bins = bins_soc(construir_piramide(_serie(1)), 7)
+    assert len(bins) == 1
+    assert bins.iloc[0]["count"] == 1
+    assert bins.iloc[0]["minSOC"] == bins.iloc[0]["avgSOC"] == bins.iloc[0]["maxSOC"]
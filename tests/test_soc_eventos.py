@@ -0,0 +1,100 @@
+import pandas as pd
+import pytest
+from utils import informes, soc_eventos
+from utils.soc_eventos import COLUMNAS_EVENTO, detectar_eventos
+
+
+def _serie(soc, matricula="0001 CBB", inicio="2024-05-01 10:00", paso="1min"):
+    return pd.DataFrame({
+        "matricula": matricula,
+        "evTime": pd.date_range(inicio, periods=len(soc), freq=paso, tz="UTC"),
+        "soc": soc,
+    })
+
+
+def test_histeresis_no_cierra_el_evento_dentro_de_la_banda():
+    # 20.5 y 21.9 quedan entre el umbral y umbral + histéresis: el evento sigue abierto
+    eventos = detectar_eventos(_serie([25, 19, 20.5, 19.5, 21.9, 22, 25]), umbral=20, histeresis=2, duracion_min=0)
+    assert len(eventos) == 1
+    evento = eventos.iloc[0]
+    assert evento["inicio"] == pd.Timestamp("2024-05-01 10:01", tz="UTC")
+    assert evento["fin"] == pd.Timestamp("2024-05-01 10:05", tz="UTC")
+    assert evento["soc_min"] == 19
+    assert not evento["en_curso"]
+    # Solo cuentan los minutos con el SOC por debajo del umbral, no los de la banda
+    assert evento["tiempo_bajo_umbral"] == pd.Timedelta(minutes=2)
+
+
+def test_sin_histeresis_el_ruido_abre_varios_eventos():
+    eventos = detectar_eventos(_serie([25, 19, 20.5, 19.5, 21.9, 22, 25]), umbral=20, histeresis=0, duracion_min=0)
+    assert len(eventos) == 2
+
+
+def test_duracion_minima_descarta_eventos_cortos():
+    soc = [25, 19, 25, 25, 18, 17, 16, 15, 25]
+    eventos = detectar_eventos(_serie(soc), umbral=20, histeresis=2, duracion_min=3 * 60)
+    assert len(eventos) == 1
+    assert eventos.iloc[0]["soc_min"] == 15
+    assert eventos.iloc[0]["momento_soc_min"] == pd.Timestamp("2024-05-01 10:07", tz="UTC")
+
+
+def test_evento_en_curso_y_varios_vehiculos():
+    df = pd.concat([_serie([25, 18, 17]), _serie([19, 30, 30], matricula="0002 DBB")])
+    eventos = detectar_eventos(df, umbral=20, histeresis=2, duracion_min=0)
+    assert list(eventos["matricula"]) == ["0001 CBB", "0002 DBB"]
+    assert list(eventos["en_curso"]) == [True, False]
+    # El evento en curso acaba en la última muestra de su vehículo, no en la del siguiente
+    assert eventos.iloc[0]["fin"] == pd.Timestamp("2024-05-01 10:02", tz="UTC")
+
+
+def test_una_sola_muestra():
+    eventos = detectar_eventos(_serie([10]), umbral=20, histeresis=2, duracion_min=0)
+    assert len(eventos) == 1
+    assert eventos.iloc[0]["duracion"] == pd.Timedelta(0)
+    assert eventos.iloc[0]["en_curso"]
+
+
+@pytest.mark.parametrize("df", [
+    pd.DataFrame(columns=["matricula", "evTime", "soc"]),
+    _serie([50, 60, 70]),
+    _serie([10, 10]).assign(soc=None),
+])
+def test_sin_eventos_mantiene_columnas_y_tipos(df):
+    eventos = detectar_eventos(df, umbral=20, histeresis=2, duracion_min=0)
+    assert eventos.empty
+    assert list(eventos.columns) == COLUMNAS_EVENTO
+    assert eventos["inicio"].dt.strftime("%Y-%m-%d").empty
+    assert eventos["duracion"].dt.total_seconds().sum() == 0
+
+
+def test_informe_low_soc_sin_eventos(monkeypatch):
+    monkeypatch.setattr(informes, "series_soc_bajo", lambda *args: (_serie([50, 60]), []))
+    tablas, graficos, errores = informes.informe_low_soc([], "clave", {"umbral": 2}, lambda hechos, total: None)
+    assert tablas["eventos"].empty
+    assert graficos == [] and errores == []
+
+
+def test_series_soc_bajo_pide_solo_los_dias_preseleccionados(monkeypatch):
+    dias = list(pd.date_range("2024-05-01", periods=4).date)
+    # 0001 baja del umbral el día 1 y acaba el día por debajo; 0002 baja el día 2 y se recupera
+    bajos = {dias[0]: ["0001 CBB"], dias[1]: ["0002 DBB"]}
+    finales = {("0001 CBB", dias[0]): 10, ("0001 CBB", dias[1]): 50}
+    pedidos = []
+
+    def telemetria(endpoint, matricula, dia, api_key, normalizar):
+        pedidos.append((matricula, dia))
+        return _serie([15, finales.get((matricula, dia), 60)], matricula, inicio=f"{dia} 10:00")
+
+    monkeypatch.setattr(soc_eventos.almacen, "dias_completos", lambda dias: [])
+    monkeypatch.setattr(soc_eventos, "fetch_low_soc_dia", lambda dia, api_key: pd.DataFrame(
+        {"matricula": bajos.get(dia, []), "minSoc": 10.0}
+    ))
+    monkeypatch.setattr(soc_eventos, "obtener_telemetria", telemetria)
+    df, errores = soc_eventos.series_soc_bajo(dias, "clave", 20, lambda hechos, total: None, 2)
+
+    # El día siguiente solo se pide para 0001, que termina el día con el evento abierto
+    assert sorted(pedidos) == [("0001 CBB", dias[0]), ("0001 CBB", dias[1]), ("0002 DBB", dias[1])]
+    assert errores == []
+    eventos = detectar_eventos(df, umbral=20, histeresis=2, duracion_min=0)
+    assert list(eventos["matricula"]) == ["0001 CBB", "0002 DBB"]
+    assert not eventos["en_curso"].any()
@@ -0,0 +1,213 @@
+# almacen.py
+
+import json
+import os
+import re
+import threading
+import time
+from datetime import date
+from pathlib import Path
+import pandas as pd
+
+# DuckDB es opcional: sin él las consultas se resuelven leyendo las particiones con pandas
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Directorio del almacén local que rellena ingesta.py
+ALMACEN_DIR = Path(os.environ.get("ALMACEN_DIR", "data/almacen"))
+
+# Tablas particionadas por fecha y vehículo: tabla -> endpoint del que se ingestan
+TABLAS = {
+    "eficiencia": "BI/vehiculoiot-eficiencia",
+    "estado": "BI/vehiculoiot-status",
+}
+ENDPOINTS = {endpoint: tabla for tabla, endpoint in TABLAS.items()}
+
+
+def _seguro(texto):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(texto))
+
+
+def ruta_particion(tabla, fecha, matricula=None):
+    """Fichero Parquet de una tabla para un día (y un vehículo si la tabla va por vehículo)"""
+    ruta = ALMACEN_DIR / tabla / f"fecha={fecha:%Y-%m-%d}"
+    if matricula is not None:
+        ruta = ruta / f"vehiculo={_seguro(matricula)}"
+    return ruta / "datos.parquet"
+
+
+def ruta_ingesta(fecha):
+    """Resumen de la ingesta de un día; solo existe cuando ha terminado"""
+    return ALMACEN_DIR / "_ingestas" / f"{fecha:%Y-%m-%d}.json"
+
+
+def escribir(tabla, fecha, df, matricula=None):
+    """Guardar una partición de forma atómica"""
+    ruta = ruta_particion(tabla, fecha, matricula)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    tmp = ruta.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, ruta)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def registrar_ingesta(fecha, vehiculos, errores):
+    """Marcar el día como ingestado; con errores el día no se usa hasta reintentarlo"""
+    ruta = ruta_ingesta(fecha)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.write_text(json.dumps({"ts": time.time(), "vehiculos": vehiculos, "errores": errores}, ensure_ascii=False))
+
+
+def dia_completo(fecha):
+    """True si el día se ingestó entero para toda la flota"""
+    if fecha >= date.today():
+        return False
+    try:
+        return not json.loads(ruta_ingesta(fecha).read_text())["errores"]
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def dias_completos(dias):
+    """Subconjunto de días que se pueden consultar en local"""
+    return [dia for dia in dias if dia_completo(dia)]
+
+
+def leer_dia(tabla, matricula, fecha):
+    """Datos de un vehículo y día desde el almacén.
+
+    Devuelve None si el día no está ingestado y un DataFrame vacío si el
+    vehículo no tuvo datos ese día.
+    """
+    if not dia_completo(fecha):
+        return None
+    ruta = ruta_particion(tabla, fecha, matricula)
+    if not ruta.exists():
+        return pd.DataFrame()
+    return pd.read_parquet(ruta).drop(columns="matricula", errors="ignore")
+
+
+def maximos_dia(fecha):
+    """Máximos de distancia y eficiencia de un día ingestado o None"""
+    if not dia_completo(fecha):
+        return None
+    try:
+        return pd.read_parquet(ruta_particion("maximos", fecha)).iloc[0].to_dict()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def consultar(sql, parametros=None):
+    """Ejecutar SQL con DuckDB sobre las tablas del almacén.
+
+    Cada tabla se expone como una vista sobre sus ficheros Parquet con las
+    columnas de partición fecha (DATE) y vehiculo.
+    """
+    if duckdb is None:
+        raise RuntimeError("DuckDB no está instalado")
+    con = duckdb.connect()
+    try:
+        for tabla in (*TABLAS, "maximos"):
+            if (ALMACEN_DIR / tabla).is_dir():
+                patron = str(ALMACEN_DIR / tabla / "**" / "*.parquet").replace("'", "''")
+                con.execute(
+                    f"CREATE VIEW {tabla} AS SELECT * FROM read_parquet('{patron}', "
+                    "hive_partitioning = true, hive_types = {'fecha': DATE})"
+                )
+        return con.execute(sql, parametros or []).df()
+    finally:
+        con.close()
+
+
+def _leer_dias(tabla, dias, columnas):
+    """Sin DuckDB: concatenar con pandas las particiones de esos días"""
+    frames = []
+    for dia in dias:
+        ruta = ALMACEN_DIR / tabla / f"fecha={dia:%Y-%m-%d}"
+        if ruta.is_dir():
+            df = pd.read_parquet(ruta, columns=columnas)
+            df["fecha"] = dia
+            frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=[*columnas, "fecha"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def soc_flota(dias, umbral=None):
+    """Serie de SOC de la flota en días ingestados, para detectar eventos de SOC bajo.
+
+    Con umbral solo se devuelven los vehículos cuyo SOC baja de él en
+    algún momento de esos días.
+    """
+    dias = sorted(dias)
+    if not dias:
+        return pd.DataFrame(columns=["matricula", "evTime", "soc"])
+    if duckdb is not None:
+        df = consultar(
+            """
+            SELECT matricula, evTime, soc
+            FROM eficiencia
+            WHERE fecha BETWEEN ? AND ? AND fecha IN (SELECT unnest(?::DATE[]))
+            QUALIFY ? IS NULL OR min(soc) OVER (PARTITION BY matricula) < ?
+            """,
+            [dias[0], dias[-1], dias, umbral, umbral],
+        )
+    else:
+        df = _leer_dias("eficiencia", dias, ["matricula", "evTime", "soc"]).drop(columns="fecha")
+        if umbral is not None:
+            df = df[df.groupby("matricula", observed=True)["soc"].transform("min") < umbral]
+    df["matricula"] = df["matricula"].astype("category")
+    return df.reset_index(drop=True)
+
+
+def telemetria_flota(fecha, columnas):
+    """Columnas de la telemetría de eficiencia de toda la flota en un día ingestado"""
+    if duckdb is not None:
+        lista = ", ".join(f'"{columna}"' for columna in columnas)
+        df = consultar(f"SELECT matricula, {lista} FROM eficiencia WHERE fecha = ?", [fecha])
+    else:
+        df = _leer_dias("eficiencia", [fecha], ["matricula", *columnas]).drop(columns="fecha")
+    df["matricula"] = df["matricula"].astype("category")
+    return df
+
+
+def agregados_eficiencia(dias):
+    """Resumen diario de cada vehículo en días ingestados (distancia, consumo, temperaturas, SOC inicial)"""
+    dias = sorted(dias)
+    if duckdb is not None:
+        df = consultar(
+            """
+            SELECT matricula, fecha,
+                   max(mileage) - min(mileage) AS distancia_km,
+                   avg(energyConsumption_ave) AS consumo_medio,
+                   avg(outsideTemp) AS temp_exterior,
+                   avg(insideTemp) AS temp_interior,
+                   arg_min(soc, evTime) AS soc_inicial,
+                   count(*) AS muestras
+            FROM eficiencia
+            WHERE fecha BETWEEN ? AND ? AND fecha IN (SELECT unnest(?::DATE[]))
+            GROUP BY ALL
+            """,
+            [dias[0], dias[-1], dias],
+        )
+        df["fecha"] = df["fecha"].dt.date
+    else:
+        columnas = ["matricula", "evTime", "mileage", "energyConsumption_ave", "outsideTemp", "insideTemp", "soc"]
+        datos = _leer_dias("eficiencia", dias, columnas).sort_values("evTime")
+        df = datos.groupby(["matricula", "fecha"], observed=True).agg(
+            mileage_min=("mileage", "min"),
+            mileage_max=("mileage", "max"),
+            consumo_medio=("energyConsumption_ave", "mean"),
+            temp_exterior=("outsideTemp", "mean"),
+            temp_interior=("insideTemp", "mean"),
+            soc_inicial=("soc", "first"),
+            muestras=("soc", "size"),
+        ).reset_index()
+        df["distancia_km"] = df.pop("mileage_max") - df.pop("mileage_min")
+    distancia = df["distancia_km"].where(df["distancia_km"] > 0)
+    df["kwh_100km"] = df["consumo_medio"] / distancia * 100
+    return df
@@ -0,0 +1,195 @@
+# api_client.py
+
+import os
+import threading
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.rendimiento import medir, sumar_bytes
+from utils.resiliencia import PresupuestoAgotado, circuito, restante
+
+try:
+    import orjson as _json
+except ImportError:  # orjson es opcional; json de la librería estándar como respaldo
+    import json as _json
+
+try:
+    import ijson
+    # Solo compensa leer en streaming con un backend compilado de ijson
+    _STREAMING_DISPONIBLE = ijson.backend in ("yajl2_c", "yajl2_cffi")
+except ImportError:
+    ijson = None
+    _STREAMING_DISPONIBLE = False
+
+# URL base del backend de plannerstats (configurable para otros entornos)
+BASE_URL = os.environ.get("PLANNERSTATS_URL", "http://localhost:3000/plannerstats").rstrip("/")
+
+# Timeouts (conexión, lectura) en segundos por endpoint
+TIMEOUT_POR_DEFECTO = (3.05, 30)
+TIMEOUTS = {
+    "vehiculos": (3.05, 10),
+    "BI/vehiculoiot-maxdia": (3.05, 15),
+    "BI/vehiculoiot-status": (3.05, 30),
+    "BI/vehiculoiot-eficiencia": (3.05, 60),
+    "BI/vehiculoiot-low-soc": (3.05, 60),
+}
+
+# Reintentos acotados con backoff exponencial (0.3s, 0.6s, 1.2s) de los fallos de conexión y
+# de los 502/503/504; un timeout de lectura no se reintenta: repetirlo multiplicaría la espera
+REINTENTOS = int(os.environ.get("PLANNERSTATS_REINTENTOS", "3"))
+BACKOFF = float(os.environ.get("PLANNERSTATS_BACKOFF", "0.3"))
+# Conexiones keep-alive que se conservan: deben cubrir los hilos de consultas, lotes, precarga y revalidación
+TAMANO_POOL = int(os.environ.get("PLANNERSTATS_POOL", "32"))
+# Leer las respuestas grandes registro a registro en lugar de cargarlas enteras
+STREAMING_JSON = os.environ.get("PLANNERSTATS_STREAMING", "1") == "1" and _STREAMING_DISPONIBLE
+
+_session = None
+_lock = threading.Lock()
+
+
+def _crear_session():
+    """Crear una sesión HTTP con pool de conexiones keep-alive y reintentos"""
+    retry = Retry(
+        total=REINTENTOS,
+        connect=REINTENTOS,
+        read=False,
+        status=REINTENTOS,
+        backoff_factor=BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=TAMANO_POOL, pool_maxsize=TAMANO_POOL, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "Accept": "application/json",
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive",
+    })
+    return session
+
+
+def get_session():
+    """Devolver la sesión HTTP compartida por todo el proceso"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _crear_session()
+    return _session
+
+
+def _api_get(endpoint, api_key, params=None, timeout=None, **kwargs):
+    """GET medido; devuelve la respuesta y el registro de su etapa de rendimiento"""
+    url = f"{BASE_URL}/{endpoint}"
+    headers = {"x-api-key": api_key}
+    if timeout is None:
+        timeout = TIMEOUTS.get(endpoint, TIMEOUT_POR_DEFECTO)
+    queda = restante()
+    recortado = queda is not None and queda < max(timeout)
+    if recortado:
+        if queda <= 0:
+            raise PresupuestoAgotado("El backend está tardando demasiado en responder")
+        timeout = tuple(min(t, queda) for t in timeout)
+    paso = circuito(endpoint)
+    paso.permitir()
+    with medir(f"api {endpoint}") as registro:
+        try:
+            response = get_session().get(url, params=params, headers=headers, timeout=timeout, **kwargs)
+            if not kwargs.get("stream"):
+                registro["bytes"] = len(response.content)
+        except requests.exceptions.Timeout as e:
+            # Un timeout recortado por el presupuesto no dice nada de la salud del backend
+            if not recortado:
+                paso.fallo()
+                raise
+            paso.descartar()
+            raise PresupuestoAgotado("El backend está tardando demasiado en responder") from e
+        except Exception:
+            paso.fallo()
+            raise
+    # Los 4xx son respuestas válidas del backend (p. ej. 404 sin datos); los 5xx cuentan como fallo
+    if response.status_code >= 500:
+        paso.fallo()
+    else:
+        paso.exito()
+    return response, registro
+
+
+def api_get(endpoint, api_key, params=None, timeout=None, **kwargs):
+    """Hacer un GET al backend reutilizando el pool de conexiones.
+
+    Devuelve la respuesta sin comprobar el código de estado. Si el
+    endpoint acumula fallos su circuito se abre y se lanza CircuitoAbierto
+    sin llegar a hacer la petición. Dentro del presupuesto de una vista los
+    timeouts se recortan a lo que le queda y, si se agota, se lanza
+    PresupuestoAgotado.
+    """
+    return _api_get(endpoint, api_key, params=params, timeout=timeout, **kwargs)[0]
+
+
+def api_get_json(endpoint, api_key, params=None, timeout=None):
+    """Hacer un GET al backend y devolver el JSON; lanza RequestException si falla"""
+    response = api_get(endpoint, api_key, params=params, timeout=timeout)
+    response.raise_for_status()
+    return decodificar_json(response.content)
+
+
+def decodificar_json(contenido):
+    """Decodificar el cuerpo JSON con orjson si está disponible"""
+    try:
+        with medir("decodificar json", bytes=len(contenido)):
+            return _json.loads(contenido)
+    except ValueError as e:
+        raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos) from e
+
+
+
+def api_get_registros(endpoint, api_key, params=None, timeout=None):
+    """Iterar los registros de una respuesta JSON de tipo lista.
+
+    Con ijson la respuesta se decodifica en streaming y nunca está entera
+    en memoria; sin ijson se descarga y decodifica de una vez. Lanza
+    RequestException si la API falla.
+    """
+    if not STREAMING_JSON:
+        yield from api_get_json(endpoint, api_key, params=params, timeout=timeout)
+        return
+
+    response, registro = _api_get(endpoint, api_key, params=params, timeout=timeout, stream=True)
+    with response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        cuerpo = _ContadorBytes(response.raw)
+        try:
+            yield from ijson.items(cuerpo, "item", use_float=True)
+        except ijson.JSONError as e:
+            raise requests.exceptions.InvalidJSONError(str(e)) from e
+        except urllib3.exceptions.HTTPError as e:
+            # La lectura superó un timeout recortado por el presupuesto de la vista
+            if restante() == 0:
+                circuito(endpoint).descartar()
+                raise PresupuestoAgotado("El backend está tardando demasiado en responder") from e
+            # La conexión se cortó a mitad de la respuesta
+            circuito(endpoint).fallo()
+            raise requests.exceptions.ConnectionError(e) from e
+        finally:
+            # Con stream=True api_get no conoce el tamaño: se anota lo leído al terminar
+            sumar_bytes(registro, cuerpo.bytes)
+
+
+class _ContadorBytes:
+    """Envoltorio de la respuesta en bruto que cuenta los bytes (ya descomprimidos) leídos"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes = 0
+
+    def read(self, n=-1):
+        datos = self.raw.read(n)
+        self.bytes += len(datos)
+        return datos
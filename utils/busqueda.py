@@ -0,0 +1,128 @@
+# busqueda.py
+
+import os
+import unicodedata
+from collections import defaultdict
+import numpy as np
+import streamlit as st
+
+# Matrículas que se pasan como mucho al selectbox
+MAX_RESULTADOS = int(os.environ.get("BUSQUEDA_MAX_RESULTADOS", "50"))
+# Atributos de /vehiculos con más valores distintos que esto no se ofrecen como filtro
+MAX_VALORES_FILTRO = int(os.environ.get("BUSQUEDA_MAX_VALORES_FILTRO", "50"))
+# Longitud máxima de los n-gramas del índice
+N_GRAMA = 3
+
+_VACIO = np.array([], dtype=np.int32)
+
+
+def normalizar(texto):
+    """Minúsculas, sin acentos ni separadores: "1234-ABC" y "1234 abc" coinciden"""
+    texto = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return "".join(c for c in texto.lower() if c.isalnum())
+
+
+def construir_indice(vehiculos):
+    """Índice de n-gramas de las matrículas y de los atributos filtrables.
+
+    Se construye una vez por cada carga de la flota. Cada n-grama de 1 a
+    N_GRAMA caracteres apunta a los vehículos que lo contienen, así una
+    búsqueda solo intersecta unas pocas listas en lugar de recorrer la flota.
+    """
+    vehiculos = sorted(vehiculos, key=lambda veh: veh["matricula"])
+    claves = [normalizar(veh["matricula"]) for veh in vehiculos]
+
+    gramas = defaultdict(list)
+    prefijos = defaultdict(list)
+    for i, clave in enumerate(claves):
+        for n in range(1, N_GRAMA + 1):
+            for grama in {clave[j:j + n] for j in range(len(clave) - n + 1)}:
+                gramas[grama].append(i)
+            if len(clave) >= n:
+                prefijos[clave[:n]].append(i)
+
+    atributos = defaultdict(lambda: defaultdict(list))
+    for i, veh in enumerate(vehiculos):
+        for atributo, valor in veh.items():
+            if atributo != "matricula" and isinstance(valor, (str, int, float, bool)):
+                atributos[atributo][valor].append(i)
+
+    return {
+        "matriculas": [veh["matricula"] for veh in vehiculos],
+        "claves": claves,
+        "longitudes": np.array([len(clave) for clave in claves], dtype=np.int32),
+        "gramas": {grama: np.array(ids, dtype=np.int32) for grama, ids in gramas.items()},
+        "prefijos": {prefijo: np.array(ids, dtype=np.int32) for prefijo, ids in prefijos.items()},
+        "filtros": {
+            atributo: {valor: np.array(ids, dtype=np.int32) for valor, ids in valores.items()}
+            for atributo, valores in atributos.items()
+            # Un atributo distinto en cada vehículo (id, bastidor...) no sirve para filtrar
+            if 1 < len(valores) <= MAX_VALORES_FILTRO and len(valores) < len(vehiculos)
+        },
+    }
+
+
+def buscar(indice, texto, filtros=None, limite=MAX_RESULTADOS):
+    """Matrículas que contienen el texto y cumplen los filtros.
+
+    filtros es un diccionario atributo -> valores aceptados. Devuelve
+    (matrículas, total): como mucho `limite` matrículas con primero la
+    coincidencia exacta, luego las que empiezan por el texto y luego el
+    resto, y el número total de vehículos que encajan.
+    """
+    consulta = normalizar(texto)
+    candidatos = None
+
+    if consulta:
+        trozos = {consulta[i:i + N_GRAMA] for i in range(max(len(consulta) - N_GRAMA + 1, 1))}
+        for ids in sorted((indice["gramas"].get(trozo, _VACIO) for trozo in trozos), key=len):
+            candidatos = ids if candidatos is None else np.intersect1d(candidatos, ids, assume_unique=True)
+
+    for atributo, valores in (filtros or {}).items():
+        if valores:
+            posibles = indice["filtros"].get(atributo, {})
+            ids = np.unique(np.concatenate([posibles.get(valor, _VACIO) for valor in valores]))
+            candidatos = ids if candidatos is None else np.intersect1d(candidatos, ids, assume_unique=True)
+
+    if candidatos is None:
+        return indice["matriculas"][:limite], len(indice["matriculas"])
+
+    if consulta:
+        if len(consulta) > N_GRAMA:
+            # Con textos largos los n-gramas pueden dar falsos positivos: se comprueba la posición real
+            # (quedan pocos candidatos tras intersectar)
+            claves = indice["claves"]
+            posicion = np.array([claves[i].find(consulta) for i in candidatos], dtype=np.int32)
+            candidatos = candidatos[posicion >= 0]
+            prefijo = posicion[posicion >= 0] == 0
+        else:
+            # Con textos cortos la lista del n-grama ya es exacta
+            prefijo = np.isin(candidatos, indice["prefijos"].get(consulta, _VACIO), assume_unique=True)
+        exacta = prefijo & (indice["longitudes"][candidatos] == len(consulta))
+        grado = np.where(exacta, 0, np.where(prefijo, 1, 2))
+        candidatos = candidatos[np.lexsort((candidatos, grado))]
+
+    return [indice["matriculas"][i] for i in candidatos[:limite]], len(candidatos)
+
+
+def selector_vehiculo(flota, etiqueta):
+    """Buscador de matrícula con filtros por atributo y lista de resultados acotada.
+
+    Devuelve la matrícula elegida o None si no hay ninguna que encaje.
+    """
+    indice = flota["busqueda"]
+    texto = st.text_input("Buscar matrícula", "")
+
+    filtros = {}
+    if indice["filtros"]:
+        columnas = st.columns(len(indice["filtros"]))
+        for columna, (atributo, valores) in zip(columnas, indice["filtros"].items()):
+            filtros[atributo] = columna.multiselect(atributo.capitalize(), sorted(valores, key=str))
+
+    matriculas, total = buscar(indice, texto, filtros)
+    if not matriculas:
+        st.warning("No se encontraron vehículos con ese texto.")
+        return None
+    if total > len(matriculas):
+        st.caption(f"Mostrando {len(matriculas)} de {total} vehículos: escribe más para acotar la búsqueda.")
+    return st.selectbox(etiqueta, matriculas)
@@ -0,0 +1,91 @@
+# cache.py
+
+import threading
+import time
+import requests
+from utils.resiliencia import OBSOLETO_MAX_SEGUNDOS, marcar_obsoleto, revalidar
+
+
+class CacheTTL:
+    """Caché en memoria compartida por el proceso, con caducidad por entrada"""
+
+    def __init__(self, ttl, max_entradas=None, nombre="datos"):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        # Cómo se llama a estos datos en el aviso de datos caducados
+        self.nombre = nombre
+        self._datos = {}
+        self._lock = threading.Lock()
+        # clave -> [lock, hilos que la cargan o esperan]; se borra al salir el último
+        self._locks_carga = {}
+
+    def get(self, clave):
+        """Devolver el valor si existe y no ha caducado, si no None"""
+        with self._lock:
+            entrada = self._datos.get(clave)
+        if entrada is None:
+            return None
+        valor, expira, _ = entrada
+        if time.monotonic() >= expira:
+            return None
+        return valor
+
+    def set(self, clave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._datos[clave] = (valor, time.monotonic() + ttl, time.time())
+            # Si hay límite, se descartan las entradas más antiguas
+            while self.max_entradas is not None and len(self._datos) > self.max_entradas:
+                self._datos.pop(next(iter(self._datos)))
+
+    def get_or_load(self, clave, cargar, ttl=None, obsoleto=False):
+        """Devolver el valor cacheado o cargarlo una sola vez aunque lo pidan varias sesiones.
+
+        Con obsoleto=True una entrada caducada hace poco se devuelve al
+        momento y se recarga en segundo plano; una más antigua solo se usa
+        si la carga falla.
+        """
+        valor = self.get(clave)
+        if valor is not None:
+            return valor
+        with self._lock:
+            entrada = self._datos.get(clave) if obsoleto else None
+        if entrada is None:
+            return self._cargar(clave, cargar, ttl)
+
+        anterior, expira, guardado = entrada
+        if time.monotonic() - expira <= OBSOLETO_MAX_SEGUNDOS:
+            revalidar((id(self), clave), lambda: self._cargar(clave, cargar, ttl))
+            marcar_obsoleto(self.nombre, guardado)
+            return anterior
+        try:
+            return self._cargar(clave, cargar, ttl)
+        except requests.exceptions.RequestException:
+            marcar_obsoleto(self.nombre, guardado)
+            return anterior
+
+    def _cargar(self, clave, cargar, ttl):
+        with self._lock:
+            carga = self._locks_carga.setdefault(clave, [threading.Lock(), 0])
+            carga[1] += 1
+        try:
+            with carga[0]:
+                valor = self.get(clave)
+                if valor is None:
+                    valor = cargar()
+                    self.set(clave, valor, ttl)
+        finally:
+            with self._lock:
+                carga[1] -= 1
+                if carga[1] == 0:
+                    del self._locks_carga[clave]
+        return valor
+
+    def invalidar(self, clave=None):
+        """Borrar una entrada concreta o toda la caché"""
+        with self._lock:
+            if clave is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
@@ -0,0 +1,156 @@
+# cache_disco.py
+
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import pandas as pd
+
+# Directorio y tamaño máximo de la caché de telemetría en disco
+CACHE_DIR = Path(os.environ.get("TELEMETRIA_CACHE_DIR", ".cache/telemetria"))
+CACHE_MAX_MB = float(os.environ.get("TELEMETRIA_CACHE_MAX_MB", "500"))
+# Los días pasados no cambian; el día en curso solo se reutiliza durante unos segundos
+TTL_HOY = float(os.environ.get("TELEMETRIA_CACHE_TTL_HOY", "120"))
+
+# Cada cuántas escrituras se vuelve a medir el directorio entero (otros procesos también escriben en él)
+RECUENTO_CADA = int(os.environ.get("TELEMETRIA_CACHE_RECUENTO", "500"))
+
+_estadisticas = {"aciertos": 0, "fallos": 0, "escrituras": 0, "desalojos": 0}
+_lock = threading.Lock()
+_lock_desalojo = threading.Lock()
+# Bytes que ocupa la caché según la última medición más lo escrito desde entonces (None: sin medir)
+_tamano = {"total": None, "escrituras": 0}
+
+
+def _contar(clave, n=1):
+    with _lock:
+        _estadisticas[clave] += n
+
+
+def _seguro(texto):
+    """Nombre de fichero seguro a partir de una matrícula o parámetro"""
+    return re.sub(r"[^A-Za-z0-9_.=-]", "_", str(texto))
+
+
+def ruta_cache(endpoint, matricula, fecha, params=None):
+    """Ruta del fichero Parquet para un endpoint, vehículo, día y parámetros"""
+    nombre = fecha.strftime("%Y-%m-%d")
+    if params:
+        nombre += "__" + "_".join(f"{k}={_seguro(v)}" for k, v in sorted(params.items()))
+    return CACHE_DIR / _seguro(endpoint.rsplit("/", 1)[-1]) / _seguro(matricula) / f"{nombre}.parquet"
+
+
+def es_inmutable(fecha):
+    """Los días ya terminados no vuelven a cambiar en el backend"""
+    return fecha < date.today()
+
+
+def es_definitivo(fecha, guardado):
+    """Lo escrito mientras el día estaba en curso es parcial aunque ya haya terminado (guardado: st_mtime)"""
+    return es_inmutable(fecha) and guardado >= datetime.combine(fecha + timedelta(days=1), datetime.min.time()).timestamp()
+
+
+def leer(endpoint, matricula, fecha, params=None):
+    """Devolver el DataFrame cacheado o None si no existe o ha caducado"""
+    ruta = ruta_cache(endpoint, matricula, fecha, params)
+    try:
+        stat = ruta.stat()
+        if not es_definitivo(fecha, stat.st_mtime) and time.time() - stat.st_mtime > TTL_HOY:
+            _contar("fallos")
+            return None
+        df = pd.read_parquet(ruta)
+        # Se actualiza el instante de último acceso (atime) para el desalojo LRU
+        os.utime(ruta, (time.time(), stat.st_mtime))
+    except (OSError, ValueError):
+        _contar("fallos")
+        return None
+    _contar("aciertos")
+    return df
+
+
+def leer_obsoleto(endpoint, matricula, fecha, params=None):
+    """Copia caducada (del día en curso o parcial de un día ya terminado): (DataFrame, time.time() de cuando se guardó) o None"""
+    ruta = ruta_cache(endpoint, matricula, fecha, params)
+    try:
+        guardado = ruta.stat().st_mtime
+        return pd.read_parquet(ruta), guardado
+    except (OSError, ValueError):
+        return None
+
+
+def guardar(endpoint, matricula, fecha, df, params=None):
+    """Guardar el DataFrame en disco y aplicar el límite de tamaño"""
+    ruta = ruta_cache(endpoint, matricula, fecha, params)
+    tmp = ruta.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(tmp, index=False)
+        nuevo = tmp.stat().st_size
+        anterior = ruta.stat().st_size if ruta.exists() else 0
+        os.replace(tmp, ruta)
+    except (OSError, ValueError, TypeError):
+        # Columnas no serializables o disco no disponible: se sigue sin caché
+        tmp.unlink(missing_ok=True)
+        return
+    _contar("escrituras")
+    _anotar_escritura(nuevo - anterior)
+
+
+def _anotar_escritura(delta):
+    """Llevar la cuenta del tamaño sin recorrer el directorio y desalojar solo al pasar del límite"""
+    with _lock:
+        _tamano["escrituras"] += 1
+        if _tamano["total"] is not None and _tamano["escrituras"] % RECUENTO_CADA:
+            _tamano["total"] += delta
+            if _tamano["total"] <= CACHE_MAX_MB * 1024 * 1024:
+                return
+    _desalojar()
+
+
+def _desalojar():
+    """Medir el directorio y borrar los ficheros menos usados recientemente hasta quedar bajo el límite"""
+    # Si otro hilo ya está desalojando, esta escritura no tiene que repetirlo
+    if not _lock_desalojo.acquire(blocking=False):
+        return
+    try:
+        # Se baja hasta el 90% del límite para que las siguientes escrituras no vuelvan a desalojar enseguida
+        total = _liberar(CACHE_MAX_MB * 1024 * 1024, CACHE_MAX_MB * 1024 * 1024 * 0.9)
+    finally:
+        _lock_desalojo.release()
+    with _lock:
+        _tamano["total"] = total
+
+
+def _liberar(limite, objetivo):
+    """Si el directorio pasa del límite, borrar por último acceso hasta el objetivo; devuelve el tamaño final"""
+    ficheros = []
+    total = 0
+    for ruta in CACHE_DIR.rglob("*.parquet"):
+        try:
+            stat = ruta.stat()
+        except OSError:
+            continue
+        ficheros.append((stat.st_atime, stat.st_size, ruta))
+        total += stat.st_size
+
+    if total <= limite:
+        return total
+
+    for _, tamano, ruta in sorted(ficheros, key=lambda f: f[0]):
+        try:
+            ruta.unlink()
+        except OSError:
+            continue
+        _contar("desalojos")
+        total -= tamano
+        if total <= objetivo:
+            break
+    return total
+
+
+def estadisticas():
+    """Copia de los contadores de aciertos/fallos de la caché"""
+    with _lock:
+        return dict(_estadisticas)
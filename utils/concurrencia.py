@@ -0,0 +1,111 @@
+# concurrencia.py
+
+import contextvars
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from utils.resiliencia import PresupuestoAgotado, restante
+
+# Hilos compartidos por todas las sesiones para las consultas al backend
+MAX_HILOS = int(os.environ.get("CONSULTAS_MAX_HILOS", "16"))
+# Hilos compartidos por todos los lotes (ranking, SOC bajo, tendencia, exportaciones) del proceso
+LOTES_MAX_HILOS = int(os.environ.get("LOTES_MAX_HILOS", "8"))
+
+_executor = None
+_executor_lotes = None
+_lock = threading.Lock()
+_activas = 0
+
+
+def get_executor():
+    """Devolver el pool de hilos compartido por todo el proceso"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=MAX_HILOS, thread_name_prefix="consultas")
+    return _executor
+
+
+def _en_primer_plano(funcion, *args):
+    global _activas
+    with _lock:
+        _activas += 1
+    try:
+        return funcion(*args)
+    finally:
+        with _lock:
+            _activas -= 1
+
+
+def consultas_activas():
+    """Consultas de las vistas en curso; la precarga espera a que terminen"""
+    return _activas
+
+
+def lanzar_consultas(tareas):
+    """Lanzar a la vez las consultas independientes de una vista.
+
+    Recibe un diccionario nombre -> función sin argumentos y devuelve un
+    diccionario nombre -> Future. Con resiliencia.esperar(futuro) se obtiene
+    el valor sin pasar del presupuesto de la vista, o se relanza la
+    excepción de la consulta. Las funciones se ejecutan
+    fuera del hilo de Streamlit, así que no deben llamar a st.*.
+    """
+    executor = get_executor()
+    # Cada tarea se ejecuta en una copia del contexto para que sus medidas cuenten en el render
+    return {
+        nombre: executor.submit(contextvars.copy_context().run, _en_primer_plano, funcion)
+        for nombre, funcion in tareas.items()
+    }
+
+
+def _get_executor_lotes():
+    global _executor_lotes
+    if _executor_lotes is None:
+        with _lock:
+            if _executor_lotes is None:
+                _executor_lotes = ThreadPoolExecutor(max_workers=LOTES_MAX_HILOS, thread_name_prefix="lote")
+    return _executor_lotes
+
+
+def ejecutar_lote(funcion, elementos, max_hilos):
+    """Aplicar una función a muchos elementos con concurrencia acotada.
+
+    Todos los lotes comparten un pool propio, separado del de las vistas,
+    así varias sesiones a la vez no pasan de LOTES_MAX_HILOS peticiones; de
+    cada lote hay como mucho max_hilos tareas en marcha. Va devolviendo
+    (elemento, resultado, error) según terminan. Si se agota el presupuesto
+    de la vista, lo que falta se devuelve con PresupuestoAgotado: lo que
+    está en marcha termina en segundo plano y lo demás ya no se lanza.
+    """
+    executor = _get_executor_lotes()
+    por_lanzar = iter(elementos)
+    en_marcha = {}
+    try:
+        while True:
+            for elemento in islice(por_lanzar, max(max_hilos - len(en_marcha), 0)):
+                futuro = executor.submit(contextvars.copy_context().run, _en_primer_plano, funcion, elemento)
+                en_marcha[futuro] = elemento
+            if not en_marcha:
+                return
+            hechos, _ = wait(en_marcha, timeout=restante(), return_when=FIRST_COMPLETED)
+            if not hechos:
+                for elemento in [*en_marcha.values(), *por_lanzar]:
+                    yield elemento, None, PresupuestoAgotado("El backend está tardando demasiado en responder")
+                en_marcha.clear()
+                return
+            for futuro in hechos:
+                yield _resultado(futuro, en_marcha.pop(futuro))
+    finally:
+        # Si se deja de leer el lote, lo que aún no ha empezado no se ejecuta
+        for futuro in en_marcha:
+            futuro.cancel()
+
+
+def _resultado(futuro, elemento):
+    try:
+        return elemento, futuro.result(), None
+    except Exception as e:
+        return elemento, None, e
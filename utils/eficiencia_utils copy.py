@@ -4,19 +4,8 @@ import streamlit as st
 import requests
 import pandas as pd
 from datetime import datetime
-
-def obtener_vehiculos(api_key):
-    """Obtener los vehículos desde la API"""
-    base_url = "http://localhost:3000/plannerstats/vehiculos"
-    headers = {"x-api-key": api_key}
-
-    try:
-        response = requests.get(base_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error al obtener los vehículos: {e}")
-        return []
+from utils.api_client import api_get_json
+from utils.flota import obtener_vehiculos
 
 def show_eficiencia_vehiculo(fecha_default, api_key):
     st.title("⚡ Análisis de Eficiencia del Vehículo")
@@ -42,17 +31,13 @@ def show_eficiencia_vehiculo(fecha_default, api_key):
     if st.button("Consultar eficiencia"):
         st.info(f"Consultando datos para {matricula} el {fecha.strftime('%Y-%m-%d')}...")
 
-        base_url = "http://localhost:3000/plannerstats/BI/vehiculoiot-eficiencia"
         params = {
             "fecha": fecha.strftime("%Y-%m-%d"),
             "matricula": matricula
         }
-        headers = {"x-api-key": api_key}
         
         try:
-            response = requests.get(base_url, params=params, headers=headers)
-            response.raise_for_status()
-            datos = response.json()
+            datos = api_get_json("BI/vehiculoiot-eficiencia", api_key, params=params)
             if not datos:
                 st.warning("No se encontraron datos para ese día.")
                 return
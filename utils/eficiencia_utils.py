@@ -1,40 +1,69 @@
 # eficiencia_utils.py
 
+import os
 import streamlit as st
 import requests
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime
+from datetime import date, datetime, time
+from utils import almacen, cache_disco
+from utils.api_client import api_get_json
+from utils.busqueda import selector_vehiculo
+from utils.cache import CacheTTL
+from utils.concurrencia import lanzar_consultas
+from utils.en_vivo import INTERVALO_EN_VIVO, actualizar_en_vivo, figura_en_vivo
+from utils.exportacion import panel_exportacion
+from utils.flota import obtener_flota
+from utils.graficos import (
+    MAX_PUNTOS_POR_DEFECTO, SERIES_EFICIENCIA, acumular_series, actualizar_puntos, figura_puntos, figura_series,
+)
+from utils.normalizacion import normalizar_eficiencia, normalizar_estado
+from utils.precarga import dias_vecinos, precargar
+from utils.rendimiento import medir
+from utils.resiliencia import esperar, hay_obsoletos
+from utils.resultados import figura_memo, guardar_resultado, obtener_resultado
+from utils.segmentacion import resumen_segmentos, segmentar
+from utils.telemetria import obtener_telemetria
+from utils.tendencia import show_tendencia_eficiencia
 
-def obtener_vehiculos(api_key):
-    """Obtener los vehículos desde la API"""
-    base_url = "http://localhost:3000/plannerstats/vehiculos"
-    headers = {"x-api-key": api_key}
-
-    try:
-        response = requests.get(base_url, headers=headers)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error al obtener los vehículos: {e}")
-        return []
+# Los máximos del día son los mismos para todos los vehículos
+_cache_maximos = CacheTTL(
+    float(os.environ.get("MAXIMOS_TTL_SEGUNDOS", "3600")),
+    max_entradas=int(os.environ.get("MAXIMOS_MAX_ENTRADAS", "400")),
+    nombre="máximos del día",
+)
 
 def obtener_maximos_dia(api_key, fecha):
     """Llama a la API para obtener máximos globales de distancia y eficiencia en ese día."""
-    base_url = "http://localhost:3000/plannerstats/BI/vehiculoiot-maxdia"
-    params = {"fecha": fecha.strftime("%Y-%m-%d")}
-    headers = {"x-api-key": api_key}
+    def cargar():
+        # Los días ingestados ya tienen sus máximos en el almacén local
+        maximos = almacen.maximos_dia(fecha)
+        if maximos is not None:
+            return maximos
+        params = {"fecha": fecha.strftime("%Y-%m-%d")}
+        return api_get_json("BI/vehiculoiot-maxdia", api_key, params=params)
 
-    response = requests.get(base_url, params=params, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error(f"Error al obtener máximos del día: {response.status_code}")
-        return {"maxDistance": None, "maxEnergyConsumptionAve": None}        
+    # Los máximos del día en curso cambian a lo largo del día
+    ttl = None if cache_disco.es_inmutable(fecha) else cache_disco.TTL_HOY
+    return _cache_maximos.get_or_load((api_key, fecha), cargar, ttl, obsoleto=True)
+
+def _precargar_eficiencia(matricula, fecha, api_key, vecinos):
+    """Calentar la caché con los máximos del día y, ya consultado, con los días vecinos"""
+    tareas = {("maximos", api_key, fecha): lambda: obtener_maximos_dia(api_key, fecha)}
+    # Los vecinos esperan a que se haya mostrado el día elegido para no competir con su consulta
+    for dia in dias_vecinos(fecha) if vecinos else []:
+        tareas[("eficiencia", api_key, matricula, dia)] = (
+            lambda dia=dia: obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, dia, api_key, normalizar_eficiencia)
+        )
+        tareas[("maximos", api_key, dia)] = lambda dia=dia: obtener_maximos_dia(api_key, dia)
+    precargar(tareas)
 
 def show_kpi_gauge(title, value, min_value, max_value, color="lightblue"):
     """Crear gráfico gauge para mostrar un KPI"""
+    # Sin máximos del día (p. ej. si el backend falla) no hay escala: solo se muestra el valor
+    if max_value is None or value is None:
+        return go.Figure(go.Indicator(mode="number", value=value, title={'text': title}))
     fig = go.Figure(go.Indicator(
         mode="gauge+number+delta",
         value=value,
@@ -51,127 +80,267 @@ def show_kpi_gauge(title, value, min_value, max_value, color="lightblue"):
     ))
     return fig        
 
+def show_segmentos(segmentos, eficiencia_dia):
+    """Trayectos, cargas y paradas del día con sus métricas"""
+    st.subheader("🧭 Trayectos, cargas y paradas")
+    if segmentos.empty:
+        st.info("No hay tramos que mostrar.")
+        return
+
+    resumen = resumen_segmentos(segmentos).set_index("tipo")
+    conduccion = resumen.loc["conducción"] if "conducción" in resumen.index else None
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Trayectos", int(conduccion["tramos"]) if conduccion is not None else 0)
+    col2.metric(
+        "kWh/100km en conducción",
+        f"{conduccion['kwh_100km']:.2f}" if conduccion is not None and pd.notna(conduccion["kwh_100km"]) else "N/A",
+        help=f"Media del consumo instantáneo ponderada por km. Métrica del día completo: "
+             f"{eficiencia_dia:.2f}" if eficiencia_dia else None,
+    )
+    col3.metric("Horas cargando", f"{resumen['horas'].get('carga', 0):.1f}")
+    col4.metric("Horas parado", f"{resumen['horas'].get('parado', 0):.1f}")
+
+    tabla = segmentos.drop(columns="matricula").assign(
+        minutos=(segmentos["duracion"].dt.total_seconds() / 60).round(1)
+    )
+    st.dataframe(
+        tabla[["tipo", "inicio", "fin", "minutos", "distancia_km", "soc_inicio", "soc_fin", "delta_soc", "kwh_100km", "energia_kwh"]],
+        hide_index=True,
+        column_config={
+            "tipo": st.column_config.TextColumn("Tipo"),
+            "inicio": st.column_config.DatetimeColumn("Inicio", format="HH:mm"),
+            "fin": st.column_config.DatetimeColumn("Fin", format="HH:mm"),
+            "minutos": st.column_config.NumberColumn("Duración (min)"),
+            "distancia_km": st.column_config.NumberColumn("Distancia (km)", format="%.2f"),
+            "soc_inicio": st.column_config.NumberColumn("SOC inicio", format="%.1f"),
+            "soc_fin": st.column_config.NumberColumn("SOC fin", format="%.1f"),
+            "delta_soc": st.column_config.NumberColumn("Δ SOC", format="%+.1f"),
+            "kwh_100km": st.column_config.NumberColumn("kWh/100km", format="%.2f"),
+            "energia_kwh": st.column_config.NumberColumn("Energía (kWh)", format="%.1f"),
+        },
+    )
+
+@st.fragment(run_every=INTERVALO_EN_VIVO)
+def _panel_en_vivo_eficiencia(matricula, fecha, api_key, max_puntos):
+    """Parte de la página que se refresca sola; el resto del script no se vuelve a ejecutar"""
+    try:
+        # Cada número de puntos lleva su propio estado: al cambiarlo se rehace desde el principio del día
+        nuevas, estado = actualizar_en_vivo(matricula, fecha, api_key, f"eficiencia {max_puntos}")
+    except requests.exceptions.RequestException as e:
+        st.warning(f"No se pudo actualizar: {e}")
+        return
+    if estado["ultimo"] is None:
+        st.warning("Todavía no hay datos de hoy.")
+        return
+
+    # Agregados acumulados del día: cada refresco solo recorre las filas nuevas
+    if not nuevas.empty:
+        km = nuevas["mileage"]
+        estado["km_min"] = pd.Series([estado.get("km_min"), km.min()], dtype="float64").min()
+        estado["km_max"] = pd.Series([estado.get("km_max"), km.max()], dtype="float64").max()
+        estado["consumo_suma"] = estado.get("consumo_suma", 0.0) + nuevas["energyConsumption_ave"].sum()
+        estado["consumo_muestras"] = estado.get("consumo_muestras", 0) + nuevas["energyConsumption_ave"].count()
+        soc = nuevas["soc"].dropna()
+        if not soc.empty:
+            estado["soc"] = soc.iloc[-1]
+        estado["puntos"] = acumular_series(estado.get("puntos"), nuevas, "evTime", SERIES_EFICIENCIA, max_puntos)
+
+    distancia_total = estado["km_max"] - estado["km_min"]
+    consumo_medio = estado["consumo_suma"] / estado["consumo_muestras"] if estado["consumo_muestras"] else float("nan")
+    eficiencia_kwh_100km = (consumo_medio / distancia_total * 100) if distancia_total > 0 else None
+
+    st.caption(f"Última muestra: {estado['ultimo']:%H:%M:%S} · {len(nuevas)} registros nuevos")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Distancia recorrida (km)", f"{distancia_total:.2f}")
+    col2.metric("Consumo medio (kWh/100km)", f"{eficiencia_kwh_100km:.2f}" if eficiencia_kwh_100km else "N/A")
+    col3.metric("SOC actual", f"{estado['soc']:.0f}%" if "soc" in estado else "N/A")
+
+    puntos = estado["puntos"]
+    fig = figura_en_vivo(
+        matricula, fecha, "eficiencia",
+        lambda: figura_puntos(puntos, [titulo for _, titulo in SERIES_EFICIENCIA]),
+        lambda fig: actualizar_puntos(fig, puntos),
+    )
+    st.plotly_chart(fig, use_container_width=True, key="eficiencia_en_vivo_grafico")
+
 def show_eficiencia_vehiculo(fecha_default, api_key):
     st.title("⚡ Análisis de Eficiencia del Vehículo")
 
-    vehiculos = obtener_vehiculos(api_key)
-    if not vehiculos:
+    flota = obtener_flota(api_key)
+    if not flota["vehiculos"]:
         st.warning("No se encontraron vehículos.")
         return
 
-    matriculas = [veh["matricula"] for veh in vehiculos]
-
-    search_text = st.text_input("Buscar matrícula", "")
-    matriculas_filtradas = [m for m in matriculas if search_text.lower() in m.lower()]
-
-    if not matriculas_filtradas:
-        st.warning("No se encontraron vehículos con ese texto.")
+    matricula = selector_vehiculo(flota, "Selecciona la matrícula")
+    if matricula is None:
         return
 
-    matricula = st.selectbox("Selecciona la matrícula", matriculas_filtradas)
+    # La tendencia resume varias semanas del vehículo a partir de agregados diarios
+    if st.radio("Modo", ["Día", "Tendencia"], horizontal=True, key="eficiencia_modo") == "Tendencia":
+        show_tendencia_eficiencia(matricula, fecha_default, api_key)
+        return
 
     fecha = st.date_input("Fecha", fecha_default)
 
+    with st.expander("Opciones de visualización"):
+        modo_ligero = st.toggle("Modo ligero (WebGL con submuestreo)", value=True)
+        max_puntos = st.number_input("Puntos por serie", min_value=200, max_value=20000, value=MAX_PUNTOS_POR_DEFECTO, step=200)
+        ventana = st.slider("Ventana horaria (acótala para ver más detalle)", value=(time(0, 0), time(23, 59)), format="HH:mm")
+    panel_exportacion("eficiencia", fecha, api_key, matricula)
+
+    # El modo en vivo solo tiene sentido para el día en curso
+    if fecha == date.today() and st.toggle("🔴 En vivo (actualización automática)", key="eficiencia_en_vivo"):
+        _panel_en_vivo_eficiencia(matricula, fecha, api_key, max_puntos)
+        return
+
     if st.button("Consultar eficiencia"):
+        st.session_state["eficiencia_consulta"] = (matricula, fecha)
+
+    # El resultado se conserva al tocar otros controles mientras no cambien el vehículo ni la fecha
+    if st.session_state.get("eficiencia_consulta") != (matricula, fecha):
+        _precargar_eficiencia(matricula, fecha, api_key, vecinos=False)
+        return
+
+    clave = ("eficiencia", matricula, fecha)
+    resultado = obtener_resultado(clave)
+    if resultado is None:
         st.info(f"Consultando datos para {matricula} el {fecha.strftime('%Y-%m-%d')}...")
 
-        base_url = "http://localhost:3000/plannerstats/BI/vehiculoiot-eficiencia"
-        params = {
-            "fecha": fecha.strftime("%Y-%m-%d"),
-            "matricula": matricula
-        }
-        headers = {"x-api-key": api_key}
-        
+        # Las consultas son independientes: se lanzan a la vez
+        consultas = lanzar_consultas({
+            "telemetria": lambda: obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, fecha, api_key, normalizar_eficiencia),
+            "maximos": lambda: obtener_maximos_dia(api_key, fecha),
+            "estado": lambda: obtener_telemetria("BI/vehiculoiot-status", matricula, fecha, api_key, normalizar_estado),
+        })
+
         try:
-            response = requests.get(base_url, params=params, headers=headers)
-            response.raise_for_status()
-            datos = response.json()
-            if not datos:
+            df = esperar(consultas["telemetria"])
+            if df.empty:
                 st.warning("No se encontraron datos para ese día.")
                 return
         except requests.exceptions.RequestException as e:
             st.error(f"Error al consultar la API: {e}")
             return
 
-        # Conversión a DataFrame
-        df = pd.DataFrame(datos)
-        df["evTime"] = pd.to_datetime(df["evTime"], errors='coerce')
-        df["energyConsumption_ave"] = pd.to_numeric(df["energyConsumption"].apply(lambda x: x.get("ave", None)), errors='coerce')
-        df["energyConsumption_rt"] = pd.to_numeric(df["energyConsumption"].apply(lambda x: x.get("rt", None)), errors='coerce')
-        df["outsideTemp"] = pd.to_numeric(df["outsideTemp"], errors='coerce')
-        df["insideTemp"] = pd.to_numeric(df["insideTemp"], errors='coerce')
-
-        # Validación de que las columnas necesarias no estén vacías
-        if df.empty:
-            st.warning("No hay datos válidos para graficar.")
-            return
+        # Cálculo de valores máximos dinámicos
+        try:
+            maximos = esperar(consultas["maximos"])
+            error_maximos = None
+        except requests.exceptions.RequestException as e:
+            maximos = {"maxDistance": None, "maxEnergyConsumptionAve": None}
+            error_maximos = f"Error al obtener máximos del día: {e}"
+
+        # Sin evStatus los tramos se separan solo por velocidad, kilometraje y SOC
+        try:
+            df_estado = esperar(consultas["estado"])
+        except requests.exceptions.RequestException:
+            df_estado = None
+        with medir("segmentación"):
+            segmentos = segmentar(df, df_estado)
 
-        # Métricas generales
-        distancia_total = df["mileage"].max() - df["mileage"].min()
-        consumo_medio = df["energyConsumption_ave"].mean()
-        eficiencia_kwh_100km = (consumo_medio / distancia_total * 100) if distancia_total > 0 else None
+        resultado = {"df": df, "maximos": maximos, "error_maximos": error_maximos, "segmentos": segmentos}
+        # Un resultado incompleto o con datos caducados no se guarda: el siguiente rerun lo vuelve a pedir
+        if error_maximos is None and df_estado is not None and not hay_obsoletos():
+            guardar_resultado(clave, resultado)
 
-        st.subheader("📈 Métricas generales (Valores comparados con los máximos para todos los vehículos ese dia)")
-        # Cálculo de valores máximos dinámicos
-        maximos = obtener_maximos_dia(api_key, fecha)
-        max_dist = maximos.get("maxDistance")
-        max_eff = maximos.get("maxEnergyConsumptionAve")
-        soc_max = 100  # El máximo para el SOC es 100%
+    df = resultado["df"]
+    maximos = resultado["maximos"]
+
+    # Validación de que las columnas necesarias no estén vacías
+    if df.empty:
+        st.warning("No hay datos válidos para graficar.")
+        return
+
+    # Métricas generales
+    distancia_total = df["mileage"].max() - df["mileage"].min()
+    consumo_medio = df["energyConsumption_ave"].mean()
+    eficiencia_kwh_100km = (consumo_medio / distancia_total * 100) if distancia_total > 0 else None
+
+    st.subheader("📈 Métricas generales (Valores comparados con los máximos para todos los vehículos ese dia)")
+    if resultado["error_maximos"]:
+        st.error(resultado["error_maximos"])
+    max_dist = maximos.get("maxDistance")
+    max_eff = maximos.get("maxEnergyConsumptionAve")
+    soc_max = 100  # El máximo para el SOC es 100%
 
-        # Mostrar KPI con gráfico gauge
+    # Mostrar KPI con gráfico gauge
+    with medir("gauges eficiencia"):
         col1, col2, col3 = st.columns(3)
         # Gráficos con valores dinámicos
-        fig_soc = show_kpi_gauge("SOC Inicial (%)", df['soc'].iloc[0], 0, soc_max)
+        fig_soc = figura_memo("gauge soc", lambda: show_kpi_gauge("SOC Inicial (%)", df['soc'].iloc[0], 0, soc_max), df['soc'].iloc[0])
         col1.plotly_chart(fig_soc)
 
-        fig_eficiencia = show_kpi_gauge("Eficiencia energética (kWh/100km)", eficiencia_kwh_100km, 0, max_eff)
+        fig_eficiencia = figura_memo("gauge eficiencia", lambda: show_kpi_gauge("Eficiencia energética (kWh/100km)", eficiencia_kwh_100km, 0, max_eff), eficiencia_kwh_100km, max_eff)
         col2.plotly_chart(fig_eficiencia)
 
-        fig_distancia = show_kpi_gauge("Distancia recorrida (km)", distancia_total, 0, max_dist)
+        fig_distancia = figura_memo("gauge distancia", lambda: show_kpi_gauge("Distancia recorrida (km)", distancia_total, 0, max_dist), distancia_total, max_dist)
         col3.plotly_chart(fig_distancia)
 
-        # Gráficos interactivos con Plotly
-        col21, col22 = st.columns(2)
-        col21.subheader("🔋 Eficiencia energética (media)")
-        if not df["energyConsumption_ave"].isnull().all():
-            fig1 = px.line(df, x="evTime", y="energyConsumption_ave", title="Eficiencia energética media")
-            col21.plotly_chart(fig1)
-        else:
-            col21.warning("No hay datos para la eficiencia energética (media).")
-
-        col22.subheader("🔋 Eficiencia energética (tiempo real)")
-        if not df["energyConsumption_rt"].isnull().all():
-            fig2 = px.line(df, x="evTime", y="energyConsumption_rt", title="Eficiencia energética tiempo real")
-            col22.plotly_chart(fig2)
-        else:
-            col22.warning("No hay datos para la eficiencia energética (tiempo real).")
-
-        col31, col32 = st.columns(2)
-        col31.subheader("🚗 Velocidad del vehículo")
-        if not df["speed"].isnull().all():
-            fig3 = px.line(df, x="evTime", y="speed", title="Velocidad del vehículo")
-            col31.plotly_chart(fig3)
-        else:
-            col31.warning("No hay datos de velocidad.")
-
-        col32.subheader("🔌 Nivel de batería (SOC)")
-        if not df["soc"].isnull().all():
-            fig4 = px.line(df, x="evTime", y="soc", title="Nivel de batería (SOC)")
-            col32.plotly_chart(fig4)
-        else:
-            col32.warning("No hay datos de nivel de batería.")
-
-        col41, col42 = st.columns(2)
-        col41.subheader("🌡️ Temperatura exterior")
-        if not df["outsideTemp"].isnull().all():
-            fig5 = px.line(df, x="evTime", y="outsideTemp", title="Temperatura exterior")
-            col41.plotly_chart(fig5)
-        else:
-            col41.warning("No hay datos de temperatura exterior.")
-
-        col42.subheader("🌡️ Temperatura interior")
-        if not df["insideTemp"].isnull().all():
-            fig6 = px.line(df, x="evTime", y="insideTemp", title="Temperatura interior")
-            col42.plotly_chart(fig6)
-        else:
-            col42.warning("No hay datos de temperatura interior.")
+    show_segmentos(resultado["segmentos"], eficiencia_kwh_100km)
+
+    # Gráficos interactivos con Plotly
+    if modo_ligero:
+        # Solo la ventana horaria elegida, submuestreada a un número fijo de puntos
+        segundos = (df["evTime"] - df["evTime"].dt.normalize()).dt.total_seconds()
+        inicio = ventana[0].hour * 3600 + ventana[0].minute * 60
+        fin = ventana[1].hour * 3600 + ventana[1].minute * 60 + 60
+        df_ventana = df[(segundos >= inicio) & (segundos < fin)]
+
+        series = []
+        for columna, titulo in SERIES_EFICIENCIA:
+            if df_ventana[columna].isnull().all():
+                st.warning(f"No hay datos para {titulo} en la ventana seleccionada.")
+            else:
+                series.append((columna, titulo))
+        if series:
+            with medir("gráficos eficiencia"):
+                fig = figura_memo("series eficiencia", lambda: figura_series(df_ventana, "evTime", series, max_puntos), df_ventana, series, max_puntos)
+                st.plotly_chart(fig, use_container_width=True)
+    else:
+        with medir("gráficos eficiencia"):
+            col21, col22 = st.columns(2)
+            col21.subheader("🔋 Eficiencia energética (media)")
+            if not df["energyConsumption_ave"].isnull().all():
+                fig1 = figura_memo("linea energyConsumption_ave", lambda: px.line(df, x="evTime", y="energyConsumption_ave", title="Eficiencia energética media"), df[["evTime", "energyConsumption_ave"]])
+                col21.plotly_chart(fig1)
+            else:
+                col21.warning("No hay datos para la eficiencia energética (media).")
+
+            col22.subheader("🔋 Eficiencia energética (tiempo real)")
+            if not df["energyConsumption_rt"].isnull().all():
+                fig2 = figura_memo("linea energyConsumption_rt", lambda: px.line(df, x="evTime", y="energyConsumption_rt", title="Eficiencia energética tiempo real"), df[["evTime", "energyConsumption_rt"]])
+                col22.plotly_chart(fig2)
+            else:
+                col22.warning("No hay datos para la eficiencia energética (tiempo real).")
+
+            col31, col32 = st.columns(2)
+            col31.subheader("🚗 Velocidad del vehículo")
+            if not df["speed"].isnull().all():
+                fig3 = figura_memo("linea speed", lambda: px.line(df, x="evTime", y="speed", title="Velocidad del vehículo"), df[["evTime", "speed"]])
+                col31.plotly_chart(fig3)
+            else:
+                col31.warning("No hay datos de velocidad.")
+
+            col32.subheader("🔌 Nivel de batería (SOC)")
+            if not df["soc"].isnull().all():
+                fig4 = figura_memo("linea soc", lambda: px.line(df, x="evTime", y="soc", title="Nivel de batería (SOC)"), df[["evTime", "soc"]])
+                col32.plotly_chart(fig4)
+            else:
+                col32.warning("No hay datos de nivel de batería.")
+
+            col41, col42 = st.columns(2)
+            col41.subheader("🌡️ Temperatura exterior")
+            if not df["outsideTemp"].isnull().all():
+                fig5 = figura_memo("linea outsideTemp", lambda: px.line(df, x="evTime", y="outsideTemp", title="Temperatura exterior"), df[["evTime", "outsideTemp"]])
+                col41.plotly_chart(fig5)
+            else:
+                col41.warning("No hay datos de temperatura exterior.")
+
+            col42.subheader("🌡️ Temperatura interior")
+            if not df["insideTemp"].isnull().all():
+                fig6 = figura_memo("linea insideTemp", lambda: px.line(df, x="evTime", y="insideTemp", title="Temperatura interior"), df[["evTime", "insideTemp"]])
+                col42.plotly_chart(fig6)
+            else:
+                col42.warning("No hay datos de temperatura interior.")
+
+    _precargar_eficiencia(matricula, fecha, api_key, vecinos=True)
@@ -0,0 +1,105 @@
+# en_vivo.py
+
+import os
+import pandas as pd
+import streamlit as st
+from utils.api_client import api_get_registros
+from utils.concurrencia import lanzar_consultas
+from utils.normalizacion import normalizar_eficiencia
+from utils.resiliencia import esperar, presupuesto
+
+# Segundos entre actualizaciones automáticas del modo en vivo
+INTERVALO_EN_VIVO = float(os.environ.get("EN_VIVO_INTERVALO_SEGUNDOS", "30"))
+
+
+def actualizar_en_vivo(matricula, fecha, api_key, panel):
+    """Descargar lo nuevo del día y devolver (filas que el panel aún no ha recibido, estado del panel).
+
+    La primera vez se descarga el día completo; después solo se piden los
+    registros posteriores al último evTime visto (parámetro "desde"). Lo
+    descargado se guarda en bloques sin copiar lo anterior y cada panel
+    tiene su propio estado en la sesión, con las filas que ya ha recibido
+    ("filas") y el último evTime del día ("ultimo"); ahí guarda también lo
+    que calcula. Así un refresco cuesta según los registros nuevos y no
+    según lo que lleva el día. Lanza RequestException si la API falla o no
+    responde dentro del presupuesto de la vista.
+    """
+    en_vivo = st.session_state.setdefault("en_vivo", {})
+    clave = (matricula, fecha)
+    entrada = en_vivo.get(clave)
+    params = {"fecha": fecha.strftime("%Y-%m-%d"), "matricula": matricula}
+
+    if entrada is None:
+        df = _descargar(api_key, params)
+        # Solo se sigue un vehículo en vivo por sesión para acotar la memoria
+        en_vivo.clear()
+        entrada = en_vivo[clave] = {"bloques": [], "filas": 0, "ultimo": None, "paneles": {}, "figuras": {}}
+    else:
+        ultimo = entrada["ultimo"]
+        if ultimo is not None:
+            params["desde"] = ultimo.isoformat()
+        df = _descargar(api_key, params)
+        # Por si el backend ignora "desde", se descarta lo que ya se tenía
+        if not df.empty and ultimo is not None:
+            df = df[df["evTime"] > ultimo]
+    if not df.empty:
+        _anadir_bloque(entrada, df.sort_values("evTime", ignore_index=True))
+
+    estado = entrada["paneles"].setdefault(panel, {"filas": 0})
+    nuevas = _ultimas_filas(entrada, entrada["filas"] - estado["filas"])
+    estado["filas"] = entrada["filas"]
+    estado["ultimo"] = entrada["ultimo"]
+    return nuevas, estado
+
+
+def _anadir_bloque(entrada, df):
+    """Añadir registros al día sin copiar los anteriores.
+
+    Los dos últimos bloques se funden cuando el último alcanza al anterior,
+    así hay pocos bloques y cada fila se copia como mucho log(n) veces.
+    """
+    bloques = entrada["bloques"]
+    bloques.append(df)
+    while len(bloques) > 1 and len(bloques[-2]) <= len(bloques[-1]):
+        ultimo = bloques.pop()
+        bloques[-1] = pd.concat([bloques[-1], ultimo], ignore_index=True)
+    entrada["filas"] += len(df)
+    ultimo = df["evTime"].max()
+    if pd.notna(ultimo):
+        entrada["ultimo"] = ultimo
+
+
+def _ultimas_filas(entrada, n):
+    """Las n últimas filas del día, juntando solo los bloques que hacen falta"""
+    partes = []
+    for bloque in reversed(entrada["bloques"]):
+        if n <= 0:
+            break
+        partes.append(bloque.iloc[max(len(bloque) - n, 0):])
+        n -= len(bloque)
+    if not partes:
+        return entrada["bloques"][-1].iloc[:0] if entrada["bloques"] else pd.DataFrame()
+    return partes[0] if len(partes) == 1 else pd.concat(partes[::-1], ignore_index=True)
+
+
+def _descargar(api_key, params):
+    # Los refrescos del fragmento se ejecutan fuera del presupuesto de la página: se les da uno propio
+    with presupuesto():
+        consulta = lanzar_consultas({
+            "registros": lambda: normalizar_eficiencia(api_get_registros("BI/vehiculoiot-eficiencia", api_key, params=params)),
+        })
+        return esperar(consulta["registros"])
+
+
+def figura_en_vivo(matricula, fecha, nombre, crear, actualizar):
+    """Reutilizar la figura de la sesión actualizando sus trazas en lugar de rehacerla"""
+    figuras = st.session_state["en_vivo"][(matricula, fecha)]["figuras"]
+    fig = figuras.get(nombre)
+    if fig is None:
+        fig = crear()
+        # uirevision fijo: el navegador conserva el zoom entre actualizaciones
+        fig.update_layout(uirevision=nombre)
+        figuras[nombre] = fig
+    else:
+        actualizar(fig)
+    return fig
@@ -0,0 +1,84 @@
+# estado_timeline.py
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+# Señales de estado y colores de cada valor
+SENALES_ESTADO = {
+    "gbStatus": {"Start": "#2ca02c", "Stop": "#7f7f7f"},
+    "gbCharge": {"Exceptions": "#d62728", "Charging": "#1f77b4", "Complete": "#17becf", "Not in Charging": "#c7c7c7"},
+    "evStatus": {"Charging": "#1f77b4", "Parking": "#bcbd22", "Driving": "#ff7f0e"},
+}
+
+
+def intervalos_estado(tiempos, estados):
+    """Comprimir una serie de estados en intervalos (inicio, fin, estado).
+
+    Cada tramo de muestras consecutivas con el mismo estado se convierte en
+    un solo intervalo que dura hasta la primera muestra del siguiente. Se
+    hace con numpy sobre los códigos de la categoría, sin bucles por fila.
+    """
+    estados = pd.Series(estados).astype("category")
+    codigos = estados.cat.codes.to_numpy()
+    tiempos = pd.Series(tiempos).reset_index(drop=True)
+    if len(codigos) == 0:
+        return pd.DataFrame({"inicio": pd.Series(dtype=tiempos.dtype), "fin": pd.Series(dtype=tiempos.dtype), "estado": pd.Series(dtype="category")})
+
+    inicios = np.concatenate([[0], np.flatnonzero(codigos[1:] != codigos[:-1]) + 1])
+    fines = np.concatenate([inicios[1:], [len(codigos) - 1]])
+    intervalos = pd.DataFrame({
+        "inicio": tiempos.iloc[inicios].to_numpy(),
+        "fin": tiempos.iloc[fines].to_numpy(),
+        "estado": pd.Categorical.from_codes(codigos[inicios], categories=estados.cat.categories),
+    })
+    # Los tramos sin dato (código -1) no son un estado
+    return intervalos[codigos[inicios] >= 0].reset_index(drop=True)
+
+
+def timeline_estados(df_status):
+    """Intervalos de todas las señales de estado en una sola tabla"""
+    df_status = df_status.sort_values("evTime")
+    intervalos = []
+    for senal in SENALES_ESTADO:
+        if senal in df_status:
+            tramo = intervalos_estado(df_status["evTime"], df_status[senal])
+            tramo["estado"] = tramo["estado"].astype(str)
+            intervalos.append(tramo.assign(senal=senal))
+    if not intervalos:
+        return pd.DataFrame(columns=["senal", "estado", "inicio", "fin", "duracion"])
+    timeline = pd.concat(intervalos, ignore_index=True)
+    timeline["duracion"] = timeline["fin"] - timeline["inicio"]
+    return timeline[["senal", "estado", "inicio", "fin", "duracion"]]
+
+
+def duraciones_por_estado(timeline):
+    """Tiempo total en cada estado de cada señal"""
+    return (
+        timeline.groupby(["senal", "estado"], observed=True)["duracion"]
+        .sum()
+        .reset_index()
+        .sort_values(["senal", "duracion"], ascending=[True, False], ignore_index=True)
+    )
+
+
+def figura_timeline(timeline):
+    """Diagrama tipo Gantt con una fila por señal y un color por estado"""
+    colores = {estado: color for valores in SENALES_ESTADO.values() for estado, color in valores.items()}
+    fig = px.timeline(
+        timeline,
+        x_start="inicio",
+        x_end="fin",
+        y="senal",
+        color="estado",
+        color_discrete_map=colores,
+        category_orders={"senal": list(SENALES_ESTADO)},
+    )
+    fig.update_layout(
+        xaxis_title="Hora",
+        yaxis_title=None,
+        height=300,
+        margin=dict(t=30),
+        legend=dict(orientation="h", y=-0.3),
+    )
+    return fig
@@ -0,0 +1,210 @@
+# exportacion.py
+
+import importlib.util
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import streamlit as st
+from utils import informes
+from utils.flota import obtener_flota
+
+# Directorio donde se dejan los ficheros exportados hasta que caducan
+EXPORTAR_DIR = Path(os.environ.get("EXPORTAR_DIR", ".cache/exportaciones"))
+# Procesos que generan informes a la vez entre todas las sesiones
+EXPORTAR_MAX_PROCESOS = int(os.environ.get("EXPORTAR_MAX_PROCESOS", "2"))
+# Exportaciones sin terminar que puede tener una sesión
+EXPORTAR_MAX_POR_SESION = int(os.environ.get("EXPORTAR_MAX_POR_SESION", "2"))
+# Horas que se conservan los ficheros generados
+EXPORTAR_TTL_HORAS = float(os.environ.get("EXPORTAR_TTL_HORAS", "24"))
+# Segundos entre refrescos de la lista mientras hay exportaciones en curso
+INTERVALO_ESTADO = 2
+
+# El Excel necesita XlsxWriter, que es opcional
+FORMATOS = ("csv", "parquet", "xlsx") if importlib.util.find_spec("xlsxwriter") else ("csv", "parquet")
+ETIQUETAS_FORMATO = {"csv": "CSV", "parquet": "Parquet", "xlsx": "Excel (con gráficos)"}
+TIPOS_MIME = {
+    ".csv": "text/csv",
+    ".parquet": "application/vnd.apache.parquet",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    ".zip": "application/zip",
+}
+
+_pool = None
+_lock_pool = threading.Lock()
+_lock = threading.Lock()
+_trabajos = {}
+
+
+def _bajar_prioridad():
+    """Los procesos de exportación ceden la CPU al servidor de Streamlit"""
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def _get_pool(nuevo=False):
+    global _pool
+    with _lock_pool:
+        if _pool is None or nuevo:
+            # spawn: el proceso de Streamlit tiene hilos y no es seguro hacer fork de él
+            _pool = ProcessPoolExecutor(
+                max_workers=EXPORTAR_MAX_PROCESOS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_bajar_prioridad,
+            )
+    return _pool
+
+
+def _limpiar():
+    """Borrar los trabajos terminados que han caducado y sus ficheros"""
+    limite = time.time() - EXPORTAR_TTL_HORAS * 3600
+    with _lock:
+        caducados = [id_ for id_, trabajo in _trabajos.items() if trabajo["futuro"].done() and trabajo["inicio"] < limite]
+        for id_ in caducados:
+            del _trabajos[id_]
+        activos = set(_trabajos)
+    if EXPORTAR_DIR.is_dir():
+        for directorio in EXPORTAR_DIR.iterdir():
+            if directorio.name not in activos and directorio.stat().st_mtime < limite:
+                shutil.rmtree(directorio, ignore_errors=True)
+
+
+def lanzar_exportacion(pedido, descripcion):
+    """Encolar un informe en el pool de procesos y devolver el id del trabajo"""
+    _limpiar()
+    id_ = uuid.uuid4().hex[:12]
+    directorio = EXPORTAR_DIR / id_
+    directorio.mkdir(parents=True, exist_ok=True)
+    try:
+        futuro = _get_pool().submit(informes.generar_informe, pedido, str(directorio))
+    except BrokenProcessPool:
+        # Un proceso murió (p. ej. sin memoria): se rehace el pool y se vuelve a intentar
+        futuro = _get_pool(nuevo=True).submit(informes.generar_informe, pedido, str(directorio))
+    with _lock:
+        _trabajos[id_] = {"id": id_, "descripcion": descripcion, "inicio": time.time(), "directorio": directorio, "futuro": futuro}
+    return id_
+
+
+def estado_exportacion(id_):
+    """Estado de un trabajo: en cola, en curso, terminado o error, con su avance y resultado"""
+    trabajo = _trabajos.get(id_)
+    if trabajo is None:
+        return None
+    futuro = trabajo["futuro"]
+    estado = {"descripcion": trabajo["descripcion"], "inicio": trabajo["inicio"]}
+    if not futuro.done():
+        try:
+            estado.update(json.loads((trabajo["directorio"] / "progreso.json").read_text()))
+            estado["estado"] = "en curso"
+        except (OSError, ValueError):
+            estado["estado"] = "en cola"
+    elif futuro.exception() is not None:
+        estado["estado"] = "error"
+        estado["error"] = str(futuro.exception()) or type(futuro.exception()).__name__
+    else:
+        estado["estado"] = "terminado"
+        estado.update(futuro.result())
+    return estado
+
+
+def _exportaciones_sesion():
+    """Trabajos de esta sesión que siguen existiendo, del más reciente al más antiguo"""
+    ids = [id_ for id_ in st.session_state.get("exportaciones", []) if id_ in _trabajos]
+    st.session_state["exportaciones"] = ids
+    return ids[::-1]
+
+
+def _pendientes(ids):
+    trabajos = [_trabajos.get(id_) for id_ in ids]
+    return [trabajo["id"] for trabajo in trabajos if trabajo is not None and not trabajo["futuro"].done()]
+
+
+def _mostrar_exportaciones(ids):
+    for id_ in ids:
+        estado = estado_exportacion(id_)
+        if estado is None:
+            continue
+        col1, col2 = st.columns([3, 1])
+        col1.write(f"**{estado['descripcion']}**")
+        if estado["estado"] == "en cola":
+            col1.caption("⏳ En cola")
+        elif estado["estado"] == "en curso":
+            total = estado.get("total") or 1
+            col1.progress(min(estado.get("hechos", 0) / total, 1.0), text=f"Procesados {estado.get('hechos', 0)} de {estado.get('total', 0)}")
+        elif estado["estado"] == "error":
+            col1.error(f"❌ La exportación falló: {estado['error']}")
+        else:
+            filas = ", ".join(f"{tabla}: {n}" for tabla, n in estado["filas"].items())
+            col1.caption(f"✅ Terminado en {time.time() - estado['inicio']:.0f} s · filas {filas}")
+            for aviso in estado["avisos"]:
+                col1.warning(aviso)
+            if estado["errores"]:
+                col1.warning(f"Faltan {len(estado['errores'])} consultas que fallaron: " + "; ".join(estado["errores"][:5]))
+            ruta = Path(estado["fichero"])
+            if ruta.exists():
+                # El fichero solo se lee cuando se pulsa el botón
+                col2.download_button(
+                    "⬇️ Descargar", lambda ruta=ruta: ruta.read_bytes(), file_name=ruta.name,
+                    mime=TIPOS_MIME.get(ruta.suffix), key=f"descargar_{id_}", on_click="ignore",
+                )
+            else:
+                col2.caption("Fichero caducado")
+
+
+@st.fragment(run_every=INTERVALO_ESTADO)
+def _exportaciones_en_curso(ids):
+    """Lista que se refresca sola mientras quede algún trabajo sin terminar"""
+    _mostrar_exportaciones(ids)
+    if not _pendientes(ids):
+        st.rerun()
+
+
+def panel_exportacion(informe, fecha, api_key, matricula=None, rango=None, opciones=None):
+    """Formulario para exportar un informe en segundo plano y lista de exportaciones de la sesión.
+
+    Con matrícula se puede elegir entre ese vehículo y toda la flota; con
+    rango se usan las fechas de la vista en lugar de pedirlas. opciones
+    son parámetros propios del informe que se añaden al pedido.
+    """
+    with st.expander("📤 Exportar informe"):
+        if rango is None:
+            col1, col2 = st.columns(2)
+            desde = col1.date_input("Desde", fecha, key=f"exportar_{informe}_desde")
+            hasta = col2.date_input("Hasta", fecha, key=f"exportar_{informe}_hasta")
+        else:
+            desde, hasta = rango
+        flota = False
+        if matricula is not None:
+            flota = st.radio("Alcance", [matricula, "Toda la flota"], horizontal=True, key=f"exportar_{informe}_alcance") != matricula
+        formato = st.selectbox("Formato", FORMATOS, format_func=ETIQUETAS_FORMATO.get, key=f"exportar_{informe}_formato")
+
+        if st.button("Generar informe", key=f"exportar_{informe}_generar"):
+            en_curso = _pendientes(_exportaciones_sesion())
+            if desde > hasta:
+                st.error("La fecha de inicio no puede ser posterior a la de fin.")
+            elif len(en_curso) >= EXPORTAR_MAX_POR_SESION:
+                st.warning(f"Ya hay {len(en_curso)} exportaciones en curso; espera a que termine alguna.")
+            else:
+                if flota:
+                    matriculas = [veh["matricula"] for veh in obtener_flota(api_key)["vehiculos"]]
+                else:
+                    matriculas = [matricula] if matricula is not None else []
+                pedido = {"informe": informe, "matriculas": matriculas, "desde": desde, "hasta": hasta, "formato": formato, "api_key": api_key}
+                pedido.update(opciones or {})
+                alcance = "flota" if flota or matricula is None else matricula
+                descripcion = f"{informe} · {alcance} · {desde:%Y-%m-%d} a {hasta:%Y-%m-%d} · {ETIQUETAS_FORMATO[formato]}"
+                st.session_state.setdefault("exportaciones", []).append(lanzar_exportacion(pedido, descripcion))
+
+        ids = _exportaciones_sesion()
+        if _pendientes(ids):
+            _exportaciones_en_curso(ids)
+        else:
+            _mostrar_exportaciones(ids)
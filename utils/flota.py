@@ -0,0 +1,55 @@
+# flota.py
+
+import os
+import requests
+import streamlit as st
+from utils.api_client import api_get_json
+from utils.cache import CacheTTL
+from utils.concurrencia import lanzar_consultas
+from utils.resiliencia import esperar
+
+# Segundos que se reutiliza la lista de vehículos antes de volver a pedirla
+FLOTA_TTL = float(os.environ.get("FLOTA_TTL_SEGUNDOS", "300"))
+
+_cache_flota = CacheTTL(FLOTA_TTL, nombre="lista de vehículos")
+
+
+def _cargar_flota(api_key):
+    # busqueda importa numpy: se carga al pedir la flota y no al abrir la aplicación
+    from utils.busqueda import construir_indice
+
+    vehiculos = api_get_json("vehiculos", api_key)
+    return {
+        "vehiculos": vehiculos,
+        "indice": {veh["matricula"]: veh for veh in vehiculos},
+        # El índice de búsqueda se rehace solo cuando se recarga la flota
+        "busqueda": construir_indice(vehiculos),
+    }
+
+
+def obtener_flota(api_key):
+    """Obtener la lista de vehículos, su índice por matrícula y el de búsqueda (cacheados con TTL)"""
+    flota = _cache_flota.get(api_key)
+    if flota is not None:
+        return flota
+    # La carga va al pool de consultas para que un backend colgado no pase del presupuesto de la vista
+    consulta = lanzar_consultas({
+        "flota": lambda: _cache_flota.get_or_load(api_key, lambda: _cargar_flota(api_key), obsoleto=True),
+    })
+    try:
+        return esperar(consulta["flota"])
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error al obtener los vehículos: {e}")
+        from utils.busqueda import construir_indice
+
+        return {"vehiculos": [], "indice": {}, "busqueda": construir_indice([])}
+
+
+def obtener_vehiculos(api_key):
+    """Obtener los vehículos desde la API"""
+    return obtener_flota(api_key)["vehiculos"]
+
+
+def invalidar_flota(api_key=None):
+    """Forzar que la próxima consulta vuelva a pedir la lista de vehículos"""
+    _cache_flota.invalidar(api_key)
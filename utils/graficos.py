@@ -0,0 +1,139 @@
+# graficos.py
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from utils.soc_eventos import SOC_UMBRAL
+
+# Puntos por serie que se envían al navegador en el modo ligero
+MAX_PUNTOS_POR_DEFECTO = 2000
+
+# Series de la telemetría que se dibujan: (columna, título)
+SERIES_EFICIENCIA = [
+    ("energyConsumption_ave", "🔋 Eficiencia energética (media)"),
+    ("energyConsumption_rt", "🔋 Eficiencia energética (tiempo real)"),
+    ("speed", "🚗 Velocidad del vehículo"),
+    ("soc", "🔌 Nivel de batería (SOC)"),
+    ("outsideTemp", "🌡️ Temperatura exterior"),
+    ("insideTemp", "🌡️ Temperatura interior"),
+]
+
+
+def indices_min_max(y, max_puntos):
+    """Índices que conservan el mínimo y el máximo de cada cubeta.
+
+    Divide la serie en max_puntos / 2 cubetas consecutivas y se queda con
+    el punto más bajo y el más alto de cada una, así los picos no se
+    pierden al reducir la serie. Todo se hace con numpy, sin bucles.
+    """
+    y = np.asarray(y, dtype="float64")
+    validos = np.flatnonzero(~np.isnan(y))
+    n = len(validos)
+    if n <= max_puntos:
+        return validos
+
+    cubetas = max(max_puntos // 2, 1)
+    limites = np.linspace(0, n, cubetas + 1).astype(np.int64)
+    cubeta = np.repeat(np.arange(cubetas), np.diff(limites))
+
+    # Ordenar por (cubeta, valor): el primero de cada cubeta es el mínimo y el último el máximo
+    orden = np.lexsort((y[validos], cubeta))
+    minimos = orden[limites[:-1]]
+    maximos = orden[limites[1:] - 1]
+    return validos[np.unique(np.concatenate([minimos, maximos]))]
+
+
+def submuestrear(df, x, columna, max_puntos):
+    """Devolver (x, y) de una columna reducidos a como mucho max_puntos"""
+    indices = indices_min_max(df[columna].to_numpy(dtype="float64", na_value=np.nan), max_puntos)
+    return df[x].iloc[indices], df[columna].iloc[indices]
+
+
+def figura_series(df, x, series, max_puntos=MAX_PUNTOS_POR_DEFECTO, columnas=2, altura_fila=300):
+    """Figura WebGL con un panel por serie y el eje X compartido.
+
+    series es una lista de (columna, título). Cada serie se submuestrea
+    por separado, así que el tamaño de la figura no depende del número
+    de muestras del vehículo.
+    """
+    puntos = [submuestrear(df, x, columna, max_puntos) for columna, _ in series]
+    return figura_puntos(puntos, [titulo for _, titulo in series], columnas, altura_fila)
+
+
+def figura_puntos(puntos, titulos, columnas=2, altura_fila=300):
+    """Figura de figura_series a partir de los (x, y) ya submuestreados de cada serie"""
+    filas = -(-len(titulos) // columnas)
+    fig = make_subplots(
+        rows=filas,
+        cols=columnas,
+        shared_xaxes="all",
+        subplot_titles=titulos,
+        vertical_spacing=0.08,
+    )
+    for i, ((xs, ys), titulo) in enumerate(zip(puntos, titulos)):
+        fig.add_trace(
+            go.Scattergl(x=xs, y=ys, mode="lines", name=titulo),
+            row=i // columnas + 1,
+            col=i % columnas + 1,
+        )
+    fig.update_layout(height=altura_fila * filas, showlegend=False, hovermode="x unified")
+    fig.update_xaxes(showticklabels=True)
+    return fig
+
+
+def actualizar_puntos(fig, puntos):
+    """Sustituir los (x, y) de las trazas de figura_puntos"""
+    for traza, (xs, ys) in zip(fig.data, puntos):
+        traza.update(x=xs, y=ys)
+
+
+def acumular_series(puntos, df, x, series, max_puntos=MAX_PUNTOS_POR_DEFECTO):
+    """Añadir filas nuevas a series ya submuestreadas sin volver a recorrer las anteriores.
+
+    puntos es lo devuelto por la llamada anterior (None la primera vez).
+    Solo se submuestrean las filas nuevas; cuando lo acumulado pasa de
+    2 * max_puntos se vuelve a reducir, lo que conserva los mínimos y
+    máximos. El coste depende de las filas nuevas y de max_puntos, no de
+    las muestras que ya lleva la serie.
+    """
+    acumulados = []
+    for i, (columna, _) in enumerate(series):
+        xs, ys = submuestrear(df, x, columna, max_puntos)
+        if puntos is not None:
+            xs = pd.concat([puntos[i][0], xs], ignore_index=True)
+            ys = pd.concat([puntos[i][1], ys], ignore_index=True)
+        if len(ys) > 2 * max_puntos:
+            indices = indices_min_max(ys.to_numpy(dtype="float64", na_value=np.nan), max_puntos)
+            xs, ys = xs.iloc[indices].reset_index(drop=True), ys.iloc[indices].reset_index(drop=True)
+        acumulados.append((xs, ys))
+    return acumulados
+
+
+def figura_soc(df):
+    """Gráfico del SOC por bins: media, banda min-max y puntos por debajo del umbral de SOC bajo"""
+    low_soc_points = df[df['avgSOC'] < SOC_UMBRAL]
+
+    fig_soc = go.Figure()
+    fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["avgSOC"], mode="lines", name="SOC promedio", line=dict(color="blue")))
+    fig_soc.add_trace(go.Scatter(x=low_soc_points["timestamp"], y=low_soc_points["avgSOC"], mode="markers", name=f"SOC bajo (bajo {SOC_UMBRAL:g}%)", marker=dict(color="red", size=10, symbol="x")))
+    fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["maxSOC"], mode="lines", name="SOC máximo", line=dict(width=0), showlegend=False))
+    fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["minSOC"], mode="lines", name="SOC mínimo", fill='tonexty', fillcolor='rgba(0,100,80,0.2)', line=dict(width=0), showlegend=False))
+
+    fig_soc.update_layout(
+        title="SOC durante el día",
+        xaxis_title="Hora",
+        yaxis_title="SOC (%)",
+        height=500,
+        hovermode="x unified"
+    )
+    return fig_soc
+
+
+def actualizar_figura_soc(fig_soc, df):
+    """Sustituir los datos de las trazas de figura_soc sin rehacer la figura"""
+    low_soc_points = df[df['avgSOC'] < SOC_UMBRAL]
+    fig_soc.data[0].update(x=df["timestamp"], y=df["avgSOC"])
+    fig_soc.data[1].update(x=low_soc_points["timestamp"], y=low_soc_points["avgSOC"])
+    fig_soc.data[2].update(x=df["timestamp"], y=df["maxSOC"])
+    fig_soc.data[3].update(x=df["timestamp"], y=df["minSOC"])
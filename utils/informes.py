@@ -0,0 +1,255 @@
+# informes.py
+
+import io
+import json
+import os
+import re
+import zipfile
+from pathlib import Path
+import pandas as pd
+import plotly.graph_objects as go
+import requests
+from utils.concurrencia import ejecutar_lote
+from utils.estado_timeline import duraciones_por_estado, timeline_estados
+from utils.graficos import SERIES_EFICIENCIA, figura_series, figura_soc
+from utils.normalizacion import normalizar_eficiencia, normalizar_estado
+from utils.segmentacion import resumen_segmentos, segmentar
+from utils.soc_bins import bins_soc, obtener_piramide_soc
+from utils.soc_eventos import SOC_DURACION_MIN_SEGUNDOS, SOC_HISTERESIS, SOC_UMBRAL, detectar_eventos, series_soc_bajo
+from utils.telemetria import obtener_telemetria
+from utils.tendencia import agregado_dia
+
+# Vehículos/días que descarga a la vez cada proceso de exportación
+EXPORTAR_MAX_CONCURRENCIA = int(os.environ.get("EXPORTAR_MAX_CONCURRENCIA", "4"))
+# Gráficos que se incrustan como imagen en un Excel como mucho
+EXPORTAR_MAX_GRAFICOS = int(os.environ.get("EXPORTAR_MAX_GRAFICOS", "20"))
+# Tamaño del bin (min) de la tabla de SOC exportada
+EXPORTAR_BIN_SOC = int(os.environ.get("EXPORTAR_BIN_SOC", "5"))
+
+# Filas de datos que caben en una hoja de Excel (la primera es la cabecera)
+EXCEL_MAX_FILAS = 1_048_575
+
+
+def _por_vehiculo_y_dia(funcion, matriculas, dias, al_avanzar):
+    """Aplicar funcion(matricula, dia) a todas las combinaciones; devuelve resultados y errores"""
+    pares = [(matricula, dia) for matricula in matriculas for dia in dias]
+    resultados, errores = {}, []
+    lote = ejecutar_lote(lambda par: funcion(*par), pares, EXPORTAR_MAX_CONCURRENCIA)
+    for i, (par, valor, error) in enumerate(lote, 1):
+        if isinstance(error, requests.exceptions.RequestException):
+            errores.append(f"{par[0]} {par[1]:%Y-%m-%d}: {error}")
+        elif error is not None:
+            raise error
+        elif valor is not None:
+            resultados[par] = valor
+        al_avanzar(i, len(pares))
+    # El orden de llegada depende de la red: se ordena por vehículo y día
+    return dict(sorted(resultados.items())), errores
+
+
+def _concatenar(frames, columnas=None):
+    if not frames:
+        return pd.DataFrame(columns=columnas)
+    return pd.concat(frames, ignore_index=True)
+
+
+def informe_eficiencia(matriculas, dias, api_key, detalle, al_avanzar):
+    """Resumen diario, tramos y (con detalle) telemetría de eficiencia de los vehículos"""
+    def vehiculo_dia(matricula, dia):
+        df = obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, dia, api_key, normalizar_eficiencia)
+        if df.empty:
+            return None
+        # Como en la vista, sin evStatus los tramos se separan por velocidad, kilometraje y SOC
+        try:
+            df_estado = obtener_telemetria("BI/vehiculoiot-status", matricula, dia, api_key, normalizar_estado)
+        except requests.exceptions.RequestException:
+            df_estado = None
+        return {"df": df if detalle else None, "agregado": agregado_dia(df), "segmentos": segmentar(df, df_estado)}
+
+    resultados, errores = _por_vehiculo_y_dia(vehiculo_dia, matriculas, dias, al_avanzar)
+
+    filas, segmentos, telemetria = [], [], []
+    for (matricula, dia), valor in resultados.items():
+        resumen = resumen_segmentos(valor["segmentos"]).set_index("tipo")
+        horas = resumen["horas"] if len(resumen) else pd.Series(dtype="float64")
+        filas.append({
+            "matricula": matricula,
+            "fecha": dia,
+            **valor["agregado"],
+            "kwh_100km_conduccion": resumen["kwh_100km"].get("conducción") if len(resumen) else None,
+            "horas_conduccion": horas.get("conducción", 0.0),
+            "horas_carga": horas.get("carga", 0.0),
+            "horas_parado": horas.get("parado", 0.0),
+        })
+        segmentos.append(valor["segmentos"].assign(fecha=dia))
+        if detalle:
+            telemetria.append(valor["df"].assign(matricula=matricula, fecha=dia))
+
+    tablas = {"resumen": pd.DataFrame(filas), "segmentos": _concatenar(segmentos)}
+    if detalle:
+        tablas["telemetria"] = _concatenar(telemetria)
+        graficos = [
+            (f"{matricula} {dia:%Y-%m-%d}", lambda df=valor["df"]: figura_series(df, "evTime", SERIES_EFICIENCIA))
+            for (matricula, dia), valor in resultados.items()
+        ]
+    else:
+        # Para la flota, una caja por día con la dispersión del consumo entre vehículos
+        resumen = tablas["resumen"]
+        graficos = [("kWh/100km de la flota", lambda: go.Figure(
+            go.Box(x=resumen["fecha"], y=resumen["kwh_100km"], name="kWh/100km"),
+            layout=dict(title="kWh/100km por día (flota)", yaxis_title="kWh/100km"),
+        ))] if len(resumen) else []
+    return tablas, graficos, errores
+
+
+def informe_soc(matriculas, dias, api_key, al_avanzar):
+    """SOC por bins y tiempo en cada estado de los vehículos"""
+    def vehiculo_dia(matricula, dia):
+        piramide = obtener_piramide_soc(matricula, dia, api_key)
+        if piramide is None:
+            return None
+        try:
+            df_estado = obtener_telemetria("BI/vehiculoiot-status", matricula, dia, api_key, normalizar_estado)
+        except requests.exceptions.RequestException:
+            df_estado = pd.DataFrame()
+        duraciones = duraciones_por_estado(timeline_estados(df_estado)) if not df_estado.empty else None
+        return {"bins": bins_soc(piramide, EXPORTAR_BIN_SOC), "duraciones": duraciones}
+
+    resultados, errores = _por_vehiculo_y_dia(vehiculo_dia, matriculas, dias, al_avanzar)
+
+    soc, estados = [], []
+    for (matricula, dia), valor in resultados.items():
+        soc.append(valor["bins"].assign(matricula=matricula, fecha=dia))
+        if valor["duraciones"] is not None:
+            duraciones = valor["duraciones"]
+            estados.append(duraciones.assign(
+                matricula=matricula, fecha=dia, horas=duraciones["duracion"].dt.total_seconds() / 3600,
+            ).drop(columns="duracion"))
+
+    tablas = {
+        "soc": _concatenar(soc, ["timestamp", "minSOC", "avgSOC", "maxSOC", "count", "matricula", "fecha"]),
+        "estados": _concatenar(estados, ["senal", "estado", "matricula", "fecha", "horas"]),
+    }
+    graficos = [
+        (f"{matricula} {dia:%Y-%m-%d}", lambda df=valor["bins"]: figura_soc(df))
+        for (matricula, dia), valor in resultados.items()
+    ]
+    return tablas, graficos, errores
+
+
+def informe_low_soc(dias, api_key, politica, al_avanzar):
+    """Eventos de SOC bajo de la flota en el rango con la política de alerta de la vista"""
+    umbral = politica.get("umbral", SOC_UMBRAL)
+    series, errores = series_soc_bajo(dias, api_key, umbral, al_avanzar, EXPORTAR_MAX_CONCURRENCIA)
+    eventos = detectar_eventos(
+        series, umbral, politica.get("histeresis", SOC_HISTERESIS), politica.get("duracion_min", SOC_DURACION_MIN_SEGUNDOS),
+    )
+    por_dia = eventos.groupby(eventos["inicio"].dt.strftime("%Y-%m-%d"))["matricula"].nunique()
+    graficos = [("SOC bajo por día", lambda: go.Figure(
+        go.Bar(x=por_dia.index, y=por_dia.to_numpy()),
+        layout=dict(title=f"Vehículos que bajan del {umbral:g}% de SOC por día", yaxis_title="Vehículos"),
+    ))] if len(por_dia) else []
+    return {"eventos": eventos}, graficos, errores
+
+
+def _para_excel(df):
+    """Excel no admite zonas horarias ni duraciones: hora local sin zona y minutos"""
+    df = df.copy()
+    for columna in df.columns:
+        if isinstance(df[columna].dtype, pd.DatetimeTZDtype):
+            df[columna] = df[columna].dt.tz_localize(None)
+        elif pd.api.types.is_timedelta64_dtype(df[columna]):
+            df[f"{columna}_min"] = df.pop(columna).dt.total_seconds() / 60
+    return df
+
+
+def _escribir_excel(ruta, tablas, graficos, avisos):
+    with pd.ExcelWriter(ruta, engine="xlsxwriter") as writer:
+        for nombre, df in tablas.items():
+            if len(df) > EXCEL_MAX_FILAS:
+                avisos.append(f"La hoja {nombre} se ha recortado a {EXCEL_MAX_FILAS} de {len(df)} filas; "
+                              "exporta en CSV o Parquet para tenerlas todas.")
+                df = df.iloc[:EXCEL_MAX_FILAS]
+            _para_excel(df).to_excel(writer, sheet_name=nombre, index=False)
+
+        if len(graficos) > EXPORTAR_MAX_GRAFICOS:
+            avisos.append(f"Solo se incluyen los primeros {EXPORTAR_MAX_GRAFICOS} de {len(graficos)} gráficos.")
+        hoja = None
+        for i, (titulo, construir) in enumerate(graficos[:EXPORTAR_MAX_GRAFICOS]):
+            # La imagen estática necesita kaleido; sin él el Excel se genera solo con las tablas
+            try:
+                imagen = construir().to_image(format="png", width=1200, height=700)
+            except Exception as e:
+                avisos.append("No se pudieron generar las imágenes de los gráficos: " + " ".join(str(e).split()))
+                break
+            if hoja is None:
+                hoja = writer.book.add_worksheet("graficos")
+            hoja.write(i * 38, 0, titulo)
+            hoja.insert_image(i * 38 + 1, 0, f"{i}.png", {"image_data": io.BytesIO(imagen), "x_scale": 0.8, "y_scale": 0.8})
+
+
+def _escribir_tabla(df, destino, formato):
+    if formato == "csv":
+        df.to_csv(destino, index=False)
+    else:
+        df.to_parquet(destino, index=False)
+
+
+def escribir_informe(nombre, tablas, graficos, formato, directorio, avisos):
+    """Guardar las tablas en un fichero (o un zip si son varias) y devolver su ruta"""
+    if formato == "xlsx":
+        ruta = directorio / f"{nombre}.xlsx"
+        _escribir_excel(ruta, tablas, graficos, avisos)
+    elif len(tablas) == 1:
+        ruta = directorio / f"{nombre}.{formato}"
+        _escribir_tabla(next(iter(tablas.values())), ruta, formato)
+    else:
+        ruta = directorio / f"{nombre}.zip"
+        with zipfile.ZipFile(ruta, "w", compression=zipfile.ZIP_DEFLATED) as archivo:
+            for tabla, df in tablas.items():
+                with archivo.open(f"{tabla}.{formato}", "w") as destino:
+                    _escribir_tabla(df, destino, formato)
+    return ruta
+
+
+def generar_informe(pedido, directorio):
+    """Punto de entrada de los procesos de exportación.
+
+    pedido indica el informe ("eficiencia", "soc" o "low_soc"), las
+    matrículas, el rango de fechas, el formato y la clave de la API (y para
+    "low_soc", el umbral, la histéresis y la duración mínima). El
+    avance se va escribiendo en progreso.json dentro del directorio del
+    trabajo y el fichero final se deja en ese mismo directorio; al proceso
+    de Streamlit solo vuelve un diccionario pequeño con su ruta.
+    """
+    directorio = Path(directorio)
+    progreso = directorio / "progreso.json"
+
+    def al_avanzar(hechos, total):
+        tmp = progreso.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"hechos": hechos, "total": total}))
+        os.replace(tmp, progreso)
+
+    informe = pedido["informe"]
+    dias = list(pd.date_range(pedido["desde"], pedido["hasta"]).date)
+    matriculas = pedido.get("matriculas") or []
+    if informe == "eficiencia":
+        # La telemetría completa solo se incluye para un vehículo; para la flota sería enorme
+        tablas, graficos, errores = informe_eficiencia(matriculas, dias, pedido["api_key"], len(matriculas) == 1, al_avanzar)
+    elif informe == "soc":
+        tablas, graficos, errores = informe_soc(matriculas, dias, pedido["api_key"], al_avanzar)
+    elif informe == "low_soc":
+        tablas, graficos, errores = informe_low_soc(dias, pedido["api_key"], pedido, al_avanzar)
+    else:
+        raise ValueError(f"Informe desconocido: {informe}")
+
+    alcance = matriculas[0] if len(matriculas) == 1 else "flota"
+    nombre = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{informe}_{alcance}_{pedido['desde']:%Y%m%d}-{pedido['hasta']:%Y%m%d}")
+    avisos = []
+    ruta = escribir_informe(nombre, tablas, graficos, pedido["formato"], directorio, avisos)
+    return {
+        "fichero": str(ruta),
+        "filas": {tabla: len(df) for tabla, df in tablas.items()},
+        "errores": errores,
+        "avisos": avisos,
+    }
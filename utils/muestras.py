@@ -0,0 +1,31 @@
+# muestras.py
+
+import numpy as np
+import pandas as pd
+
+
+def ordenar_muestras(df, columnas=("evTime",)):
+    """Preparar la telemetría de uno o varios vehículos para recorrerla con numpy.
+
+    Quita las muestras sin valor en `columnas` y ordena por matrícula (si
+    la hay) e instante. Devuelve (df, vehiculo, matriculas, zona, t):
+    vehiculo es el código entero del vehículo de cada muestra, matriculas
+    la matrícula de cada código, zona la zona horaria de evTime y t los
+    instantes como datetime64 en UTC (con zona horaria numpy devolvería
+    objetos).
+    """
+    orden = ["matricula", "evTime"] if "matricula" in df.columns else ["evTime"]
+    df = df.dropna(subset=list(columnas)).sort_values(orden, kind="stable")
+    if "matricula" in df.columns:
+        vehiculo, matriculas = pd.factorize(df["matricula"])
+    else:
+        vehiculo, matriculas = np.zeros(len(df), dtype=np.int64), np.array([None], dtype=object)
+    zona = df["evTime"].dt.tz
+    t = df["evTime"].to_numpy(dtype="datetime64[ns]")
+    return df, vehiculo, np.asarray(matriculas, dtype=object), zona, t
+
+
+def instantes(valores, zona):
+    """Instantes datetime64 en UTC de vuelta como serie en la zona horaria original"""
+    serie = pd.Series(valores)
+    return serie.dt.tz_localize("UTC").dt.tz_convert(zona) if zona is not None else serie
@@ -0,0 +1,109 @@
+# normalizacion.py
+
+from itertools import islice
+import numpy as np
+import pandas as pd
+
+# Esquemas columna -> (ruta dentro de cada registro JSON, tipo)
+# Solo se conservan los campos que usan las vistas.
+ESQUEMA_EFICIENCIA = {
+    "evTime": (("evTime",), "fecha"),
+    "mileage": (("mileage",), "float64"),
+    "soc": (("soc",), "float32"),
+    "speed": (("speed",), "float32"),
+    "energyConsumption_ave": (("energyConsumption", "ave"), "float32"),
+    "energyConsumption_rt": (("energyConsumption", "rt"), "float32"),
+    "outsideTemp": (("outsideTemp",), "float32"),
+    "insideTemp": (("insideTemp",), "float32"),
+}
+
+ESQUEMA_ESTADO = {
+    "evTime": (("evTime",), "fecha"),
+    "gbStatus": (("gbStatus",), "categoria"),
+    "gbCharge": (("gbCharge",), "categoria"),
+    "evStatus": (("evStatus",), "categoria"),
+}
+
+ESQUEMA_LOW_SOC = {
+    "fecha": (("fecha",), "texto"),
+    "matricula": (("matricula",), "texto"),
+    "minSoc": (("minSoc",), "float32"),
+}
+
+# Registros JSON que se convierten a columnas de una vez
+TAMANO_BLOQUE = 20000
+
+
+def _extraer(datos, ruta):
+    """Lista con el valor de la ruta en cada registro (None si falta)"""
+    if len(ruta) == 1:
+        clave = ruta[0]
+        return [registro.get(clave) for registro in datos]
+    padre, clave = ruta
+    return [(registro.get(padre) or {}).get(clave) for registro in datos]
+
+
+def convertir_columna(valores, tipo):
+    """Convertir una columna en bruto al tipo compacto del esquema"""
+    if tipo == "fecha":
+        # Formato explícito: evita que pandas tenga que adivinarlo fila a fila
+        return pd.to_datetime(pd.Series(valores, dtype=object), format="ISO8601", errors="coerce")
+    if tipo in ("texto", "categoria"):
+        # Las categorías se fijan al final, cuando ya se han unido todos los bloques
+        return pd.Series(valores, dtype=object)
+    try:
+        # Vía rápida: numpy convierte la lista entera de una vez (None -> NaN)
+        return pd.Series(np.array(valores, dtype=tipo))
+    except (TypeError, ValueError):
+        return pd.to_numeric(pd.Series(valores), errors="coerce").astype(tipo)
+
+
+def _construir_bloque(datos, esquema):
+    return pd.DataFrame({
+        nombre: convertir_columna(_extraer(datos, ruta), tipo)
+        for nombre, (ruta, tipo) in esquema.items()
+    })
+
+
+def construir_dataframe(registros, esquema, tamano_bloque=TAMANO_BLOQUE):
+    """Construir un DataFrame columna a columna según el esquema, sin .apply por fila.
+
+    registros puede ser una lista o un iterador (p. ej. una respuesta leída
+    en streaming). Se procesa por bloques, así que como mucho hay
+    tamano_bloque registros JSON vivos a la vez junto a las columnas ya
+    compactadas.
+    """
+    iterador = iter(registros)
+    bloques = []
+    while True:
+        bloque = list(islice(iterador, tamano_bloque))
+        if not bloque:
+            break
+        bloques.append(_construir_bloque(bloque, esquema))
+        del bloque
+    if not bloques:
+        df = _construir_bloque([], esquema)
+    elif len(bloques) == 1:
+        df = bloques[0]
+    else:
+        df = pd.concat(bloques, ignore_index=True)
+
+    for nombre, (_, tipo) in esquema.items():
+        if tipo == "categoria":
+            df[nombre] = df[nombre].astype("category")
+    return df
+
+
+def normalizar_eficiencia(datos):
+    """DataFrame plano a partir de la respuesta de vehiculoiot-eficiencia"""
+    return construir_dataframe(datos, ESQUEMA_EFICIENCIA)
+
+
+def normalizar_estado(datos):
+    """DataFrame plano a partir de la respuesta de vehiculoiot-status"""
+    return construir_dataframe(datos, ESQUEMA_ESTADO)
+
+
+def normalizar_low_soc(datos):
+    """DataFrame plano a partir de la respuesta de vehiculoiot-low-soc"""
+    return construir_dataframe(datos, ESQUEMA_LOW_SOC)
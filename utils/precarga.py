@@ -0,0 +1,97 @@
+# precarga.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+import streamlit as st
+from utils.concurrencia import consultas_activas
+from utils.rendimiento import medir
+
+# Hilos dedicados a la precarga: pocos, para no competir con las consultas de las vistas
+PRECARGA_MAX_HILOS = int(os.environ.get("PRECARGA_MAX_HILOS", "2"))
+# Tareas en cola como máximo entre todas las sesiones; el resto se descarta
+PRECARGA_MAX_PENDIENTES = int(os.environ.get("PRECARGA_MAX_PENDIENTES", "32"))
+# Segundos que una tarea cede el paso como máximo a las consultas de las vistas
+PRECARGA_ESPERA_MAX = float(os.environ.get("PRECARGA_ESPERA_MAX", "10"))
+
+_executor = None
+_lock_executor = threading.Lock()
+_lock = threading.Lock()
+_en_curso = {}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock_executor:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PRECARGA_MAX_HILOS, thread_name_prefix="precarga")
+    return _executor
+
+
+def _ejecutar(clave, funcion):
+    # Las consultas que el usuario está esperando tienen prioridad
+    limite = time.monotonic() + PRECARGA_ESPERA_MAX
+    while consultas_activas() and time.monotonic() < limite:
+        time.sleep(0.05)
+
+    # Un fallo en la precarga no importa: la vista volverá a pedir el dato si lo necesita
+    try:
+        with medir("precarga", clave=str(clave[0])):
+            funcion()
+    except Exception:
+        pass
+    finally:
+        with _lock:
+            _en_curso.pop(clave, None)
+
+
+def _encolar(clave, funcion):
+    with _lock:
+        futuro = _en_curso.get(clave)
+        if futuro is not None:
+            return futuro
+        if len(_en_curso) >= PRECARGA_MAX_PENDIENTES:
+            return None
+        # Sin copiar el contexto: la precarga no debe contar en el render de la vista
+        futuro = _get_executor().submit(_ejecutar, clave, funcion)
+        _en_curso[clave] = futuro
+        return futuro
+
+
+def precargar(tareas):
+    """Calentar las cachés en segundo plano con las tareas de la selección actual.
+
+    Recibe un diccionario clave -> función sin argumentos. Las tareas que la
+    sesión había encolado para una selección anterior y que aún no han
+    empezado se cancelan. Una tarea ya en curso con la misma clave (de esta
+    o de otra sesión) no se vuelve a lanzar.
+    """
+    propias = st.session_state.setdefault("precarga", {})
+    for clave in list(propias):
+        if clave not in tareas:
+            futuro = propias.pop(clave)
+            if futuro.cancel():
+                with _lock:
+                    if _en_curso.get(clave) is futuro:
+                        del _en_curso[clave]
+
+    for clave, funcion in tareas.items():
+        if clave in propias:
+            continue
+        futuro = _encolar(clave, funcion)
+        if futuro is not None:
+            propias[clave] = futuro
+
+
+def dias_vecinos(fecha):
+    """Día anterior y siguiente de una fecha, sin pasar del día de hoy"""
+    return [dia for dia in (fecha + timedelta(days=1), fecha - timedelta(days=1)) if dia <= date.today()]
+
+
+def pendientes():
+    """Número de tareas de precarga en cola o en curso"""
+    with _lock:
+        return len(_en_curso)
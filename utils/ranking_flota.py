@@ -0,0 +1,138 @@
+# ranking_flota.py
+
+import os
+import streamlit as st
+import requests
+import pandas as pd
+from utils import almacen
+from utils.concurrencia import ejecutar_lote
+from utils.flota import obtener_vehiculos
+from utils.normalizacion import normalizar_eficiencia
+from utils.rendimiento import medir
+from utils.resiliencia import hay_obsoletos
+from utils.resultados import guardar_resultado, obtener_resultado
+from utils.segmentacion import resumen_segmentos, segmentar
+from utils.telemetria import obtener_telemetria
+
+# Consultas simultáneas al backend durante el cálculo del ranking
+RANKING_MAX_CONCURRENCIA = int(os.environ.get("RANKING_MAX_CONCURRENCIA", "8"))
+
+# Columnas de la telemetría que necesitan el ranking y la segmentación en trayectos
+COLUMNAS_RANKING = ["evTime", "mileage", "soc", "speed", "energyConsumption_ave", "energyConsumption_rt"]
+
+
+def calcular_ranking(df):
+    """Agregar la telemetría de todos los vehículos en un solo groupby.
+
+    Usa la misma fórmula que la vista de eficiencia: distancia = máx - mín
+    de mileage y kWh/100km = media de energyConsumption_ave / distancia * 100.
+    """
+    agregado = df.groupby("matricula", observed=True).agg(
+        mileage_min=("mileage", "min"),
+        mileage_max=("mileage", "max"),
+        consumo_medio=("energyConsumption_ave", "mean"),
+        muestras=("mileage", "size"),
+    )
+    agregado["distancia_km"] = agregado["mileage_max"] - agregado["mileage_min"]
+    distancia = agregado["distancia_km"].where(agregado["distancia_km"] > 0)
+    agregado["kwh_100km"] = agregado["consumo_medio"] / distancia * 100
+
+    # Valores atípicos por rango intercuartílico
+    q1, q3 = agregado["kwh_100km"].quantile([0.25, 0.75])
+    iqr = q3 - q1
+    agregado["atipico"] = (agregado["kwh_100km"] < q1 - 1.5 * iqr) | (agregado["kwh_100km"] > q3 + 1.5 * iqr)
+
+    # Consumo solo en conducción: toda la flota se segmenta en un único lote
+    resumen = resumen_segmentos(segmentar(df))
+    conduccion = resumen[resumen["tipo"] == "conducción"].set_index("matricula")
+    agregado["kwh_100km_conduccion"] = conduccion["kwh_100km"].reindex(agregado.index.astype(str)).to_numpy()
+    agregado["horas_conduccion"] = conduccion["horas"].reindex(agregado.index.astype(str)).to_numpy()
+
+    agregado = agregado.sort_values("kwh_100km", na_position="last").reset_index()
+    agregado.insert(0, "posicion", range(1, len(agregado) + 1))
+    return agregado[["posicion", "matricula", "distancia_km", "consumo_medio", "kwh_100km",
+                     "kwh_100km_conduccion", "horas_conduccion", "muestras", "atipico"]]
+
+
+def show_ranking_flota(fecha_default, api_key):
+    st.title("🏆 Ranking de eficiencia de la flota")
+
+    vehiculos = obtener_vehiculos(api_key)
+    if not vehiculos:
+        st.warning("No se encontraron vehículos.")
+        return
+
+    fecha = st.date_input("Fecha", fecha_default)
+
+    if st.button("Calcular ranking"):
+        st.session_state["ranking_consulta"] = fecha
+
+    # El ranking calculado se conserva en los reruns mientras no cambie la fecha
+    if st.session_state.get("ranking_consulta") != fecha:
+        return
+
+    clave = ("ranking", fecha)
+    ranking = obtener_resultado(clave)
+    if ranking is None and almacen.dia_completo(fecha):
+        # Día ingestado: toda la flota sale de una sola consulta al almacén local
+        with medir("almacén ranking"):
+            df = almacen.telemetria_flota(fecha, COLUMNAS_RANKING)
+        if df.empty:
+            st.warning("No se encontraron datos para ese día.")
+            return
+        ranking = guardar_resultado(clave, calcular_ranking(df))
+
+    if ranking is None:
+        matriculas = [veh["matricula"] for veh in vehiculos]
+
+        def consultar(matricula):
+            df = obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, fecha, api_key, normalizar_eficiencia)
+            return df[COLUMNAS_RANKING] if not df.empty else None
+
+        progreso = st.progress(0.0, text="Consultando vehículos...")
+        frames = {}
+        errores = 0
+        for i, (matricula, df, error) in enumerate(ejecutar_lote(consultar, matriculas, RANKING_MAX_CONCURRENCIA), 1):
+            if isinstance(error, requests.exceptions.RequestException):
+                errores += 1
+            elif error is not None:
+                raise error
+            elif df is not None:
+                frames[matricula] = df
+            progreso.progress(i / len(matriculas), text=f"Consultados {i} de {len(matriculas)} vehículos")
+        progreso.empty()
+
+        if errores:
+            st.warning(f"No se pudieron consultar {errores} vehículos.")
+        if not frames:
+            st.warning("No se encontraron datos para ese día.")
+            return
+
+        df = pd.concat(frames, names=["matricula"]).reset_index(level=0)
+        df["matricula"] = df["matricula"].astype("category")
+        ranking = calcular_ranking(df)
+        # Un ranking incompleto o con datos caducados no se guarda para volver a pedirlos
+        if not errores and not hay_obsoletos():
+            guardar_resultado(clave, ranking)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Vehículos con datos", len(ranking))
+    col2.metric("Mediana kWh/100km", f"{ranking['kwh_100km'].median():.2f}")
+    col3.metric("Valores atípicos", int(ranking["atipico"].sum()))
+
+    st.subheader("📋 Ranking (pulsa en una columna para ordenar)")
+    st.dataframe(
+        ranking,
+        hide_index=True,
+        column_config={
+            "posicion": st.column_config.NumberColumn("Posición"),
+            "matricula": st.column_config.TextColumn("Matrícula"),
+            "distancia_km": st.column_config.NumberColumn("Distancia (km)", format="%.2f"),
+            "consumo_medio": st.column_config.NumberColumn("Consumo medio", format="%.2f"),
+            "kwh_100km": st.column_config.NumberColumn("kWh/100km", format="%.2f"),
+            "kwh_100km_conduccion": st.column_config.NumberColumn("kWh/100km en conducción", format="%.2f"),
+            "horas_conduccion": st.column_config.NumberColumn("Horas conduciendo", format="%.1f"),
+            "muestras": st.column_config.NumberColumn("Muestras"),
+            "atipico": st.column_config.CheckboxColumn("Atípico"),
+        },
+    )
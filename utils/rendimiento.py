@@ -0,0 +1,164 @@
+# rendimiento.py
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+import streamlit as st
+
+# Fichero de log en formato JSON lines (vacío para desactivarlo)
+RENDIMIENTO_LOG = os.environ.get("RENDIMIENTO_LOG", "logs/rendimiento.jsonl")
+# Al llegar a este tamaño el log se rota y se conservan RENDIMIENTO_LOG_COPIAS ficheros anteriores
+RENDIMIENTO_LOG_MAX_MB = float(os.environ.get("RENDIMIENTO_LOG_MAX_MB", "10"))
+RENDIMIENTO_LOG_COPIAS = int(os.environ.get("RENDIMIENTO_LOG_COPIAS", "5"))
+# Renders recientes por vista que se usan para calcular p50/p95
+RENDIMIENTO_HISTORICO = int(os.environ.get("RENDIMIENTO_HISTORICO", "500"))
+
+# Etapas del render en curso; se propaga a los hilos de concurrencia.py
+_render_actual = contextvars.ContextVar("render_actual", default=None)
+
+_lock = threading.Lock()
+_latencias = defaultdict(lambda: deque(maxlen=RENDIMIENTO_HISTORICO))
+_contadores = defaultdict(lambda: {"llamadas": 0, "segundos": 0.0, "bytes": 0})
+
+
+@contextmanager
+def medir(etapa, **extra):
+    """Medir la duración de una etapa y registrarla en el render actual.
+
+    Devuelve un diccionario en el que la etapa puede anotar "bytes" u
+    otros datos antes de terminar.
+    """
+    registro = {"etapa": etapa, **extra}
+    inicio = time.perf_counter()
+    try:
+        yield registro
+    finally:
+        registro["segundos"] = time.perf_counter() - inicio
+        with _lock:
+            contador = _contadores[etapa]
+            contador["llamadas"] += 1
+            contador["segundos"] += registro["segundos"]
+            contador["bytes"] += registro.get("bytes") or 0
+        render = _render_actual.get()
+        if render is not None:
+            render["etapas"].append(registro)
+
+
+def sumar_bytes(registro, n):
+    """Anotar bytes en una etapa ya cerrada, p. ej. una respuesta que se lee en streaming después"""
+    registro["bytes"] = (registro.get("bytes") or 0) + n
+    with _lock:
+        _contadores[registro["etapa"]]["bytes"] += n
+
+
+def iniciar_render(vista):
+    """Empezar a registrar las etapas del render de una vista"""
+    render = {"vista": vista, "inicio": time.time(), "t0": time.perf_counter(), "etapas": []}
+    _render_actual.set(render)
+    return render
+
+
+def finalizar_render(render):
+    """Cerrar el render, guardar su latencia y escribirlo en el log"""
+    render["segundos"] = time.perf_counter() - render.pop("t0")
+    _render_actual.set(None)
+    with _lock:
+        _latencias[render["vista"]].append(render["segundos"])
+    _escribir_log(render)
+    return render
+
+
+def _escribir_log(render):
+    if not RENDIMIENTO_LOG:
+        return
+    linea = json.dumps({
+        "ts": render["inicio"],
+        "vista": render["vista"],
+        "segundos": round(render["segundos"], 4),
+        "etapas": [
+            {k: (round(v, 4) if isinstance(v, float) else v) for k, v in etapa.items()}
+            for etapa in render["etapas"]
+        ],
+    }, ensure_ascii=False, default=str)
+    try:
+        log = _obtener_log()
+    except OSError:
+        return
+    log.info(linea)
+
+
+def _obtener_log():
+    """Logger que escribe las líneas tal cual en RENDIMIENTO_LOG, rotándolo por tamaño"""
+    log = logging.getLogger("rendimiento")
+    with _lock:
+        # El logger sobrevive a que Streamlit recargue el módulo: el manejador se añade una vez
+        if not log.handlers:
+            ruta = Path(RENDIMIENTO_LOG)
+            ruta.parent.mkdir(parents=True, exist_ok=True)
+            manejador = RotatingFileHandler(
+                ruta, maxBytes=int(RENDIMIENTO_LOG_MAX_MB * 1024 * 1024),
+                backupCount=RENDIMIENTO_LOG_COPIAS, encoding="utf-8", delay=True,
+            )
+            manejador.setFormatter(logging.Formatter("%(message)s"))
+            log.setLevel(logging.INFO)
+            log.propagate = False
+            log.addHandler(manejador)
+    return log
+
+
+def resumen_etapas(render):
+    """DataFrame con la duración y los bytes de cada etapa de un render"""
+    # pandas se importa aquí para no cargarlo en páginas que no lo usan
+    import pandas as pd
+
+    df = pd.DataFrame(render["etapas"], columns=["etapa", "segundos", "bytes"])
+    df["ms"] = (df["segundos"] * 1000).round(1)
+    return df[["etapa", "ms", "bytes"]]
+
+
+def percentiles_vistas():
+    """p50/p95 de la latencia de render de cada vista en este proceso"""
+    import pandas as pd
+
+    with _lock:
+        latencias = {vista: list(valores) for vista, valores in _latencias.items()}
+    filas = [
+        {
+            "vista": vista,
+            "renders": len(valores),
+            "p50_ms": round(pd.Series(valores).quantile(0.5) * 1000, 1),
+            "p95_ms": round(pd.Series(valores).quantile(0.95) * 1000, 1),
+        }
+        for vista, valores in latencias.items() if valores
+    ]
+    return pd.DataFrame(filas, columns=["vista", "renders", "p50_ms", "p95_ms"])
+
+
+def contadores():
+    """Contadores acumulados por etapa (llamadas, segundos, bytes)"""
+    with _lock:
+        return {etapa: dict(valores) for etapa, valores in _contadores.items()}
+
+
+def mostrar_panel(render):
+    """Panel "Rendimiento" en la barra lateral con el último render y los percentiles"""
+    from utils import cache_disco
+    from utils.resiliencia import estado_circuitos
+
+    with st.sidebar.expander("⏱️ Rendimiento", expanded=True):
+        st.metric("Último render", f"{render['segundos'] * 1000:.0f} ms")
+        if render["etapas"]:
+            st.dataframe(resumen_etapas(render), hide_index=True)
+        st.caption("Latencia por vista (este proceso)")
+        st.dataframe(percentiles_vistas(), hide_index=True)
+        cache = cache_disco.estadisticas()
+        st.caption(f"Caché en disco: {cache['aciertos']} aciertos, {cache['fallos']} fallos, {cache['desalojos']} desalojos")
+        for endpoint, estado in estado_circuitos().items():
+            st.caption(f"⚡ Circuito {estado}: {endpoint}")
@@ -0,0 +1,204 @@
+# resiliencia.py
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import requests
+
+# Fallos seguidos de un endpoint que abren su circuito
+CIRCUITO_FALLOS = int(os.environ.get("CIRCUITO_FALLOS", "5"))
+# Segundos que un circuito abierto rechaza peticiones antes de dejar pasar una de prueba
+CIRCUITO_ESPERA = float(os.environ.get("CIRCUITO_ESPERA_SEGUNDOS", "30"))
+# Segundos que una vista espera como mucho al backend en cada render
+PRESUPUESTO_VISTA = float(os.environ.get("PRESUPUESTO_VISTA_SEGUNDOS", "15"))
+# Las vistas que recorren rangos de días o toda la flota tienen más margen
+PRESUPUESTO_RANGOS = float(os.environ.get("PRESUPUESTO_RANGOS_SEGUNDOS", "60"))
+# Un dato caducado se sirve al momento si no tiene más antigüedad que esto (s); si la tiene,
+# se espera a la recarga y solo se usa cuando el backend falla
+OBSOLETO_MAX_SEGUNDOS = float(os.environ.get("OBSOLETO_MAX_SEGUNDOS", "900"))
+# Hilos que recargan en segundo plano los datos servidos caducados
+REVALIDAR_MAX_HILOS = int(os.environ.get("REVALIDAR_MAX_HILOS", "2"))
+
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """El endpoint ha fallado demasiadas veces seguidas y no se le envían peticiones"""
+
+
+class PresupuestoAgotado(requests.exceptions.Timeout):
+    """La vista ha agotado el tiempo que puede esperar al backend"""
+
+
+class Circuito:
+    """Cortacircuitos de un endpoint.
+
+    Cerrado deja pasar todas las peticiones. Tras `fallos` fallos seguidos
+    se abre y rechaza todo durante `espera` segundos; después deja pasar
+    una sola petición de prueba (semiabierto): si va bien se cierra y si
+    falla vuelve a abrirse.
+    """
+
+    def __init__(self, nombre, fallos=CIRCUITO_FALLOS, espera=CIRCUITO_ESPERA):
+        self.nombre = nombre
+        self.fallos = fallos
+        self.espera = espera
+        self._fallos = 0
+        self._abierto_hasta = 0.0
+        self._probando = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Lanzar CircuitoAbierto si ahora no se puede llamar al endpoint"""
+        with self._lock:
+            if self._fallos < self.fallos:
+                return
+            ahora = time.monotonic()
+            if ahora < self._abierto_hasta or self._probando:
+                raise CircuitoAbierto(
+                    f"{self.nombre}: el backend está fallando; se volverá a intentar "
+                    f"en {max(self._abierto_hasta - ahora, 0):.0f} s"
+                )
+            self._probando = True
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._probando = False
+
+    def descartar(self):
+        """La petición se abandonó sin saber si el endpoint funciona: no cuenta como éxito ni como fallo"""
+        with self._lock:
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._probando = False
+            if self._fallos >= self.fallos:
+                self._abierto_hasta = time.monotonic() + self.espera
+
+    def estado(self):
+        with self._lock:
+            if self._fallos < self.fallos:
+                return "cerrado"
+            if self._probando or time.monotonic() >= self._abierto_hasta:
+                return "semiabierto"
+            return "abierto"
+
+
+_circuitos = {}
+_lock = threading.Lock()
+
+
+def circuito(endpoint):
+    """Circuito compartido por todas las sesiones para un endpoint"""
+    with _lock:
+        return _circuitos.setdefault(endpoint, Circuito(endpoint))
+
+
+def estado_circuitos():
+    """Diccionario endpoint -> estado de los circuitos que no están cerrados"""
+    with _lock:
+        circuitos = list(_circuitos.values())
+    return {c.nombre: estado for c in circuitos if (estado := c.estado()) != "cerrado"}
+
+
+# Límite de espera del render en curso y datos caducados que se le han servido
+_limite = contextvars.ContextVar("limite_vista", default=None)
+_obsoletos = contextvars.ContextVar("obsoletos", default=None)
+
+
+@contextmanager
+def presupuesto(segundos=PRESUPUESTO_VISTA):
+    """Acotar lo que el render de una vista espera al backend.
+
+    Dentro del bloque esperar() y ejecutar_lote() dejan de esperar cuando
+    se agota el tiempo. Las consultas que siguen en marcha terminan en
+    segundo plano y su resultado queda en caché para el siguiente rerun.
+    """
+    # Un presupuesto dentro de otro nunca lo amplía
+    limite = time.monotonic() + segundos
+    if _limite.get() is not None:
+        limite = min(limite, _limite.get())
+    token_limite = _limite.set(limite)
+    token_obsoletos = _obsoletos.set(_obsoletos.get() if _obsoletos.get() is not None else [])
+    try:
+        yield
+    finally:
+        _obsoletos.reset(token_obsoletos)
+        _limite.reset(token_limite)
+
+
+def restante():
+    """Segundos que le quedan al render o None si no hay presupuesto"""
+    limite = _limite.get()
+    return None if limite is None else max(limite - time.monotonic(), 0)
+
+
+def esperar(futuro):
+    """Resultado de un Future sin pasar del presupuesto de la vista"""
+    try:
+        return futuro.result(timeout=restante())
+    except TimeoutError:
+        raise PresupuestoAgotado("El backend está tardando demasiado en responder") from None
+
+
+def marcar_obsoleto(descripcion, guardado):
+    """Anotar que el render muestra un dato caducado (guardado: time.time() de cuando se obtuvo)"""
+    obsoletos = _obsoletos.get()
+    if obsoletos is not None:
+        obsoletos.append((descripcion, guardado))
+
+
+def hay_obsoletos():
+    """True si en este render se ha servido algún dato caducado"""
+    return bool(_obsoletos.get())
+
+
+def mostrar_obsoletos(contenedor):
+    """Avisar de los datos caducados que se muestran mientras se actualizan"""
+    obsoletos = _obsoletos.get()
+    if not obsoletos:
+        return
+    detalle = ", ".join(
+        f"{descripcion} (de hace {max(time.time() - guardado, 0) / 60:.0f} min)"
+        for descripcion, guardado in dict(obsoletos).items()
+    )
+    contenedor.info(f"🕒 Se muestran datos guardados: {detalle}. Se están actualizando en segundo plano; "
+                    "vuelve a consultar en unos segundos para ver los nuevos.")
+
+
+_executor = None
+_lock_executor = threading.Lock()
+_revalidando = set()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _lock_executor:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=REVALIDAR_MAX_HILOS, thread_name_prefix="revalidar")
+    return _executor
+
+
+def revalidar(clave, funcion):
+    """Recargar en segundo plano un dato servido caducado, una sola vez aunque lo pidan varias sesiones"""
+    with _lock:
+        if clave in _revalidando:
+            return
+        _revalidando.add(clave)
+
+    def ejecutar():
+        # Si falla se sigue sirviendo el dato anterior hasta el siguiente intento
+        try:
+            funcion()
+        except Exception:
+            pass
+        finally:
+            with _lock:
+                _revalidando.discard(clave)
+
+    _get_executor().submit(ejecutar)
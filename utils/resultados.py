@@ -0,0 +1,78 @@
+# resultados.py
+
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Memoria máxima de resultados y figuras guardados por sesión
+RESULTADOS_SESION_MB = float(os.environ.get("RESULTADOS_SESION_MB", "200"))
+
+
+def _tamano(valor):
+    """Estimación de los bytes que ocupa un resultado"""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, dict):
+        return sum(_tamano(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sum(_tamano(v) for v in valor)
+    return 1024
+
+
+def _almacen():
+    return st.session_state.setdefault("resultados", OrderedDict())
+
+
+def obtener_resultado(clave):
+    """Devolver un resultado ya calculado en esta sesión o None"""
+    almacen = _almacen()
+    entrada = almacen.get(clave)
+    if entrada is None:
+        return None
+    almacen.move_to_end(clave)
+    return entrada[0]
+
+
+def guardar_resultado(clave, valor, tamano=None):
+    """Guardar un resultado; si se supera el presupuesto se descartan los menos usados"""
+    almacen = _almacen()
+    almacen[clave] = (valor, _tamano(valor) if tamano is None else tamano)
+    almacen.move_to_end(clave)
+
+    limite = RESULTADOS_SESION_MB * 1024 * 1024
+    total = sum(tamano for _, tamano in almacen.values())
+    while total > limite and len(almacen) > 1:
+        _, (_, tamano) = almacen.popitem(last=False)
+        total -= tamano
+    return valor
+
+
+def huella(*partes):
+    """Hash estable de DataFrames y parámetros para memoizar figuras"""
+    h = hashlib.blake2b(digest_size=16)
+    for parte in partes:
+        if isinstance(parte, (pd.DataFrame, pd.Series)):
+            h.update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+            h.update(repr(list(parte.columns) if isinstance(parte, pd.DataFrame) else parte.name).encode())
+        elif isinstance(parte, np.ndarray):
+            h.update(parte.tobytes())
+        else:
+            h.update(repr(parte).encode())
+    return h.hexdigest()
+
+
+def figura_memo(nombre, construir, *datos):
+    """Devolver la figura ya construida para los mismos datos o construirla una vez.
+
+    Las figuras comparten con los resultados el presupuesto de memoria de la
+    sesión; su tamaño se estima una vez, al construirlas, por su JSON.
+    """
+    clave = ("figura", nombre, huella(*datos))
+    fig = obtener_resultado(clave)
+    if fig is None:
+        fig = construir()
+        guardar_resultado(clave, fig, len(fig.to_json()))
+    return fig
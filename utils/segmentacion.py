@@ -0,0 +1,161 @@
+# segmentacion.py
+
+import os
+import numpy as np
+import pandas as pd
+from utils.muestras import instantes, ordenar_muestras
+
+# Velocidad (km/h) a partir de la cual una muestra cuenta como conducción
+VELOCIDAD_MIN = float(os.environ.get("SEGMENTOS_VELOCIDAD_MIN", "2"))
+# Paradas más cortas que esto (s) entre dos tramos de conducción forman parte del trayecto
+PARADA_MIN_SEGUNDOS = float(os.environ.get("SEGMENTOS_PARADA_MIN_SEGUNDOS", "300"))
+# Sin evStatus, una parada en la que el SOC sube al menos esto (puntos) se considera carga
+CARGA_MIN_SOC = float(os.environ.get("SEGMENTOS_CARGA_MIN_SOC", "1"))
+
+CONDUCCION, CARGA, PARADO = 0, 1, 2
+TIPOS = np.array(["conducción", "carga", "parado"], dtype=object)
+
+COLUMNAS_SEGMENTO = [
+    "matricula", "tipo", "inicio", "fin", "duracion", "distancia_km",
+    "soc_inicio", "soc_fin", "delta_soc", "kwh_100km", "energia_kwh", "muestras",
+]
+
+
+def _sin_segmentos(zona="UTC"):
+    """Tabla de segmentos vacía con los mismos tipos que una con datos"""
+    instante = pd.DatetimeTZDtype(tz=zona) if zona is not None else np.dtype("datetime64[ns]")
+    columnas = {
+        "matricula": object, "tipo": object, "inicio": instante, "fin": instante,
+        "duracion": "timedelta64[ns]", "muestras": "int64",
+    }
+    return pd.DataFrame({
+        columna: pd.Series(dtype=columnas.get(columna, "float64")) for columna in COLUMNAS_SEGMENTO
+    })
+
+
+def _tramos(tipo, vehiculo):
+    """Índice de inicio y de fin de cada racha de muestras con el mismo tipo y vehículo"""
+    cambio = np.empty(len(tipo), dtype=bool)
+    cambio[0] = True
+    cambio[1:] = (tipo[1:] != tipo[:-1]) | (vehiculo[1:] != vehiculo[:-1])
+    inicios = np.flatnonzero(cambio)
+    return inicios, np.append(inicios[1:] - 1, len(tipo) - 1)
+
+
+def _fin_tramos(t, vehiculo, inicios, ultimos):
+    """Un tramo acaba donde empieza el siguiente del mismo vehículo o en su última muestra"""
+    siguiente = np.append(inicios[1:], len(t) - 1)
+    mismo = np.append(vehiculo[inicios[1:]] == vehiculo[inicios[:-1]], False)
+    return np.where(mismo, t[siguiente], t[ultimos])
+
+
+def _estado_por_muestra(df, df_estado):
+    """evStatus vigente en cada muestra de eficiencia (último cambio anterior)"""
+    por = ["matricula"] if "matricula" in df.columns and "matricula" in df_estado.columns else None
+    estado = df_estado[[*(por or []), "evTime", "evStatus"]].dropna(subset=["evTime"]).sort_values("evTime")
+    izquierda = df[[*(por or []), "evTime"]].reset_index(drop=True)
+    if por:
+        izquierda["matricula"] = izquierda["matricula"].astype(str)
+        estado = estado.assign(matricula=estado["matricula"].astype(str))
+    unido = pd.merge_asof(izquierda.reset_index().sort_values("evTime"), estado, on="evTime", by=por, direction="backward")
+    return unido.sort_values("index")["evStatus"].astype(object).to_numpy()
+
+
+def segmentar(df, df_estado=None, velocidad_min=VELOCIDAD_MIN, parada_min=PARADA_MIN_SEGUNDOS):
+    """Dividir la telemetría en trayectos de conducción, cargas y paradas.
+
+    df es la telemetría de eficiencia de un vehículo o, con una columna
+    matricula, de toda la flota. Una muestra es conducción si el vehículo
+    se mueve (velocidad o kilometraje), carga si evStatus lo indica y
+    parada en otro caso. Las paradas cortas dentro de un trayecto no lo
+    cortan. Todo se calcula con operaciones vectorizadas sobre las
+    muestras y las rachas, sin recorrer filas en Python.
+
+    kWh/100km de cada tramo es la media de energyConsumption_rt ponderada
+    por los kilómetros recorridos entre muestras.
+    """
+    if df.empty:
+        return _sin_segmentos()
+
+    df, vehiculo, matriculas, zona, t = ordenar_muestras(df)
+    if df.empty:
+        return _sin_segmentos(zona)
+    km = df["mileage"].to_numpy(dtype="float64", na_value=np.nan)
+    soc = df["soc"].to_numpy(dtype="float64", na_value=np.nan)
+    velocidad = df["speed"].to_numpy(dtype="float64", na_value=np.nan)
+    consumo = df["energyConsumption_rt"].to_numpy(dtype="float64", na_value=np.nan)
+
+    # Kilómetros desde la muestra anterior del mismo vehículo (sin saltos negativos)
+    dkm = np.zeros(len(df))
+    dkm[1:] = np.diff(km)
+    dkm[np.r_[True, vehiculo[1:] != vehiculo[:-1]]] = 0
+    dkm = np.clip(np.nan_to_num(dkm), 0, None)
+
+    tipo = np.full(len(df), PARADO, dtype=np.int8)
+    if df_estado is not None and not df_estado.empty:
+        estado = _estado_por_muestra(df, df_estado)
+        tipo[estado == "Charging"] = CARGA
+        tipo[estado == "Driving"] = CONDUCCION
+    tipo[(velocidad > velocidad_min) | (dkm > 0.001)] = CONDUCCION
+
+    # Paradas cortas entre dos rachas de conducción del mismo vehículo se unen al trayecto
+    inicios, ultimos = _tramos(tipo, vehiculo)
+    fin = _fin_tramos(t, vehiculo, inicios, ultimos)
+    duracion = (fin - t[inicios]) / np.timedelta64(1, "s")
+    tipo_tramo = tipo[inicios]
+    vehiculo_tramo = vehiculo[inicios]
+    anterior = np.r_[PARADO, tipo_tramo[:-1]]
+    siguiente = np.r_[tipo_tramo[1:], PARADO]
+    mismo_anterior = np.r_[False, vehiculo_tramo[1:] == vehiculo_tramo[:-1]]
+    mismo_siguiente = np.r_[vehiculo_tramo[1:] == vehiculo_tramo[:-1], False]
+    corta = (
+        (tipo_tramo == PARADO) & (duracion < parada_min)
+        & (anterior == CONDUCCION) & (siguiente == CONDUCCION) & mismo_anterior & mismo_siguiente
+    )
+    tipo_tramo = np.where(corta, CONDUCCION, tipo_tramo)
+
+    # Sin evStatus, una parada en la que sube el SOC es una carga
+    if df_estado is None or df_estado.empty:
+        sube = (soc[ultimos] - soc[inicios]) >= CARGA_MIN_SOC
+        tipo_tramo = np.where((tipo_tramo == PARADO) & sube, CARGA, tipo_tramo)
+
+    tipo = np.repeat(tipo_tramo, ultimos - inicios + 1)
+    inicios, ultimos = _tramos(tipo, vehiculo)
+    fin = _fin_tramos(t, vehiculo, inicios, ultimos)
+
+    distancia = np.add.reduceat(dkm, inicios)
+    ponderado = np.add.reduceat(np.nan_to_num(consumo) * dkm, inicios)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        kwh_100km = np.where(distancia > 0, ponderado / distancia, np.nan)
+
+    segmentos = pd.DataFrame({
+        "matricula": matriculas[vehiculo[inicios]],
+        "tipo": TIPOS[tipo[inicios]],
+        "inicio": instantes(t[inicios], zona),
+        "fin": instantes(fin, zona),
+        "duracion": pd.Series(fin - t[inicios]),
+        "distancia_km": distancia,
+        "soc_inicio": soc[inicios],
+        "soc_fin": soc[ultimos],
+        "delta_soc": soc[ultimos] - soc[inicios],
+        "kwh_100km": kwh_100km,
+        "energia_kwh": kwh_100km * distancia / 100,
+        "muestras": ultimos - inicios + 1,
+    })
+    return segmentos
+
+
+def resumen_segmentos(segmentos):
+    """Totales por vehículo y tipo: número de tramos, horas, km y kWh/100km ponderado"""
+    agregado = segmentos.assign(horas=segmentos["duracion"].dt.total_seconds() / 3600).groupby(
+        ["matricula", "tipo"], dropna=False
+    ).agg(
+        tramos=("tipo", "size"),
+        horas=("horas", "sum"),
+        distancia_km=("distancia_km", "sum"),
+        energia_kwh=("energia_kwh", "sum"),
+        delta_soc=("delta_soc", "sum"),
+    ).reset_index()
+    distancia = agregado["distancia_km"].where(agregado["distancia_km"] > 0)
+    agregado["kwh_100km"] = agregado["energia_kwh"] / distancia * 100
+    return agregado
@@ -0,0 +1,126 @@
+# soc_bins.py
+
+import os
+import numpy as np
+import pandas as pd
+from utils import cache_disco
+from utils.cache import CacheTTL
+from utils.normalizacion import normalizar_eficiencia
+from utils.telemetria import obtener_telemetria
+
+# Tamaños de bin (min) que se precalculan al cargar un vehículo/día
+NIVELES_PIRAMIDE = (1, 5, 15, 60)
+
+_cache_piramides = CacheTTL(
+    float(os.environ.get("SOC_PIRAMIDE_TTL_SEGUNDOS", "900")),
+    max_entradas=int(os.environ.get("SOC_PIRAMIDE_MAX_ENTRADAS", "200")),
+)
+
+
+def _reagrupar(base, minutos):
+    """Bins de N minutos a partir de los bins de 1 minuto (alineados a medianoche)"""
+    agregado = base.resample(f"{minutos}min", on="timestamp", origin="start_day").agg(
+        {"minSOC": "min", "sumSOC": "sum", "maxSOC": "max", "count": "sum"}
+    )
+    agregado = agregado[agregado["count"] > 0].reset_index()
+    return agregado
+
+
+def _bins_minuto(df_raw):
+    """Bins de 1 minuto (min, suma, max y número de muestras) de una serie en bruto"""
+    serie = df_raw[["evTime", "soc"]].dropna()
+    agrupado = serie.groupby(serie["evTime"].dt.floor("min"))["soc"]
+    return pd.DataFrame({
+        "minSOC": agrupado.min(),
+        "sumSOC": agrupado.sum().astype("float64"),
+        "maxSOC": agrupado.max(),
+        "count": agrupado.size().astype("int32"),
+    }).rename_axis("timestamp").reset_index()
+
+
+def construir_piramide(df_raw):
+    """Precalcular min/media/max/count del SOC para los tamaños de bin habituales.
+
+    Los bins de 1 minuto guardan la suma además de la media, así cualquier
+    tamaño entero de bin se obtiene combinándolos sin volver a la serie en bruto.
+    """
+    base = _bins_minuto(df_raw)
+
+    piramide = {1: base}
+    for minutos in NIVELES_PIRAMIDE:
+        if minutos != 1:
+            piramide[minutos] = _reagrupar(base, minutos)
+    return piramide
+
+
+def _combinar(bins):
+    """Juntar en una sola fila los bins que comparten timestamp"""
+    bins = bins.sort_values("timestamp", kind="stable")
+    t = bins["timestamp"].to_numpy(dtype="datetime64[ns]")
+    inicios = np.flatnonzero(np.r_[True, t[1:] != t[:-1]])
+    cuenta = bins["count"].to_numpy()
+    return pd.DataFrame({
+        "timestamp": bins["timestamp"].iloc[inicios].to_numpy(),
+        "minSOC": np.minimum.reduceat(bins["minSOC"].to_numpy(), inicios),
+        "sumSOC": np.add.reduceat(bins["sumSOC"].to_numpy(), inicios),
+        "maxSOC": np.maximum.reduceat(bins["maxSOC"].to_numpy(), inicios),
+        "count": np.add.reduceat(cuenta, inicios, dtype=cuenta.dtype),
+    })
+
+
+def actualizar_piramide(piramide, df_nuevos):
+    """Añadir a la pirámide muestras posteriores a las ya agrupadas.
+
+    Solo se rehacen los bins que tocan las muestras nuevas: en cada nivel
+    se combinan con ellas los bins desde el primero en el que caen. El
+    coste depende de las muestras nuevas y no de lo que lleva el día.
+    """
+    serie = df_nuevos[["evTime", "soc"]].dropna()
+    if serie.empty:
+        return piramide
+    soc = serie["soc"].to_numpy()
+    nuevos = pd.DataFrame({
+        "timestamp": serie["evTime"].dt.floor("min").to_numpy(),
+        "minSOC": soc,
+        "sumSOC": soc.astype("float64"),
+        "maxSOC": soc,
+        "count": np.ones(len(soc), dtype="int32"),
+    })
+
+    actualizada = {}
+    for minutos, bins in piramide.items():
+        claves = nuevos["timestamp"] if minutos == 1 else nuevos["timestamp"].dt.floor(f"{minutos}min")
+        corte = bins["timestamp"].searchsorted(claves.min())
+        tramo = _combinar(pd.concat([bins.iloc[corte:], nuevos.assign(timestamp=claves)], ignore_index=True))
+        actualizada[minutos] = pd.concat([bins.iloc[:corte], tramo], ignore_index=True)
+    return actualizada
+
+
+def bins_soc(piramide, minutos):
+    """Tabla timestamp/minSOC/avgSOC/maxSOC/count para un tamaño de bin"""
+    bins = piramide.get(minutos)
+    if bins is None:
+        bins = _reagrupar(piramide[1], minutos)
+    bins = bins.assign(avgSOC=bins["sumSOC"] / bins["count"])
+    return bins[["timestamp", "minSOC", "avgSOC", "maxSOC", "count"]]
+
+
+def obtener_piramide_soc(matricula, fecha, api_key):
+    """Descargar una vez la serie de SOC del día y devolver su pirámide de bins.
+
+    Lanza RequestException si la API falla. Devuelve None si no hay datos.
+    """
+    clave = (api_key, matricula, fecha)
+    piramide = _cache_piramides.get(clave)
+    if piramide is not None:
+        return piramide
+
+    df_raw = obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, fecha, api_key, normalizar_eficiencia)
+    if df_raw.empty:
+        return None
+    piramide = construir_piramide(df_raw)
+    # El día en curso se recalcula al caducar la caché en disco
+    ttl = None if cache_disco.es_inmutable(fecha) else cache_disco.TTL_HOY
+    _cache_piramides.set(clave, piramide, ttl)
+    return piramide
+
@@ -0,0 +1,235 @@
+# soc_eventos.py
+
+import os
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+import requests
+from utils import almacen, cache_disco
+from utils.api_client import api_get, decodificar_json
+from utils.concurrencia import ejecutar_lote
+from utils.flota import obtener_vehiculos
+from utils.muestras import instantes, ordenar_muestras
+from utils.normalizacion import normalizar_eficiencia, normalizar_low_soc
+from utils.rendimiento import medir
+from utils.telemetria import obtener_telemetria
+
+# SOC (%) por debajo del cual un vehículo debe volver a la cochera
+SOC_UMBRAL = float(os.environ.get("SOC_UMBRAL", "20"))
+# Puntos por encima del umbral que tiene que recuperar el SOC para cerrar un evento
+SOC_HISTERESIS = float(os.environ.get("SOC_HISTERESIS", "2"))
+# Histéresis más alta que se puede elegir en la vista
+SOC_HISTERESIS_MAX = 20.0
+# Eventos más cortos que esto (s) se descartan como ruido
+SOC_DURACION_MIN_SEGUNDOS = float(os.environ.get("SOC_DURACION_MIN_SEGUNDOS", "300"))
+# Umbral del endpoint vehiculoiot-low-soc: con umbrales iguales o menores sirve para preseleccionar vehículos
+SOC_UMBRAL_BACKEND = 20.0
+
+COLUMNAS_EVENTO = [
+    "matricula", "inicio", "fin", "duracion", "tiempo_bajo_umbral", "soc_min", "momento_soc_min", "muestras", "en_curso",
+]
+
+
+def _sin_eventos(zona="UTC"):
+    """Tabla de eventos vacía con los mismos tipos que una con datos"""
+    instante = pd.DatetimeTZDtype(tz=zona) if zona is not None else np.dtype("datetime64[ns]")
+    return pd.DataFrame({
+        "matricula": pd.Series(dtype=object),
+        "inicio": pd.Series(dtype=instante),
+        "fin": pd.Series(dtype=instante),
+        "duracion": pd.Series(dtype="timedelta64[ns]"),
+        "tiempo_bajo_umbral": pd.Series(dtype="timedelta64[ns]"),
+        "soc_min": pd.Series(dtype="float64"),
+        "momento_soc_min": pd.Series(dtype=instante),
+        "muestras": pd.Series(dtype="int64"),
+        "en_curso": pd.Series(dtype=bool),
+    })[COLUMNAS_EVENTO]
+
+
+def detectar_eventos(df, umbral=SOC_UMBRAL, histeresis=SOC_HISTERESIS, duracion_min=SOC_DURACION_MIN_SEGUNDOS):
+    """Eventos de SOC bajo de uno o varios vehículos en una sola pasada vectorizada.
+
+    df tiene evTime y soc y, para varios vehículos, matricula. Un evento
+    empieza cuando el SOC baja del umbral y termina cuando vuelve a
+    umbral + histeresis; entre medias el estado no cambia, así el ruido
+    alrededor del umbral no abre y cierra eventos. Los eventos de menos
+    de duracion_min segundos se descartan.
+
+    Cada evento acaba en la muestra en la que el SOC se recupera o, si no
+    llega a recuperarse, en la última muestra del vehículo (en_curso).
+    tiempo_bajo_umbral solo cuenta los intervalos con el SOC por debajo
+    del umbral, sin la banda de histéresis.
+    """
+    if df.empty:
+        return _sin_eventos()
+
+    df, vehiculo, matriculas, zona, t = ordenar_muestras(df, ["evTime", "soc"])
+    if df.empty:
+        return _sin_eventos()
+    soc = df["soc"].to_numpy(dtype="float64")
+    primera = np.r_[True, vehiculo[1:] != vehiculo[:-1]]
+    ultima = np.r_[primera[1:], True]
+
+    # Histéresis: 1 por debajo del umbral, 0 por encima de umbral + histéresis y, entre medias,
+    # lo mismo que la muestra anterior del vehículo (cada vehículo empieza fuera de evento)
+    senal = np.where(soc < umbral, 1, np.where(soc >= umbral + histeresis, 0, -1)).astype(np.int8)
+    senal[primera & (senal < 0)] = 0
+    definida = np.where(senal >= 0, np.arange(len(senal)), 0)
+    bajo = senal[np.maximum.accumulate(definida)] == 1
+
+    # Rachas de muestras en evento de cada vehículo
+    cambio = bajo != np.r_[False, bajo[:-1]]
+    cambio |= primera
+    inicios = np.flatnonzero(cambio & bajo)
+    if not len(inicios):
+        return _sin_eventos(zona)
+    fin_racha = np.flatnonzero(bajo & (ultima | ~np.r_[bajo[1:], False]))
+
+    # El evento termina en la muestra de recuperación; sin ella, sigue en curso
+    en_curso = ultima[fin_racha]
+    fin = t[np.where(en_curso, fin_racha, np.minimum(fin_racha + 1, len(t) - 1))]
+
+    # Cada muestra en evento se asigna a su evento para agregar por evento sin bucles
+    en_evento = np.flatnonzero(bajo)
+    evento = np.searchsorted(inicios, en_evento, side="right") - 1
+
+    # Segundos hasta la muestra siguiente del mismo vehículo, contados solo bajo el umbral
+    dt = np.zeros(len(t))
+    dt[:-1] = np.diff(t) / np.timedelta64(1, "s")
+    dt[ultima] = 0
+    segundos_bajo = np.where(soc[en_evento] < umbral, dt[en_evento], 0.0)
+    tiempo_bajo = np.bincount(evento, weights=segundos_bajo, minlength=len(inicios))
+
+    # Ordenando por (evento, soc) la primera muestra de cada evento es su mínimo
+    orden = np.lexsort((soc[en_evento], evento))
+    primera_del_evento = np.r_[True, evento[orden][1:] != evento[orden][:-1]]
+    posicion_min = en_evento[orden][primera_del_evento]
+
+    duracion = fin - t[inicios]
+    validos = duracion >= np.timedelta64(int(duracion_min * 1e9), "ns")
+
+    eventos = pd.DataFrame({
+        "matricula": matriculas[vehiculo[inicios]],
+        "inicio": instantes(t[inicios], zona),
+        "fin": instantes(fin, zona),
+        "duracion": pd.Series(duracion),
+        "tiempo_bajo_umbral": pd.to_timedelta(tiempo_bajo, unit="s"),
+        "soc_min": soc[posicion_min],
+        "momento_soc_min": instantes(t[posicion_min], zona),
+        "muestras": fin_racha - inicios + 1,
+        "en_curso": en_curso,
+    })
+    return eventos[validos].reset_index(drop=True)
+
+
+def series_soc_bajo(dias, api_key, umbral, al_avanzar, concurrencia):
+    """Series de SOC de los vehículos que bajan del umbral en esos días.
+
+    Devuelve (DataFrame con matricula, evTime y soc, lista de errores). Los
+    días ingestados salen del almacén local en una sola consulta. Del resto
+    se pide la telemetría de cada vehículo y día; si el umbral no supera el
+    de vehiculoiot-low-soc ese endpoint preselecciona los días de cada
+    vehículo (más el siguiente si el día acaba con un evento que puede
+    seguir abierto) y, si lo supera, se consulta toda la flota todos los
+    días.
+    """
+    frames = []
+    locales = almacen.dias_completos(dias)
+    if locales:
+        with medir("almacén SOC bajo"):
+            frames.append(almacen.soc_flota(locales, umbral))
+    locales = set(locales)
+    remotos = [dia for dia in dias if dia not in locales]
+
+    errores = []
+    if remotos and umbral <= SOC_UMBRAL_BACKEND:
+        # Solo los días en que cada vehículo baja del umbral según vehiculoiot-low-soc
+        pares = set()
+        al_avanzar(0, len(remotos))
+        for i, (dia, df, error) in enumerate(ejecutar_lote(lambda dia: fetch_low_soc_dia(dia, api_key), remotos, concurrencia), 1):
+            if isinstance(error, requests.exceptions.RequestException):
+                errores.append(f"{dia:%Y-%m-%d}: {error}")
+            elif error is not None:
+                raise error
+            else:
+                pares.update((matricula, dia) for matricula in df.loc[df["minSoc"] < umbral, "matricula"])
+            al_avanzar(i, len(remotos))
+        pares = sorted(pares)
+    else:
+        # Sin preselección hay que consultar toda la flota todos los días
+        matriculas = [veh["matricula"] for veh in obtener_vehiculos(api_key)] if remotos else []
+        pares = [(matricula, dia) for matricula in matriculas for dia in remotos]
+
+    def consultar(par):
+        df = obtener_telemetria("BI/vehiculoiot-eficiencia", *par, api_key, normalizar_eficiencia)
+        soc = df[["evTime", "soc"]].dropna().sort_values("evTime") if not df.empty else df
+        return soc if not soc.empty else None
+
+    def descargar(pares):
+        for i, (par, df, error) in enumerate(ejecutar_lote(consultar, pares, concurrencia), 1):
+            if isinstance(error, requests.exceptions.RequestException):
+                errores.append(f"{par[0]} {par[1]:%Y-%m-%d}: {error}")
+            elif error is not None:
+                raise error
+            elif df is not None:
+                remotas[par] = df
+            al_avanzar(i, len(pares))
+
+    # Un evento solo puede seguir abierto a medianoche si el día acaba sin recuperar umbral + la
+    # histéresis máxima: solo entonces se pide también el día siguiente para poder cerrarlo
+    remotas = {}
+    pendientes = set(remotos)
+    pedidos = set()
+    while pares:
+        descargar(pares)
+        pedidos.update(pares)
+        pares = sorted({
+            (matricula, dia + timedelta(days=1))
+            for matricula, dia in pares
+            if (matricula, dia) in remotas
+            and remotas[matricula, dia]["soc"].iloc[-1] < umbral + SOC_HISTERESIS_MAX
+            and dia + timedelta(days=1) in pendientes
+        } - pedidos)
+
+    if remotas:
+        df = pd.concat(remotas, names=["matricula", "dia"]).reset_index(level=[0, 1]).drop(columns="dia")
+        # Sin preselección llega toda la flota: solo se conservan los vehículos que bajan del umbral
+        frames.append(df[df.groupby("matricula")["soc"].transform("min") < umbral])
+
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return pd.DataFrame(columns=["matricula", "evTime", "soc"]), errores
+    # El almacén y la API pueden dar la hora con zonas equivalentes pero distintas (Etc/UTC y UTC)
+    df = pd.concat([df.astype({"matricula": str}).assign(evTime=pd.to_datetime(df["evTime"], utc=True)) for df in frames], ignore_index=True)
+    df["matricula"] = df["matricula"].astype("category")
+    return df.reset_index(drop=True), errores
+
+
+def fetch_low_soc_dia(dia, api_key: str):
+    """Consulta la API para obtener el SOC mínimo de los vehículos que bajan del 20% un día.
+
+    Cada día consultado se guarda en la caché en disco, así que al ampliar
+    el rango solo se piden los días nuevos. Lanza RequestException si falla.
+    """
+    df = cache_disco.leer("BI/vehiculoiot-low-soc", "flota", dia)
+    if df is not None:
+        return df
+
+    params = {
+        "fechaInicio": dia.strftime("%Y-%m-%d"),
+        "fechaFin": dia.strftime("%Y-%m-%d")
+    }
+
+    response = api_get("BI/vehiculoiot-low-soc", api_key, params=params)
+
+    # Verificamos si la respuesta es 404 (sin vehículos encontrados)
+    if response.status_code == 404:
+        datos = []  # No hay vehículos con SOC bajo ese día
+    else:
+        response.raise_for_status()  # Si hubo otro error, levantará una excepción
+        datos = decodificar_json(response.content)
+
+    # También se guardan los días sin registros: un día pasado vacío no va a cambiar
+    df = normalizar_low_soc(datos)
+    cache_disco.guardar("BI/vehiculoiot-low-soc", "flota", dia, df)
+    return df
@@ -1,9 +1,20 @@
+import os
 import streamlit as st
-import requests
 import pandas as pd
+from utils.exportacion import panel_exportacion
+from utils.rendimiento import medir
+from utils.resiliencia import hay_obsoletos
+from utils.resultados import guardar_resultado, obtener_resultado
+from utils.soc_eventos import (
+    SOC_DURACION_MIN_SEGUNDOS, SOC_HISTERESIS, SOC_HISTERESIS_MAX, SOC_UMBRAL, SOC_UMBRAL_BACKEND, detectar_eventos,
+    series_soc_bajo,
+)
+
+# Días que se consultan a la vez al buscar en rangos largos
+LOW_SOC_MAX_CONCURRENCIA = int(os.environ.get("LOW_SOC_MAX_CONCURRENCIA", "6"))
 
 def show_low_soc_view(default_date, api_key: str):
-    st.title("⚠️ Vehículos con SOC Bajo (<=20%)")
+    st.title("⚠️ Vehículos con SOC bajo")
 
     # Selección de fechas
     start_date = st.date_input("Fecha de inicio", value=default_date)
@@ -13,46 +24,81 @@ def show_low_soc_view(default_date, api_key: str):
         st.error("La fecha de inicio no puede ser posterior a la de fin.")
         return
 
-    if st.button("Buscar vehículos con SOC bajo"):
-        with st.spinner("Consultando registros con SOC <= 20%..."):
-            data = fetch_low_soc_data(start_date, end_date, api_key)
-
-        if data:
-            df = pd.DataFrame(data)
-            if df.empty:
-                st.success("✅ No hay registros de SOC bajo en el rango seleccionado.")
-            else:
-                st.warning(f"⚠️ Se encontraron {len(df)} registros con SOC bajo.")
-                df = df.sort_values("fecha")
-                st.dataframe(df[["fecha", "matricula", "minSoc"]])
-        else:
-            st.error("❌ Error al obtener los datos de la API o no se encontraron vehículos.")
-
-def fetch_low_soc_data(start_date, end_date, api_key: str):
-    """Consulta la API para obtener los registros donde SOC < 20%."""
-    url = "http://localhost:3000/plannerstats/BI/vehiculoiot-low-soc"  # Asegúrate de que esta ruta exista
-    headers = {
-        "x-api-key": api_key
-    }
-
-    params = {
-        "fechaInicio": start_date.strftime("%Y-%m-%d"),
-        "fechaFin": end_date.strftime("%Y-%m-%d")
-    }
-
-    try:
-        response = requests.get(url, headers=headers, params=params)
-
-        # Verificamos si la respuesta es 404 (sin vehículos encontrados)
-        if response.status_code == 404:
-            return []  # No hay vehículos con SOC bajo en ese rango
-
-        response.raise_for_status()  # Si hubo otro error, levantará una excepción
-        return response.json()
-
-    except requests.RequestException as e:
-        if response.status_code == 404:
-            st.info("✅ No se encontraron vehículos con SOC bajo en el rango de fechas especificado.")
-        else:
-            st.error(f"Error al llamar a la API: {e}")
-        return []
+    # La política de alerta se ajusta aquí, sin tocar el backend
+    with st.expander("⚙️ Política de alerta"):
+        col1, col2, col3 = st.columns(3)
+        umbral = col1.number_input("Umbral de SOC (%)", 1.0, 99.0, SOC_UMBRAL, step=1.0)
+        histeresis = col2.number_input("Histéresis (puntos)", 0.0, SOC_HISTERESIS_MAX, SOC_HISTERESIS, step=0.5,
+                                       help="El evento termina cuando el SOC vuelve a umbral + histéresis")
+        duracion_min = col3.number_input("Duración mínima (min)", 0.0, 240.0, SOC_DURACION_MIN_SEGUNDOS / 60, step=1.0,
+                                         help="Los eventos más cortos se descartan como ruido")
+        if umbral > SOC_UMBRAL_BACKEND:
+            st.caption(f"Con umbrales por encima del {SOC_UMBRAL_BACKEND:g}% hay que consultar todos los vehículos de la flota.")
+
+    politica = {"umbral": umbral, "histeresis": histeresis, "duracion_min": duracion_min * 60}
+    panel_exportacion("low_soc", end_date, api_key, rango=(start_date, end_date), opciones=politica)
+
+    if st.button("Buscar eventos de SOC bajo"):
+        st.session_state["low_soc_consulta"] = (start_date, end_date, umbral)
+
+    # La búsqueda se conserva en los reruns mientras no cambie el rango ni el umbral; la histéresis
+    # y la duración mínima se aplican en local sobre las series ya descargadas
+    if st.session_state.get("low_soc_consulta") != (start_date, end_date, umbral):
+        return
+
+    clave = ("low_soc", start_date, end_date, umbral)
+    series = obtener_resultado(clave)
+    errores = []
+    if series is None:
+        dias = list(pd.date_range(start_date, end_date).date)
+        progreso = st.progress(0.0, text=f"Buscando vehículos con SOC por debajo del {umbral:g}%...")
+
+        def al_avanzar(hechos, total):
+            progreso.progress(hechos / total if total else 1.0, text=f"Consultados {hechos} de {total}")
+
+        series, errores = series_soc_bajo(dias, api_key, umbral, al_avanzar, LOW_SOC_MAX_CONCURRENCIA)
+        progreso.empty()
+        # Con consultas fallidas o datos caducados no se guarda: el siguiente rerun vuelve a pedirlas
+        if not errores and not hay_obsoletos():
+            guardar_resultado(clave, series)
+
+    with medir("detección eventos SOC"):
+        eventos = detectar_eventos(series, politica["umbral"], politica["histeresis"], politica["duracion_min"])
+
+    if errores:
+        st.error(f"❌ Error al obtener los datos de la API en {len(errores)} consultas: " + "; ".join(errores[:5]))
+
+    if eventos.empty:
+        if not errores:
+            st.success(f"✅ Ningún vehículo bajó del {umbral:g}% de SOC en el rango seleccionado.")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Eventos", len(eventos))
+    col2.metric("Vehículos afectados", eventos["matricula"].nunique())
+    col3.metric("Horas bajo el umbral", f"{eventos['tiempo_bajo_umbral'].sum().total_seconds() / 3600:.1f}")
+    col4.metric("SOC mínimo", f"{eventos['soc_min'].min():.1f}%")
+
+    en_curso = int(eventos["en_curso"].sum())
+    if en_curso:
+        st.warning(f"🚨 {en_curso} vehículos siguen por debajo del umbral al final del rango y deben regresar a la cochera.")
+
+    tabla = eventos.assign(
+        duracion=eventos["duracion"].dt.total_seconds() / 60,
+        tiempo_bajo_umbral=eventos["tiempo_bajo_umbral"].dt.total_seconds() / 60,
+    )
+    st.dataframe(
+        tabla,
+        hide_index=True,
+        column_config={
+            "matricula": st.column_config.TextColumn("Matrícula"),
+            "inicio": st.column_config.DatetimeColumn("Inicio", format="YYYY-MM-DD HH:mm"),
+            "fin": st.column_config.DatetimeColumn("Fin", format="YYYY-MM-DD HH:mm"),
+            "duracion": st.column_config.NumberColumn("Duración (min)", format="%.0f"),
+            "tiempo_bajo_umbral": st.column_config.NumberColumn("Bajo el umbral (min)", format="%.0f"),
+            "soc_min": st.column_config.NumberColumn("SOC mínimo (%)", format="%.1f"),
+            "momento_soc_min": st.column_config.DatetimeColumn("Momento del mínimo", format="YYYY-MM-DD HH:mm"),
+            "muestras": st.column_config.NumberColumn("Muestras"),
+            "en_curso": st.column_config.CheckboxColumn("En curso"),
+        },
+    )
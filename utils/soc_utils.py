@@ -1,199 +1,174 @@
 import streamlit as st
 import requests
 import pandas as pd
-import plotly.graph_objects as go
-from datetime import datetime, timedelta
-
-def obtener_vehiculos(api_key):
-    """Obtener los vehículos desde la API"""
-    base_url = "http://localhost:3000/plannerstats/vehiculos"
-    headers = {
-        "x-api-key": api_key
-    }
-
-    response = requests.get(base_url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        st.error(f"Error al obtener los vehículos: {response.status_code}")
-        return []
+from datetime import date, datetime, timedelta
+from utils.busqueda import selector_vehiculo
+from utils.concurrencia import lanzar_consultas
+from utils.en_vivo import INTERVALO_EN_VIVO, actualizar_en_vivo, figura_en_vivo
+from utils.exportacion import panel_exportacion
+from utils.estado_timeline import duraciones_por_estado, figura_timeline, timeline_estados
+from utils.flota import obtener_flota
+from utils.graficos import actualizar_figura_soc, figura_soc
+from utils.normalizacion import normalizar_estado
+from utils.precarga import dias_vecinos, precargar
+from utils.rendimiento import medir
+from utils.resiliencia import esperar, hay_obsoletos
+from utils.resultados import figura_memo, guardar_resultado, obtener_resultado
+from utils.soc_bins import actualizar_piramide, bins_soc, construir_piramide, obtener_piramide_soc
+from utils.soc_eventos import SOC_UMBRAL
+from utils.telemetria import obtener_telemetria
 
 def show_soc_analysis(fecha_default, api_key):
     st.title("🔋 Evolución del SOC por Vehículo")
 
-    # Obtener vehículos desde la API
-    vehiculos = obtener_vehiculos(api_key)
+    # Obtener vehículos desde la API (cacheados con TTL)
+    flota = obtener_flota(api_key)
+    vehiculos = flota["vehiculos"]
     
     if not vehiculos:
         st.warning("No se encontraron vehículos.")
         return
     
-    # Extraer matrículas y permitir al usuario buscar
-    matriculas = [vehiculo["matricula"] for vehiculo in vehiculos]
-    
-    # Añadir campo de texto para búsqueda
-    search_text = st.text_input("Buscar matrícula", "")
-    
-    # Filtrar las matrículas basadas en la entrada del usuario
-    matriculas_filtradas = [matricula for matricula in matriculas if search_text.lower() in matricula.lower()]
-    
-    if not matriculas_filtradas:
-        st.warning("No se encontraron vehículos con ese texto.")
+    # Buscar por texto y atributos; el selectbox solo recibe los mejores resultados
+    matricula = selector_vehiculo(flota, "Selecciona la matrícula del vehículo")
+    if matricula is None:
         return
-    
-    # Mostrar un selectbox con las matrículas filtradas
-    matricula = st.selectbox("Selecciona la matrícula del vehículo", matriculas_filtradas)
 
     # Obtener los datos para la matrícula seleccionada
-    vehiculo = next(veh for veh in vehiculos if veh["matricula"] == matricula)
+    vehiculo = flota["indice"][matricula]
     fecha = st.date_input("Fecha", fecha_default)
     bin_size = st.number_input("Tamaño del bin (min)", min_value=1, max_value=60, value=5)
-    # Reemplaza la parte dentro del if st.button("Consultar SOC"): por esto:
-    if st.button("Consultar SOC"):
-        base_url = "http://localhost:3000/plannerstats/BI/vehiculoiot-socbin"
-        params = {
-            "fecha": fecha.strftime("%Y-%m-%d"),
-            "matricula": matricula,
-            "bin": str(bin_size)
-        }
-
-        headers = {
-            "x-api-key": api_key
-        }
-
-        with st.spinner("Obteniendo datos..."):
-            response = requests.get(base_url, params=params, headers=headers)
-
-        if response.status_code == 200:
-            data = response.json()
-
-            if data:
-                df = pd.DataFrame(data)
-                df["timestamp"] = pd.to_datetime(df["_id"].apply(lambda x: x["interval"]))
-                df = df.sort_values("timestamp")
-
-                low_soc_mask = df['avgSOC'] < 20
-                low_soc_points = df[low_soc_mask]
-
-                fig_soc = go.Figure()
-                fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["avgSOC"], mode="lines", name="SOC promedio", line=dict(color="blue")))
-                fig_soc.add_trace(go.Scatter(x=low_soc_points["timestamp"], y=low_soc_points["avgSOC"], mode="markers", name="SOC bajo (bajo 20%)", marker=dict(color="red", size=10, symbol="x")))
-                fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["maxSOC"], mode="lines", name="SOC máximo", line=dict(width=0), showlegend=False))
-                fig_soc.add_trace(go.Scatter(x=df["timestamp"], y=df["minSOC"], mode="lines", name="SOC mínimo", fill='tonexty', fillcolor='rgba(0,100,80,0.2)', line=dict(width=0), showlegend=False))
-
-                fig_soc.update_layout(
-                    title="SOC durante el día",
-                    xaxis_title="Hora",
-                    yaxis_title="SOC (%)",
-                    height=500,
-                    hovermode="x unified"
-                )
+    panel_exportacion("soc", fecha, api_key, matricula)
 
-                # Diseño de columnas
-                col1, col2 = st.columns([2, 1])  # Columna izquierda 2 veces más grande que la derecha
+    # El modo en vivo solo tiene sentido para el día en curso
+    if fecha == date.today() and st.toggle("🔴 En vivo (actualización automática)", key="soc_en_vivo"):
+        _panel_en_vivo_soc(matricula, fecha, api_key, bin_size)
+        return
 
-                with col1:
+    if st.button("Consultar SOC"):
+        st.session_state["soc_consulta"] = (matricula, fecha)
+
+    # La consulta sigue activa al cambiar el tamaño del bin: los bins se calculan en local
+    if st.session_state.get("soc_consulta") == (matricula, fecha):
+        # Los datos ya descargados en esta sesión se reutilizan en cada rerun
+        clave = ("soc", matricula, fecha)
+        resultado = obtener_resultado(clave) or {}
+        consultas = {}
+        if "piramide" not in resultado:
+            # El estado del vehículo se pide a la vez que la serie de SOC
+            consultas = lanzar_consultas({
+                "soc": lambda: obtener_piramide_soc(matricula, fecha, api_key),
+                "estado": lambda: obtener_telemetria("BI/vehiculoiot-status", matricula, fecha, api_key, normalizar_estado),
+            })
+
+            with st.spinner("Obteniendo datos..."):
+                try:
+                    resultado = {"piramide": esperar(consultas["soc"])}
+                except requests.exceptions.RequestException as e:
+                    st.error(f"Error al consultar la API: {e}")
+                    return
+
+        piramide = resultado["piramide"]
+        if piramide is not None:
+            with medir("bins SOC"):
+                df = bins_soc(piramide, bin_size)
+            low_soc_points = df[df['avgSOC'] < SOC_UMBRAL]
+
+            with medir("construir gráfico SOC"):
+                fig_soc = figura_memo("soc", lambda: figura_soc(df), df)
+
+            # Diseño de columnas
+            col1, col2 = st.columns([2, 1])  # Columna izquierda 2 veces más grande que la derecha
+
+            with col1:
+                with medir("enviar gráfico SOC"):
                     st.plotly_chart(fig_soc, use_container_width=True)
-                    if not low_soc_points.empty:
-                        st.warning("🚨 ¡Alerta! El vehículo está por debajo del 20% de SOC y debe regresar a la cochera.")
-
-                with col2:
-                    # Mostrar las gráficas de estado dentro de la segunda columna
-                    show_vehicle_status(matricula, fecha, api_key)
-
-                st.subheader("📋 Tabla de datos SOC")
-                st.dataframe(df[["timestamp", "minSOC", "avgSOC", "maxSOC", "count"]])
-            else:
-                st.warning("No se encontraron datos.")
+                if not low_soc_points.empty:
+                    st.warning(f"🚨 ¡Alerta! El vehículo está por debajo del {SOC_UMBRAL:g}% de SOC y debe regresar a la cochera.")
+
+            with col2:
+                # Mostrar las gráficas de estado dentro de la segunda columna
+                if "estado" not in resultado:
+                    if "estado" not in consultas:
+                        consultas = lanzar_consultas({
+                            "estado": lambda: obtener_telemetria("BI/vehiculoiot-status", matricula, fecha, api_key, normalizar_estado),
+                        })
+                    with st.spinner("Obteniendo estado del vehículo..."):
+                        try:
+                            resultado["estado"] = esperar(consultas["estado"])
+                        except requests.exceptions.RequestException as e:
+                            st.error(f"Error al obtener el estado del vehículo: {e}")
+                with medir("gráficos estado"):
+                    show_vehicle_status(resultado.get("estado", pd.DataFrame()))
+
+            # Con datos caducados no se guarda: el siguiente rerun recoge los actualizados
+            if not hay_obsoletos():
+                guardar_resultado(clave, resultado)
+
+            st.subheader("📋 Tabla de datos SOC")
+            st.dataframe(df[["timestamp", "minSOC", "avgSOC", "maxSOC", "count"]])
+
+            # Los días vecinos del mismo vehículo se preparan mientras se mira este
+            tareas = {}
+            for dia in dias_vecinos(fecha):
+                tareas[("piramide", api_key, matricula, dia)] = lambda dia=dia: obtener_piramide_soc(matricula, dia, api_key)
+                tareas[("estado", api_key, matricula, dia)] = (
+                    lambda dia=dia: obtener_telemetria("BI/vehiculoiot-status", matricula, dia, api_key, normalizar_estado)
+                )
+            precargar(tareas)
         else:
-            st.error(f"Error al consultar la API: {response.status_code}")
-
-def show_vehicle_status(matricula, fecha, api_key):
-    """Mostrar gráficas del estado de un vehículo"""
-    base_url = f"http://localhost:3000/plannerstats/BI/vehiculoiot-status"
-    params = {
-        "fecha": fecha.strftime("%Y-%m-%d"),
-        "matricula": matricula
-    }
-
-    headers = {
-        "x-api-key": api_key
-    }
-
-    with st.spinner("Obteniendo estado del vehículo..."):
-        response = requests.get(base_url, params=params, headers=headers)
-
-    if response.status_code == 200:
-        data = response.json()
-
-        if data:
-            df_status = pd.DataFrame(data)
-            df_status["evTime"] = pd.to_datetime(df_status["evTime"])
-
-            gbStatus_map = {"Start": 1, "Stop": 2}
-            gbCharge_map = {"Exceptions": 1, "Charging": 2, "Complete": 3, "Not in Charging": 4}
-            evStatus_map = {"Charging": 1, "Parking": 2, "Driving": 3}
-
-            df_status["gbStatus_num"] = df_status["gbStatus"].map(gbStatus_map)
-            df_status["gbCharge_num"] = df_status["gbCharge"].map(gbCharge_map)
-            df_status["evStatus_num"] = df_status["evStatus"].map(evStatus_map)
-
-            # gbStatus
-            fig_status = go.Figure()
-            fig_status.add_trace(go.Scatter(
-                x=df_status["evTime"],
-                y=df_status["gbStatus_num"],
-                mode="markers+lines",
-                name="gbStatus",
-                marker=dict(color="blue", size=8)
-            ))
-            fig_status.update_layout(
-                title="gbStatus",
-                xaxis_title="Hora",
-                yaxis=dict(tickvals=[1, 2], ticktext=["Start", "Stop"]),
-                height=250,
-                showlegend=False,
-                margin=dict(t=30),
-                hovermode="x unified"
-            )
-            st.plotly_chart(fig_status, use_container_width=True)
-
-            # gbCharge
-            fig_charge = go.Figure()
-            fig_charge.add_trace(go.Scatter(
-                x=df_status["evTime"],
-                y=df_status["gbCharge_num"],
-                mode="markers+lines",
-                name="gbCharge",
-                marker=dict(color="green", size=8)
-            ))
-            fig_charge.update_layout(
-                title="gbCharge",
-                xaxis_title="Hora",
-                yaxis=dict(tickvals=[1, 2, 3, 4], ticktext=["Exceptions", "Charging", "Complete", "Not in Charging"]),
-                height=250,
-                showlegend=False,
-                margin=dict(t=30),
-                hovermode="x unified"
-            )
-            st.plotly_chart(fig_charge, use_container_width=True)
-
-            # evStatus
-            fig_evstatus = go.Figure()
-            fig_evstatus.add_trace(go.Scatter(
-                x=df_status["evTime"],
-                y=df_status["evStatus_num"],
-                mode="markers+lines",
-                name="evStatus",
-                marker=dict(color="orange", size=8)
-            ))
-            fig_evstatus.update_layout(
-                title="evStatus",
-                xaxis_title="Hora",
-                yaxis=dict(tickvals=[1, 2, 3], ticktext=["Charging", "Parking", "Driving"]),
-                height=250,
-                showlegend=False,
-                margin=dict(t=30),
-                hovermode="x unified"
-            )
-            st.plotly_chart(fig_evstatus, use_container_width=True)
+            guardar_resultado(clave, resultado)
+            st.warning("No se encontraron datos.")
+
+@st.fragment(run_every=INTERVALO_EN_VIVO)
+def _panel_en_vivo_soc(matricula, fecha, api_key, bin_size):
+    """Parte de la página que se refresca sola; el resto del script no se vuelve a ejecutar"""
+    try:
+        nuevas, estado = actualizar_en_vivo(matricula, fecha, api_key, "soc")
+    except requests.exceptions.RequestException as e:
+        st.warning(f"No se pudo actualizar: {e}")
+        return
+    if estado["ultimo"] is None:
+        st.warning("Todavía no hay datos de hoy.")
+        return
+
+    # La pirámide se conserva en la sesión y solo se le añaden las filas llegadas desde el último refresco
+    if "piramide" not in estado:
+        estado["piramide"] = construir_piramide(nuevas)
+    elif not nuevas.empty:
+        estado["piramide"] = actualizar_piramide(estado["piramide"], nuevas)
+    df = bins_soc(estado["piramide"], bin_size)
+    if df.empty:
+        st.warning("Todavía no hay datos de SOC de hoy.")
+        return
+    fig_soc = figura_en_vivo(matricula, fecha, "soc", lambda: figura_soc(df), lambda fig: actualizar_figura_soc(fig, df))
+    st.caption(f"Última muestra: {estado['ultimo']:%H:%M:%S} · {len(nuevas)} registros nuevos")
+    st.plotly_chart(fig_soc, use_container_width=True, key="soc_en_vivo_grafico")
+    if df["avgSOC"].iloc[-1] < SOC_UMBRAL:
+        st.warning(f"🚨 ¡Alerta! El vehículo está por debajo del {SOC_UMBRAL:g}% de SOC y debe regresar a la cochera.")
+
+def show_vehicle_status(df_status):
+    """Mostrar la línea de tiempo de los estados de un vehículo"""
+    if not df_status.empty:
+        timeline = timeline_estados(df_status)
+        if timeline.empty:
+            st.warning("No hay estados para mostrar.")
+            return
+
+        st.plotly_chart(figura_memo("timeline estados", lambda: figura_timeline(timeline), timeline), use_container_width=True)
+
+        # Tiempo total en cada estado
+        duraciones = duraciones_por_estado(timeline)
+        evstatus = duraciones[duraciones["senal"] == "evStatus"].set_index("estado")["duracion"]
+        col1, col2 = st.columns(2)
+        col1.metric("Tiempo cargando", _formatear_duracion(evstatus.get("Charging")))
+        col2.metric("Tiempo conduciendo", _formatear_duracion(evstatus.get("Driving")))
+
+        duraciones["horas"] = (duraciones["duracion"].dt.total_seconds() / 3600).round(2)
+        st.dataframe(duraciones[["senal", "estado", "horas"]], hide_index=True)
+
+def _formatear_duracion(duracion):
+    if duracion is None or pd.isna(duracion):
+        return "0h 00m"
+    minutos = int(duracion.total_seconds() // 60)
+    return f"{minutos // 60}h {minutos % 60:02d}m"
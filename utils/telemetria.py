@@ -0,0 +1,62 @@
+# telemetria.py
+
+import time
+import pandas as pd
+import requests
+from utils import almacen, cache_disco
+from utils.api_client import api_get_registros
+from utils.rendimiento import medir
+from utils.resiliencia import OBSOLETO_MAX_SEGUNDOS, marcar_obsoleto, revalidar
+
+
+def obtener_telemetria(endpoint, matricula, fecha, api_key, normalizar, **params):
+    """Obtener la telemetría normalizada de un vehículo y día.
+
+    Se sirve desde la caché en disco si está disponible; si no, se consulta
+    la API y se guarda el resultado. Los días ya ingestados se leen del
+    almacén local. Del día en curso se sirve la copia caducada mientras se
+    actualiza en segundo plano. Lanza RequestException si la API falla y
+    no hay ninguna copia.
+    """
+    if endpoint in almacen.ENDPOINTS and not params:
+        with medir(f"almacén {endpoint}"):
+            df = almacen.leer_dia(almacen.ENDPOINTS[endpoint], matricula, fecha)
+        if df is not None:
+            return df
+
+    with medir(f"caché disco {endpoint}"):
+        df = cache_disco.leer(endpoint, matricula, fecha, params)
+    if df is not None:
+        return df
+
+    # Una copia caducada reciente del día en curso se sirve al momento; una antigua, o la parcial
+    # de un día que ya ha terminado, solo si el backend falla
+    obsoleto = cache_disco.leer_obsoleto(endpoint, matricula, fecha, params)
+    descargar = lambda: _descargar(endpoint, matricula, fecha, api_key, normalizar, params)
+    if obsoleto is None:
+        return descargar()
+    df, guardado = obsoleto
+    descripcion = f"{almacen.ENDPOINTS.get(endpoint, endpoint)} de {matricula}"
+    if not cache_disco.es_inmutable(fecha) and time.time() - guardado - cache_disco.TTL_HOY <= OBSOLETO_MAX_SEGUNDOS:
+        revalidar(("telemetria", endpoint, matricula, fecha, tuple(sorted(params.items()))), descargar)
+        marcar_obsoleto(descripcion, guardado)
+        return df
+    try:
+        return descargar()
+    except requests.exceptions.RequestException:
+        marcar_obsoleto(descripcion, guardado)
+        return df
+
+
+def _descargar(endpoint, matricula, fecha, api_key, normalizar, params):
+    consulta = {"fecha": fecha.strftime("%Y-%m-%d"), "matricula": matricula}
+    consulta.update({k: str(v) for k, v in params.items()})
+    # Los registros se leen en streaming y se compactan por bloques según llegan
+    with medir(f"descarga y dataframe {endpoint}") as registro:
+        df = normalizar(api_get_registros(endpoint, api_key, params=consulta))
+        registro["filas"] = len(df)
+    if df.empty:
+        return pd.DataFrame()
+
+    cache_disco.guardar(endpoint, matricula, fecha, df, params)
+    return df
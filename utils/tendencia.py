@@ -0,0 +1,234 @@
+# tendencia.py
+
+import os
+import threading
+from datetime import date, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import requests
+import streamlit as st
+from plotly.subplots import make_subplots
+from utils import almacen
+from utils.concurrencia import ejecutar_lote
+from utils.normalizacion import normalizar_eficiencia
+from utils.rendimiento import medir
+from utils.resiliencia import hay_obsoletos
+from utils.resultados import figura_memo, guardar_resultado, obtener_resultado
+from utils.telemetria import obtener_telemetria
+
+# Fichero con un resumen por vehículo y día; es lo único que se guarda de la telemetría de la tendencia
+AGREGADOS_RUTA = Path(os.environ.get("AGREGADOS_RUTA", ".cache/agregados/diarios.parquet"))
+# Días que se descargan a la vez al completar una tendencia
+TENDENCIA_MAX_CONCURRENCIA = int(os.environ.get("TENDENCIA_MAX_CONCURRENCIA", "6"))
+# Temperatura exterior (ºC) a la que se refiere el consumo ajustado
+TEMP_REFERENCIA = float(os.environ.get("TENDENCIA_TEMP_REFERENCIA", "20"))
+
+COLUMNAS_AGREGADO = [
+    "matricula", "fecha", "distancia_km", "consumo_medio", "kwh_100km",
+    "temp_exterior", "temp_interior", "soc_inicial", "muestras",
+]
+
+_agregados = None
+_lock = threading.Lock()
+
+
+def agregado_dia(df):
+    """Resumen de un día de telemetría de eficiencia (misma fórmula que la vista diaria)"""
+    if df.empty:
+        return {"distancia_km": np.nan, "consumo_medio": np.nan, "kwh_100km": np.nan,
+                "temp_exterior": np.nan, "temp_interior": np.nan, "soc_inicial": np.nan, "muestras": 0}
+    distancia = float(df["mileage"].max() - df["mileage"].min())
+    consumo = float(df["energyConsumption_ave"].mean())
+    return {
+        "distancia_km": distancia,
+        "consumo_medio": consumo,
+        "kwh_100km": consumo / distancia * 100 if distancia > 0 else np.nan,
+        "temp_exterior": float(df["outsideTemp"].mean()),
+        "temp_interior": float(df["insideTemp"].mean()),
+        "soc_inicial": float(df["soc"].iloc[0]),
+        "muestras": len(df),
+    }
+
+
+def _cargar():
+    global _agregados
+    if _agregados is None:
+        try:
+            _agregados = pd.read_parquet(AGREGADOS_RUTA)
+        except (OSError, ValueError):
+            _agregados = pd.DataFrame(columns=COLUMNAS_AGREGADO)
+    return _agregados
+
+
+def leer_agregados(matricula=None, dias=None):
+    """Agregados guardados, opcionalmente de un vehículo y unos días"""
+    with _lock:
+        df = _cargar()
+    if matricula is not None:
+        df = df[df["matricula"] == matricula]
+    if dias is not None:
+        df = df[df["fecha"].isin(dias)]
+    return df
+
+
+def guardar_agregados(filas):
+    """Añadir o sustituir agregados (matrícula, fecha) y reescribir el fichero"""
+    global _agregados
+    if not len(filas):
+        return
+    nuevos = pd.DataFrame(filas, columns=COLUMNAS_AGREGADO)
+    with _lock:
+        df = pd.concat([_cargar(), nuevos], ignore_index=True) if len(_cargar()) else nuevos
+        df = df.drop_duplicates(["matricula", "fecha"], keep="last").reset_index(drop=True)
+        _agregados = df
+        try:
+            AGREGADOS_RUTA.parent.mkdir(parents=True, exist_ok=True)
+            tmp = AGREGADOS_RUTA.with_suffix(f".{os.getpid()}.tmp")
+            df.to_parquet(tmp, index=False)
+            os.replace(tmp, AGREGADOS_RUTA)
+        except OSError:
+            pass
+
+
+def completar_agregados(matricula, dias, api_key, al_avanzar=None):
+    """Calcular los agregados que faltan para un vehículo y devolver los días que fallaron.
+
+    Solo se descargan los días sin agregado. Los días ingestados en el
+    almacén se resumen antes, para toda la flota, con una sola consulta. El
+    día en curso no se guarda porque todavía cambia, ni nada calculado con
+    datos caducados.
+    """
+    hechos = set(leer_agregados(matricula, dias)["fecha"])
+    faltan = [dia for dia in dias if dia not in hechos]
+
+    locales = almacen.dias_completos(faltan)
+    if locales:
+        with medir("agregados almacén", dias=len(locales)):
+            flota = almacen.agregados_eficiencia(locales)
+        if not flota.empty:
+            guardar_agregados(flota[COLUMNAS_AGREGADO].to_dict("records"))
+        hechos = set(leer_agregados(matricula, dias)["fecha"])
+        faltan = [dia for dia in faltan if dia not in hechos]
+
+    def resumir(dia):
+        df = obtener_telemetria("BI/vehiculoiot-eficiencia", matricula, dia, api_key, normalizar_eficiencia)
+        return {"matricula": matricula, "fecha": dia, **agregado_dia(df)}
+
+    filas, errores = [], []
+    for i, (dia, fila, error) in enumerate(ejecutar_lote(resumir, faltan, TENDENCIA_MAX_CONCURRENCIA), 1):
+        if isinstance(error, requests.exceptions.RequestException):
+            errores.append(dia)
+        elif error is not None:
+            raise error
+        else:
+            filas.append(fila)
+        if al_avanzar:
+            al_avanzar(i, len(faltan))
+
+    # Con datos caducados (p. ej. la copia parcial de un día que ya terminó) no se guarda ningún agregado
+    guardar = not hay_obsoletos()
+    guardar_agregados([fila for fila in filas if guardar and fila["fecha"] < date.today()])
+    sin_guardar = pd.DataFrame([fila for fila in filas if not guardar or fila["fecha"] >= date.today()], columns=COLUMNAS_AGREGADO)
+    serie = leer_agregados(matricula, dias)
+    return (pd.concat([serie, sin_guardar], ignore_index=True) if len(sin_guardar) else serie), errores
+
+
+def pendiente_temperatura(agregados):
+    """kWh/100km adicionales por grado de diferencia con TEMP_REFERENCIA (mínimos cuadrados)"""
+    validos = agregados.dropna(subset=["kwh_100km", "temp_exterior"])
+    if len(validos) < 3:
+        return 0.0
+    x = (validos["temp_exterior"] - TEMP_REFERENCIA).abs().to_numpy(dtype="float64")
+    if np.ptp(x) == 0:
+        return 0.0
+    return float(np.polyfit(x, validos["kwh_100km"].to_numpy(dtype="float64"), 1)[0])
+
+
+def calcular_tendencia(serie, flota, ventana):
+    """Serie diaria del vehículo con medias móviles, consumo ajustado y banda de la flota"""
+    pendiente = pendiente_temperatura(flota if len(flota) else serie)
+    serie = serie.sort_values("fecha").set_index("fecha")
+    serie["kwh_ajustado"] = serie["kwh_100km"] - pendiente * (serie["temp_exterior"] - TEMP_REFERENCIA).abs()
+    for columna in ("kwh_100km", "kwh_ajustado", "distancia_km"):
+        serie[f"{columna}_media"] = serie[columna].rolling(ventana, min_periods=1).mean()
+
+    banda = flota.groupby("fecha")["kwh_100km"].quantile([0.1, 0.5, 0.9]).unstack()
+    banda.columns = ["flota_p10", "flota_p50", "flota_p90"]
+    return serie.join(banda).reset_index(), pendiente
+
+
+def figura_tendencia(tendencia, ventana):
+    """kWh/100km con la banda p10-p90 de la flota, consumo ajustado y distancia"""
+    fig = make_subplots(
+        rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.06,
+        subplot_titles=["kWh/100km", f"kWh/100km ajustado a {TEMP_REFERENCIA:g} ºC", "Distancia (km)"],
+    )
+    x = tendencia["fecha"]
+    fig.add_trace(go.Scatter(x=x, y=tendencia["flota_p90"], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["flota_p10"], mode="lines", line=dict(width=0), fill="tonexty",
+                             fillcolor="rgba(120,120,120,0.2)", name="Flota p10-p90"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["flota_p50"], mode="lines", line=dict(color="grey", dash="dot"), name="Mediana flota"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["kwh_100km"], mode="markers", marker=dict(color="blue", size=5), name="Diario"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["kwh_100km_media"], mode="lines", line=dict(color="blue"), name=f"Media {ventana} días"), row=1, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["kwh_ajustado"], mode="markers", marker=dict(color="darkorange", size=5), showlegend=False), row=2, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["kwh_ajustado_media"], mode="lines", line=dict(color="darkorange"), name="Ajustado (media)"), row=2, col=1)
+    fig.add_trace(go.Bar(x=x, y=tendencia["distancia_km"], marker_color="lightblue", showlegend=False), row=3, col=1)
+    fig.add_trace(go.Scatter(x=x, y=tendencia["distancia_km_media"], mode="lines", line=dict(color="steelblue"), showlegend=False), row=3, col=1)
+    fig.update_layout(height=850, hovermode="x unified")
+    return fig
+
+
+def show_tendencia_eficiencia(matricula, fecha_default, api_key):
+    """Modo tendencia de la vista de eficiencia: varios días de un vehículo"""
+    col1, col2, col3 = st.columns(3)
+    desde = col1.date_input("Desde", fecha_default - timedelta(days=29))
+    hasta = col2.date_input("Hasta", fecha_default)
+    ventana = col3.number_input("Media móvil (días)", min_value=1, max_value=60, value=7)
+
+    if desde > hasta:
+        st.error("La fecha de inicio no puede ser posterior a la de fin.")
+        return
+
+    if st.button("Calcular tendencia"):
+        st.session_state["tendencia_consulta"] = (matricula, desde, hasta)
+
+    if st.session_state.get("tendencia_consulta") != (matricula, desde, hasta):
+        return
+
+    clave = ("tendencia", matricula, desde, hasta)
+    serie = obtener_resultado(clave)
+    if serie is None:
+        dias = list(pd.date_range(desde, hasta).date)
+        progreso = st.progress(0.0, text="Calculando los días que faltan...")
+        serie, errores = completar_agregados(
+            matricula, dias, api_key,
+            lambda i, n: progreso.progress(i / n, text=f"Descargados {i} de {n} días nuevos"),
+        )
+        progreso.empty()
+        if errores:
+            st.error(f"❌ No se pudieron consultar {len(errores)} días: "
+                     + ", ".join(dia.strftime("%Y-%m-%d") for dia in sorted(errores)))
+        elif not hay_obsoletos():
+            guardar_resultado(clave, serie)
+
+    serie = serie[serie["muestras"] > 0]
+    if serie.empty:
+        st.warning("No hay datos del vehículo en ese rango.")
+        return
+
+    flota = leer_agregados(dias=list(serie["fecha"]))
+    flota = flota[flota["muestras"] > 0]
+    with medir("tendencia eficiencia"):
+        tendencia, pendiente = calcular_tendencia(serie, flota, ventana)
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Días con datos", len(tendencia))
+    col2.metric(f"kWh/100km (media {ventana} días)", f"{tendencia['kwh_100km_media'].iloc[-1]:.2f}")
+    col3.metric("Distancia total (km)", f"{tendencia['distancia_km'].sum():.0f}")
+    st.caption(f"Ajuste por temperatura: {pendiente:+.3f} kWh/100km por grado de diferencia con {TEMP_REFERENCIA:g} ºC. "
+               f"La banda de la flota usa los {flota['matricula'].nunique()} vehículos con agregados esos días.")
+
+    fig = figura_memo("tendencia", lambda: figura_tendencia(tendencia, ventana), tendencia, ventana)
+    st.plotly_chart(fig, use_container_width=True)